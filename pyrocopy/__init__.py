@@ -1,8 +1,8 @@
 import sys
 import argparse
 import logging
-# from . import pyrocopy
-import pyrocopy
+import signal
+from . import pyrocopy
 
 def main():
     parser = argparse.ArgumentParser(description='A robust file copying utility.')
@@ -19,6 +19,21 @@ def main():
     copy_group = parser.add_argument_group('copy options')
     copy_group.add_argument("-f", "--force", action='store_true', required=False, help="Overwrites all files in destination from source even if newer.")
     copy_group.add_argument("--nostat", action='store_true', required=False, help="Do not copy file stats (mode bits, atime, mtime, flags)")
+    copy_group.add_argument("--threads", type=int, default=1, required=False, help="The number of threads used to copy files in parallel.")
+    copy_group.add_argument("--clone", choices=pyrocopy.CLONE_MODES, default='auto', required=False, help="Controls copy-on-write cloning of file contents: auto clones when possible, always fails files that can't be cloned, never always copies the data.")
+    copy_group.add_argument("--compare", choices=pyrocopy.COMPARE_MODES, default='mtime', required=False, help="Controls how existing files are found to be up to date: mtime compares modification times, size+mtime also compares sizes, hash compares file contents.")
+    copy_group.add_argument("--delta", type=int, default=None, required=False, metavar="SIZE", help="Updates existing destination files of at least SIZE bytes in place, rewriting only the blocks that changed. The whole destination is read to compare it, so on network filesystems this only pays off when few blocks changed.")
+    copy_group.add_argument("--resume", type=int, default=None, required=False, metavar="SIZE", help="Copies files of at least SIZE bytes through a checkpointed partial file so that an interrupted copy continues where it left off on the next run.")
+    copy_group.add_argument("--atomic", action='store_true', required=False, help="Writes each file to a temporary file that replaces the destination once complete so that partially written files are never seen.")
+    copy_group.add_argument("--durability", choices=pyrocopy.DURABILITY_MODES, default='none', required=False, help="Controls flushing copied files to disk: none leaves it to the system, file syncs each file, dir syncs each file like file and also each destination directory once, end syncs each destination filesystem once at the end (the fastest for many small files).")
+    copy_group.add_argument("--manifest", nargs='?', const=True, default=None, required=False, help="Records the copied files in a manifest so later runs skip files whose source hasn't changed without checking the destination. Stored in the destination unless a path is given. Only valid in copy and mirror modes.")
+    copy_group.add_argument("--schedule", choices=pyrocopy.SCHEDULE_MODES, default='fifo', required=False, help="Controls the order files are copied in parallel: fifo copies them in the order found, size gives large files their own share of the threads and batches small files so neither holds up the other.")
+    copy_group.add_argument("--max-bytes-per-sec", type=int, default=None, required=False, metavar="BYTES", help="Limits the number of bytes copied per second across all threads. Send SIGUSR1 to halve the limits while the operation runs and SIGUSR2 to double them.")
+    copy_group.add_argument("--max-files-per-sec", type=int, default=None, required=False, metavar="COUNT", help="Limits the number of files copied per second across all threads.")
+    copy_group.add_argument("--dry-run", action='store_true', required=False, help="Reports what the operation would copy, overwrite and remove without changing anything.")
+    copy_group.add_argument("--plan", action='store_true', required=False, help="Scans the source before copying anything to find the total size of the files to copy, so that the progress shows the time remaining. Only valid in copy and mirror modes.")
+    copy_group.add_argument("--save-plan", type=str, default=None, required=False, metavar="FILE", help="Writes the plan of the operation to FILE as JSON without copying or removing anything. Only valid in copy and mirror modes.")
+    copy_group.add_argument("--load-plan", type=str, default=None, required=False, metavar="FILE", help="Carries out a plan written with --save-plan instead of scanning the source again. Only valid in copy and mirror modes.")
     
     select_group = parser.add_argument_group('selection options')
     select_group.add_argument("-if", "--includefiles", action='append', type=str, required=False, help="A list of regular expression or wildcard patterns for file inclusions. Regex patterns must include the prefix: re:")
@@ -53,17 +68,75 @@ def main():
         show_detail_results = True
 
     # Perform the desired operation
+    options = dict(includeFiles=args.includefiles, includeDirs=args.includedirs, excludeFiles=args.excludefiles,
+                   excludeDirs=args.excludedirs, level=args.level, followLinks=args.followlinks,
+                   forceOverwrite=args.force, preserveStats=(not args.nostat), detailedResults=show_detail_results,
+                   workers=args.threads, cloneMode=args.clone, compare=args.compare,
+                   deltaThreshold=args.delta, resumeThreshold=args.resume,
+                   atomic=args.atomic, durability=args.durability, dryRun=args.dry_run,
+                   schedule=args.schedule)
+    # The rate limits are read through functions so that they can be changed by signals while the operation runs
+    limits = dict(maxBytesPerSec=args.max_bytes_per_sec, maxFilesPerSec=args.max_files_per_sec)
+    for name, limit in limits.items():
+        if (limit != None):
+            if (limit <= 0):
+                parser.error("--max-bytes-per-sec and --max-files-per-sec must be greater than 0")
+            options[name] = (lambda name=name: limits[name])
+
+    def scaleLimits(factor):
+        for name, limit in limits.items():
+            if (limit != None):
+                limits[name] = max(int(limit * factor), 1)
+        pyrocopy.logger.warning("Rate limits changed: %s", ", ".join("%s=%d" % (name, limits[name])
+                                                                     for name in sorted(limits) if limits[name] != None))
+
+    if (hasattr(signal, 'SIGUSR1') and (args.max_bytes_per_sec != None or args.max_files_per_sec != None)):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: scaleLimits(0.5))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: scaleLimits(2))
+
+    if (args.manifest != None):
+        if (args.move or args.sync):
+            parser.error("--manifest can only be used in copy and mirror modes")
+        options['manifest'] = args.manifest
+
+    if (args.plan or args.save_plan != None or args.load_plan != None):
+        if (args.move or args.sync):
+            parser.error("--plan, --save-plan and --load-plan can only be used in copy and mirror modes")
+
+        if (args.load_plan != None):
+            plan = pyrocopy.CopyPlan.load(args.load_plan)
+            try:
+                pyrocopy._checkPlan(plan, 'mirror' if args.mirror else 'copy', args.source, args.destination)
+            except ValueError as e:
+                parser.error(str(e))
+        else:
+            planOptions = dict(includeFiles=args.includefiles, includeDirs=args.includedirs,
+                               excludeFiles=args.excludefiles, excludeDirs=args.excludedirs, level=args.level,
+                               followLinks=args.followlinks, forceOverwrite=args.force, compare=args.compare)
+            if (args.mirror):
+                plan = pyrocopy.planMirror(args.source, args.destination, manifest=args.manifest, **planOptions)
+            else:
+                plan = pyrocopy.planCopy(args.source, args.destination, **planOptions)
+
+        pyrocopy.logger.info("Plan: %d files to copy (%s), %d to remove", plan.totalFiles,
+                             pyrocopy._formatSize(plan.totalBytes), len(plan.removals))
+        if (args.save_plan != None):
+            plan.save(args.save_plan)
+            return
+        options['plan'] = plan
+
     results = None
     if (args.mirror):
-        results = pyrocopy.mirror(args.source, args.destination, includeFiles=args.includefiles, includeDirs=args.includedirs, excludeFiles=args.excludefiles, excludeDirs=args.excludedirs, level=args.level, followLinks=args.followlinks, forceOverwrite=args.force, preserveStats=(not args.nostat), detailedResults=show_detail_results)
+        results = pyrocopy.mirror(args.source, args.destination, **options)
     elif (args.move):
-        results = pyrocopy.move(args.source, args.destination, includeFiles=args.includefiles, includeDirs=args.includedirs, excludeFiles=args.excludefiles, excludeDirs=args.excludedirs, level=args.level, followLinks=args.followlinks, forceOverwrite=args.force, preserveStats=(not args.nostat), detailedResults=show_detail_results)
+        results = pyrocopy.move(args.source, args.destination, **options)
     elif (args.sync):
-        results = pyrocopy.sync(args.source, args.destination, includeFiles=args.includefiles, includeDirs=args.includedirs, excludeFiles=args.excludefiles, excludeDirs=args.excludedirs, level=args.level, followLinks=args.followlinks, forceOverwrite=args.force, preserveStats=(not args.nostat), detailedResults=show_detail_results)
+        results = pyrocopy.sync(args.source, args.destination, **options)
     else:
-        results = pyrocopy.copy(args.source, args.destination, includeFiles=args.includefiles, includeDirs=args.includedirs, excludeFiles=args.excludefiles, excludeDirs=args.excludedirs, level=args.level, followLinks=args.followlinks, forceOverwrite=args.force, preserveStats=(not args.nostat), detailedResults=show_detail_results)
+        results = pyrocopy.copy(args.source, args.destination, **options)
 
     pyrocopy._displayCopyResults(results, show_detail_results)
 
 # main program
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+'''
+Asynchronous versions of the pyrocopy operations for applications built on asyncio.
+
+Each operation runs on a thread pool in slices of at most SLICE_SECONDS, handing control back between slices. The event
+loop is never blocked, any number of operations can share the pool, and an operation is cancelled between files by
+cancelling the task awaiting it. Requires Python 3.6 or newer.
+
+Consecutive slices of an operation may run on different threads of the pool. No per-thread state is kept from one
+slice to the next: the copy buffer of a thread is only used within the copy of a single file, and the worker threads of
+an operation don't depend on the thread that hands them files.
+
+MAX_THREADS only bounds the number of operations walking their trees at once. An operation given workers > 1 starts
+its own pool of that many worker threads in addition, so up to MAX_THREADS * (workers + 1) threads may be running. A
+slice also holds its pool thread while it waits for its workers to catch up.
+
+Homepage: https://github.com/caskater4/pyrocopy
+
+Copyright (C) 2016 Jean-Philippe Steinmetz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import asyncio
+import concurrent.futures
+import time
+
+from . import pyrocopy
+
+'''
+The number of threads of the pool shared by all operations that aren't given their own executor. At most this many
+operations handle files at any one time, the others wait for a thread to free up between slices. The worker threads of
+operations copying in parallel are not counted.
+'''
+MAX_THREADS = 4
+
+'''
+The longest time in seconds an operation handles files on the thread pool before giving it up to other operations.
+Cancelling an operation takes effect at the end of the current slice.
+'''
+SLICE_SECONDS = 0.05
+
+# The thread pool shared by all operations. Created on first use.
+_executor = None
+
+
+'''
+Copies all files and folders from the given source directory to the destination without blocking the event loop.
+
+See pyrocopy.copy() for a description of the arguments, which must be passed by keyword after src and dst.
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on. When None the pool shared by all operations is used.
+
+:rtype:dict
+:return: The results of the operation, as returned by pyrocopy.copy().
+'''
+
+
+async def copy(src, dst, detailedResults=False, executor=None, **options):
+    return await _collectResults('copy', iterCopy(src, dst, executor, **options), detailedResults, options)
+
+
+'''
+Creates an exact copy of the given source to the destination without blocking the event loop.
+
+See pyrocopy.mirror() for a description of the arguments, which must be passed by keyword after src and dst.
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on. When None the pool shared by all operations is used.
+
+:rtype:dict
+:return: The results of the operation, as returned by pyrocopy.mirror().
+'''
+
+
+async def mirror(src, dst, detailedResults=False, executor=None, **options):
+    return await _collectResults('mirror', iterMirror(src, dst, executor, **options), detailedResults, options)
+
+
+'''
+Moves all files and folders from the given source directory to the destination without blocking the event loop.
+
+See pyrocopy.move() for a description of the arguments, which must be passed by keyword after src and dst.
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on. When None the pool shared by all operations is used.
+
+:rtype:dict
+:return: The results of the operation, as returned by pyrocopy.move().
+'''
+
+
+async def move(src, dst, detailedResults=False, executor=None, **options):
+    return await _collectResults('move', iterMove(src, dst, executor, **options), detailedResults, options)
+
+
+'''
+Synchronizes the contents of two paths without blocking the event loop.
+
+See pyrocopy.sync() for a description of the arguments, which must be passed by keyword after path1 and path2.
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on. When None the pool shared by all operations is used.
+
+:rtype:dict
+:return: The results of the operation, as returned by pyrocopy.sync().
+'''
+
+
+async def sync(path1, path2, detailedResults=False, executor=None, **options):
+    return await _collectResults('sync', iterSync(path1, path2, executor, **options), detailedResults, options)
+
+
+'''
+Copies all files and folders from the given source directory to the destination, streaming a pyrocopy.CopyEvent for each
+file and directory as it is handled. The arguments are checked when called, before anything is copied.
+
+    async for event in aio.iterCopy(src, dst):
+        ...
+
+See pyrocopy.copy() for a description of the arguments, which must be passed by keyword after src and dst.
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on. When None the pool shared by all operations is used.
+
+:rtype:async generator
+:return: An asynchronous generator of the CopyEvent records of the operation. Call its aclose() method to stop the
+         operation early.
+'''
+
+
+def iterCopy(src, dst, executor=None, **options):
+    return _iterEvents(pyrocopy.iterCopy(src, dst, **options), executor)
+
+
+'''
+Creates an exact copy of the given source to the destination, streaming a pyrocopy.CopyEvent for each file and directory
+as it is handled. See iterCopy().
+'''
+
+
+def iterMirror(src, dst, executor=None, **options):
+    return _iterEvents(pyrocopy.iterMirror(src, dst, **options), executor)
+
+
+'''
+Moves all files and folders from the given source directory to the destination, streaming a pyrocopy.CopyEvent for each
+file and directory as it is handled. See iterCopy().
+'''
+
+
+def iterMove(src, dst, executor=None, **options):
+    return _iterEvents(pyrocopy.iterMove(src, dst, **options), executor)
+
+
+'''
+Synchronizes the contents of two paths, streaming a pyrocopy.CopyEvent for each file and directory as it is handled.
+See iterCopy().
+'''
+
+
+def iterSync(path1, path2, executor=None, **options):
+    return _iterEvents(pyrocopy.iterSync(path1, path2, **options), executor)
+
+
+'''
+Runs an operation on an executor one slice at a time and yields its events on the event loop. The operation is stopped
+and its resources released when the generator is closed or the task consuming it is cancelled. Only one slice of an
+operation runs at a time, but each may run on a different thread of the executor.
+
+:type events:generator
+:param events: The generator of the CopyEvent records of the operation, e.g. from pyrocopy.iterCopy().
+
+:type executor:concurrent.futures.Executor
+:param executor: The executor to run the operation on, or None for the shared pool.
+
+:rtype:async generator
+:return: An asynchronous generator of the CopyEvent records of the operation.
+'''
+
+
+async def _iterEvents(events, executor=None):
+    if (executor == None):
+        executor = _getExecutor()
+
+    loop = asyncio.get_event_loop()
+    step = None
+    try:
+        while (True):
+            # The slice keeps running on its thread when the task is cancelled, so it's shielded to be waited on below
+            step = loop.run_in_executor(executor, _nextEvents, events, SLICE_SECONDS)
+            batch = await asyncio.shield(step)
+            step = None
+            if (len(batch) == 0):
+                break
+
+            for event in batch:
+                yield event
+    finally:
+        # A generator can't be closed while another thread is running it, so wait for the current slice first
+        if (step != None):
+            try:
+                await step
+            except Exception:
+                pass
+
+        # Closing the operation waits for the copies still in flight, so it's done on the executor as well
+        await loop.run_in_executor(executor, events.close)
+
+
+'''
+Handles the files of an operation for up to the given time.
+
+:type events:generator
+:param events: The generator of the CopyEvent records of the operation.
+
+:type seconds:float
+:param seconds: The time in seconds after which to stop. At least one event is retrieved unless the operation is
+                complete.
+
+:rtype:list
+:return: The events retrieved, or an empty list once the operation is complete.
+'''
+
+
+def _nextEvents(events, seconds):
+    batch = []
+    endTime = time.perf_counter() + seconds
+    for event in events:
+        batch.append(event)
+        if (time.perf_counter() >= endTime):
+            break
+    return batch
+
+
+'''
+Consumes the events of an operation into its results dictionary.
+
+:type operation:string
+:param operation: The name of the operation; 'copy', 'mirror', 'move' or 'sync'.
+
+:type events:async generator
+:param events: The events of the operation returned by _iterEvents().
+
+:type detailedResults:bool
+:param detailedResults: Set to True to include the lists of paths in the results.
+
+:type options:dict
+:param options: The other arguments of the operation.
+
+:rtype:dict
+:return: The results of the operation.
+'''
+
+
+async def _collectResults(operation, events, detailedResults, options):
+    results = pyrocopy._createResults(detailedResults, removed=(operation == 'mirror'))
+    try:
+        async for event in events:
+            pyrocopy._addEvent(results, event, detailedResults)
+    finally:
+        await events.aclose()
+    return pyrocopy._finishResults(operation, results, detailedResults, options.get('excludeFiles'),
+                                   options.get('excludeDirs'))
+
+
+'''
+Retrieves the thread pool shared by all operations, creating it on first use.
+
+:rtype:concurrent.futures.ThreadPoolExecutor
+:return: The shared thread pool.
+'''
+
+
+def _getExecutor():
+    global _executor
+    if (_executor == None):
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_THREADS)
+    return _executor
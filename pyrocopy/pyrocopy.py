@@ -25,13 +25,36 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import array
+import collections
+import collections.abc
+import concurrent.futures
 import errno
 import fnmatch
+import hashlib
+import json
 import logging
 import os
 import re
 import stat
 import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import ctypes
+except ImportError:
+    ctypes = None
 
 '''
 The version of this script as an int tuple (major, minor, patch).
@@ -51,7 +74,102 @@ The default log level is INFO.
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
-BUFFERSIZE_KIB = 16  # Buffer size in kiB for file-copy operations.
+BUFFERSIZE_KIB = 16  # Smallest buffer size in kiB used by adaptive buffer sizing for file-copy operations.
+BUFFERSIZE_MAX_KIB = 8192  # Largest buffer size in kiB used by adaptive buffer sizing for file-copy operations.
+KERNELCOPY_CHUNK_MIB = 8  # Number of MiB handed to the kernel per copy_file_range/sendfile call.
+DELTA_BLOCK_KIB = 64  # Size in kiB of the blocks compared and rewritten when updating a file in place.
+CHECKPOINT_MIB = 64  # Number of MiB copied between the checkpoints of a resumable copy.
+LARGE_FILE_MIB = 64  # Size in MiB from which files are scheduled and reported as large files.
+SMALL_BATCH_FILES = 32  # Largest number of small files handed to a worker at once by the 'size' schedule.
+RATE_POLL_SECONDS = 0.5  # Longest time in seconds between two checks of a rate limit given as a function.
+RATE_BURST_SECONDS = 1.0  # Number of seconds of unused rate limit that can be spent at once after a pause.
+
+FICLONE = 0x40049409  # Linux ioctl request that clones (reflinks) the data of one file into another.
+
+'''
+The names of the data paths used to copy file contents, in order of preference.
+'''
+COPY_METHODS = ('clone', 'delta', 'copy_file_range', 'sendfile', 'userspace')
+
+'''
+The accepted values of the cloneMode option.
+'''
+CLONE_MODES = ('auto', 'always', 'never')
+
+'''
+The accepted values of the compare option.
+'''
+COMPARE_MODES = ('mtime', 'size+mtime', 'hash')
+
+'''
+The name of the manifest file created in the destination when the manifest option is True.
+'''
+MANIFEST_FILENAME = '.pyrocopy-manifest.db'
+
+'''
+The suffix added to the destination path of a resumable copy while it is in progress. Its checkpoint is kept next to it
+with the additional suffix CHECKPOINT_SUFFIX.
+'''
+PARTIAL_SUFFIX = '.pyrocopy-part'
+
+'''
+The suffix added to the partial file of a resumable copy to name its checkpoint file.
+'''
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+'''
+The suffix added to the destination path to name the temporary file written by an atomic copy.
+'''
+TEMP_SUFFIX = '.pyrocopy-tmp'
+
+'''
+The accepted values of the durability option.
+'''
+DURABILITY_MODES = ('none', 'file', 'dir', 'end')
+
+'''
+The accepted values of the schedule option.
+'''
+SCHEDULE_MODES = ('fifo', 'size')
+
+'''
+The actions reported by the CopyEvent records of the iterCopy(), iterMirror(), iterMove() and iterSync() generators.
+'''
+EVENT_ACTIONS = ('copied', 'skipped', 'failed', 'removed', 'synced')
+
+'''
+The version of the format of the plans saved by CopyPlan.save(). Plans saved in another format can't be loaded.
+'''
+PLAN_VERSION = 1
+
+# Error codes indicating a kernel-side copy method isn't supported for a given pair of files. When raised, the next
+# method in COPY_METHODS is attempted instead.
+_COPY_FALLBACK_ERRNOS = tuple(getattr(errno, err) for err in
+                              ('ENOSYS', 'EXDEV', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EBADF', 'ENODEV', 'ETXTBSY')
+                              if hasattr(errno, err))
+
+# The type of compiled regular expression objects.
+_PATTERN_TYPE = type(re.compile(''))
+
+# The syncfs() function of the C library, used to flush a whole filesystem at once. Only available on Linux.
+_syncfs = None
+if (ctypes != None and sys.platform.startswith('linux')):
+    try:
+        _syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError):
+        _syncfs = None
+
+# Finds backreferences in a regular expression. Expressions containing them aren't combined with other expressions as
+# their group numbers would change.
+_BACKREFERENCE_PATTERN = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# Finds the constructs of a regular expression whose match depends on what follows it: end anchors, word boundaries and
+# lookarounds. An exclusion using them can't be assumed to also exclude every subdirectory.
+_UNBOUNDED_REGEX_PATTERN = re.compile(r'\$|\\[ZbB]|\(\?<?[=!]')
+
+# Finds the global inline flags at the start of a regular expression, e.g. (?i). They must stay at the start when the
+# expression is wrapped in a group.
+_INLINE_FLAGS_PATTERN = re.compile(r'(?:\(\?[aiLmsux]+\))*')
 
 '''
 Copies all files and folders from the given source directory to the destination.
@@ -99,9 +217,102 @@ Copies all files and folders from the given source directory to the destination.
 :param detailedResults: Set to True to include additional details in the results containing a list of all files and
                         directories that were skipped or failed during the operation.
 
+:type workers:int
+:param workers: The number of threads used to copy files in parallel. A value of 1 or less copies one file at a time.
+
+:type cloneMode:string
+:param cloneMode: Controls copy-on-write cloning of file contents on filesystems that support it (e.g. btrfs, XFS).
+                  'auto' attempts to clone each file and falls back to copying the data when cloning is refused.
+                  'always' fails any file that cannot be cloned, leaving its existing destination untouched, as
+                  the clone is made to a temporary file first. 'never' always copies the data.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used when file contents must be copied through userspace. When
+                   None the buffer size is chosen for each file based on its size and the filesystem block size.
+
+:type deltaThreshold:int
+:param deltaThreshold: The size in bytes from which files that already exist at the destination are updated in place,
+                       comparing the destination block by block and rewriting only the blocks that changed. This saves
+                       writes for large files with small changes, e.g. disk images, at the cost of reading the whole
+                       destination. On a network filesystem that transfers as much data as a plain rewrite, so an update
+                       only pays off when few blocks changed. Data inserted or removed mid-file changes every block
+                       after it. An interrupted update leaves the destination partially updated. When None files are
+                       always rewritten in full. Not used when cloneMode is 'always'.
+
+:type resumeThreshold:int
+:param resumeThreshold: The size in bytes from which files are copied resumably. The data is written to a partial file
+                        next to the destination (see PARTIAL_SUFFIX) that is renamed into place once complete, with a
+                        checkpoint of the copied length and its hash saved every CHECKPOINT_MIB. A copy that was
+                        interrupted continues from its last checkpoint on the next run once the partial data has been
+                        verified against the hash. When None files are never copied resumably. Files updated in place
+                        with deltaThreshold and files that must be cloned are not copied resumably.
+                        A file whose source changes while it is copied fails, and its partial data is dropped.
+
+:type atomic:bool
+:param atomic: Set to True to write each file to a temporary file next to the destination (see TEMP_SUFFIX) and rename
+               it over the destination once its contents and stats are complete, so that the destination is never
+               seen partially written. Files are then never updated in place with deltaThreshold.
+
+:type durability:string
+:param durability: Controls how copied files are flushed to disk. One of DURABILITY_MODES. 'none' leaves it to the
+                   operating system. 'file' syncs the contents of each file before it is renamed into place or
+                   completed. 'dir' does everything 'file' does and also syncs each destination directory once after all
+                   of its files are copied, so that new and renamed file entries survive a crash. It makes more sync
+                   calls than 'file', not fewer, as the files are still synced one by one. 'end' syncs each destination
+                   filesystem once all files are copied instead of syncing individual files, which batches the syncs and
+                   is much faster for many small files (on platforms without syncfs all filesystems are synced). The
+                   time spent syncing is reported as 'durabilityTime'.
+
+:type progress:ProgressReporter
+:param progress: The reporter to report the progress of the operation to. When None the progress is displayed on the
+                 terminal if the logger has a handler writing to one at the INFO level, and not tracked otherwise.
+
+:type plan:CopyPlan
+:param plan: The plan of the operation made by planCopy() to carry out instead of walking the source again. The
+             selection options are then ignored as the plan already applied them. The total size of the plan is
+             passed to the progress reporter, unless it already has one.
+
+:type dryRun:bool
+:param dryRun: Set to True to report what the operation would do without changing anything. Every file and directory
+               goes through the same checks and gets the same result it would get, but only their metadata is read
+               (and the contents of files compared by hash) and nothing is created, written or removed.
+
+:type schedule:string
+:param schedule: Controls the order in which files are handed to the workers when copying in parallel. One of
+                 SCHEDULE_MODES. 'fifo' copies files in the order they are found. 'size' reserves a quarter of the
+                 workers for files of at least LARGE_FILE_MIB and hands small files to the others in batches, so that
+                 a few large files don't hold up the small ones or the reverse. The number, total size and total copy
+                 time of the small and large files copied are reported in 'sizeStats', and the duration of the whole
+                 operation as 'elapsedTime'.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The most bytes per second to copy, shared by all workers and files of the operation, or None for
+                       no limit. May also be a function taking no arguments that returns the current limit or None,
+                       which is called every RATE_POLL_SECONDS so that a long operation can be throttled while it runs.
+                       Cloned files don't count towards the limit as their data isn't copied.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The most files per second to copy, shared by all workers of the operation, or None for no limit.
+                       May also be a function returning the current limit, as with maxBytesPerSec.
+
+:type manifest:bool or string
+:param manifest: Set to True, or to the path of a file, to keep a manifest of the copied files in a SQLite database.
+                 When True the manifest is stored in the destination as MANIFEST_FILENAME. Later runs skip any file
+                 whose source still has the size, modification time and inode recorded in the manifest without
+                 looking at the destination, so changes made directly to the destination files go unnoticed.
+
+:type compare:string
+:param compare: Controls how a destination file is found to be up to date with its source. One of COMPARE_MODES.
+                'mtime' skips files whose destination is at least as new as the source. 'size+mtime' also copies
+                files with the same modification time whose sizes differ. 'hash' compares the contents of files of
+                the same size, so an unchanged file that was touched is skipped and a changed file with the same
+                modification time is copied. Destination files newer than their source are never overwritten. Hashes
+                are cached by inode, size and modification time, and are kept in the manifest when one is used.
+
 :rtype:dict
 :return: Returns a dictionary containing the following stats:
-         'filesCopied':int, 'filesFailed':int, 'filesSkipped':int, 'dirsCopied':int, 'dirsFailed':int, 'dirsSkipped':int
+         'filesCopied':int, 'filesFailed':int, 'filesSkipped':int, 'dirsCopied':int, 'dirsFailed':int, 'dirsSkipped':int,
+         'copyMethods':dict, 'durabilityTime':float, 'sizeStats':dict, 'elapsedTime':float
          If detailedResults is set to True also includes the following:
          'filesCopiedList':list, 'filesFailedList':list, 'filesSkippedList':list,
          'dirsCopiedList':list, 'dirsFailedList':list, 'dirsSkippedList':list
@@ -109,57 +320,82 @@ Copies all files and folders from the given source directory to the destination.
 
 
 def copy(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
-         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False):
+         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False, workers=1,
+         cloneMode='auto', bufferSize=None, manifest=None, compare='mtime', deltaThreshold=None, resumeThreshold=None,
+         atomic=False, durability='none', progress=None, plan=None, dryRun=False, schedule='fifo',
+         maxBytesPerSec=None, maxFilesPerSec=None):
+    results = _createResults(detailedResults)
+    for event in iterCopy(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                          forceOverwrite, preserveStats, workers, cloneMode, bufferSize, manifest, compare,
+                          deltaThreshold, resumeThreshold, atomic, durability, progress, plan, dryRun, schedule,
+                          maxBytesPerSec, maxFilesPerSec):
+        _addEvent(results, event, detailedResults)
+    return _finishResults('copy', results, detailedResults)
+
+
+'''
+Copies all files and folders from the given source directory to the destination like copy(), yielding a CopyEvent for
+each file and directory as soon as it has been handled instead of returning a summary at the end. Nothing is kept in
+memory for the files already reported, so the events can be consumed for trees of any size.
+
+See copy() for a description of the arguments. The arguments are checked when called, before anything is copied.
 
+:rtype:generator
+:return: A generator of the CopyEvent records of the operation. When the destination is synced at the end (durability
+         'dir' or 'end') a final 'synced' event reports the time spent.
+'''
+
+
+def iterCopy(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+             followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto', bufferSize=None,
+             manifest=None, compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False,
+             durability='none', progress=None, plan=None, dryRun=False, schedule='fifo', maxBytesPerSec=None,
+             maxFilesPerSec=None):
+    _checkOptions(cloneMode, compare, durability, schedule, maxBytesPerSec, maxFilesPerSec)
+    _checkPlan(plan, 'copy', src, dst)
+    return _iterCopy(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks, forceOverwrite,
+                     preserveStats, workers, cloneMode, bufferSize, manifest, compare, deltaThreshold, resumeThreshold,
+                     atomic, durability, progress, plan, dryRun, schedule, maxBytesPerSec, maxFilesPerSec)
+
+
+'''
+Implements iterCopy(). See copy() for a description of the arguments.
+
+:type treeInfo:dict
+:param treeInfo: An optional dictionary that receives information gathered about the source tree while it is walked.
+                 When level is negative 'maxDepth' is set to the depth of the source tree.
+'''
+
+
+def _iterCopy(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+              followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto',
+              bufferSize=None, manifest=None, compare='mtime', deltaThreshold=None, resumeThreshold=None,
+              atomic=False, durability='none', progress=None, plan=None, dryRun=False, schedule='fifo',
+              maxBytesPerSec=None, maxFilesPerSec=None, treeInfo=None):
     # Always work with absolute paths
     src = os.path.abspath(src)
     dst = os.path.abspath(dst)
 
-    # Stats
-    results = {}
-    results['filesCopied'] = 0
-    results['filesFailed'] = 0
-    results['filesSkipped'] = 0
-    results['dirsCopied'] = 0
-    results['dirsFailed'] = 0
-    results['dirsSkipped'] = 0
-    if (detailedResults):
-        results['filesCopiedList'] = []
-        results['filesFailedList'] = []
-        results['filesSkippedList'] = []
-        results['dirsCopiedList'] = []
-        results['dirsFailedList'] = []
-        results['dirsSkippedList'] = []
-
-    # Compile the provided regex patterns
-    includeFilePatterns = []
-    if (includeFiles != None):
-        for pattern in includeFiles:
-            if (pattern.startswith("re:")):
-                includeFilePatterns.append(re.compile(pattern[3:]))
-            else:
-                includeFilePatterns.append(pattern)
-    includeDirPatterns = []
-    if (includeDirs != None):
-        for pattern in includeDirs:
-            if (pattern.startswith("re:")):
-                includeDirPatterns.append(re.compile(pattern[3:]))
-            else:
-                includeDirPatterns.append(pattern)
-    excludeFilePatterns = []
-    if (excludeFiles != None):
-        for pattern in excludeFiles:
-            if (pattern.startswith("re:")):
-                excludeFilePatterns.append(re.compile(pattern[3:]))
-            else:
-                excludeFilePatterns.append(pattern)
-    excludeDirPatterns = []
-    if (excludeDirs != None):
-        for pattern in excludeDirs:
-            if (pattern.startswith("re:")):
-                excludeDirPatterns.append(re.compile(pattern[3:]))
-            else:
-                excludeDirPatterns.append(pattern)
+    # Compile the provided patterns once for the whole operation
+    fileMatcher = PathMatcher(includeFiles, excludeFiles, True)
+    dirMatcher = PathMatcher(includeDirs, excludeDirs, False)
+
+    # The destination directories to sync, or whose filesystems to sync, once all files have been copied
+    syncDirs = None
+    if (durability in ('dir', 'end') and not dryRun):
+        syncDirs = set()
+
+    if (progress == None and not dryRun):
+        progress = _getDefaultProgress()
+
+    # The rate limits are shared by every file and worker of the operation
+    limiter = None
+    if ((maxBytesPerSec != None or maxFilesPerSec != None) and not dryRun):
+        limiter = _RateLimiter(maxBytesPerSec, maxFilesPerSec)
+
+    # With a plan the total amount of data to copy is known up front
+    if (plan != None and progress != None and progress.totalBytes == None):
+        progress.totalBytes = plan.totalBytes
 
     if (not _isSamePath(src, dst)):
         # Is the source path a file, directory or symlink?
@@ -169,124 +405,270 @@ def copy(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, exclu
                 dst = os.path.join(dst, os.path.basename(src))
 
             # Copy the file
-            result = _copyFile(src, dst, includeFilePatterns, excludeFilePatterns, forceOverwrite=forceOverwrite)
-            if (result == 1):
-                logger.info("Copied: %s => %s", src, dst)
-                results['filesCopied'] += 1
-                if (detailedResults):
-                    results['filesCopiedList'].append(src)
-            elif (result == 0):
-                logger.info("Skipped: %s", src)
-                results['filesSkipped'] += 1
-                if (detailedResults):
-                    results['filesSkippedList'].append(src)
-            else:
-                logger.error("Failed: %s => %s", src, dst)
-                results['filesFailed'] += 1
-                if (detailedResults):
-                    results['filesFailedList'].append(src)
+            if (dryRun):
+                for event in _PlanQueue().copyFile(src, src, dst, matcher=fileMatcher, forceOverwrite=forceOverwrite,
+                                                   compare=compare):
+                    yield event
+                return
+
+            fileStats = {}
+            result = _timedCopyFile(src, dst, fileStats, matcher=fileMatcher, progress=progress,
+                                    forceOverwrite=forceOverwrite, cloneMode=cloneMode, bufferSize=bufferSize,
+                                    compare=compare, deltaThreshold=deltaThreshold, resumeThreshold=resumeThreshold,
+                                    atomic=atomic, durability=durability, syncDirs=syncDirs, limiter=limiter)
+            yield _createFileEvent(result, src, dst, fileStats)
         elif (os.path.isdir(src)):
             # Make sure the destination exists to copy files to
-            if (not os.path.isdir(dst)):
+            if (not os.path.isdir(dst) and not dryRun):
                 mkdir(dst)
 
-            # Determine the max depth.
-            maxDepth = _getTreeDepth(src)
+            # Files whose source hasn't changed since the manifest recorded them are skipped outright
+            manifestDb = None
+            if (manifest and not dryRun):
+                manifestDb = _openManifest(_getManifestPath(manifest, dst), src, dst)
 
-            # Traverse the tree and begin copying. Always traverse from the bottom up as this ensures we get the
-            # desired behavior for file/dir inclusion patterns.
-            for root, dirs, files in os.walk(src, topdown=False, followlinks=followLinks):
-                relRoot = os.path.relpath(root, src)
+            # File hashes are shared by all copies of the operation and persisted in the manifest, if any
+            hashCache = None
+            if (compare == 'hash'):
+                hashCache = _HashCache(manifestDb)
 
-                logger.debug("Processing Directory: %s", relRoot)
+            # When copying in parallel, files are handed off to a pool of worker threads while the walk continues
+            if (dryRun):
+                queue = _PlanQueue()
+            else:
+                queue = _CopyQueue(workers, manifestDb, schedule)
+            try:
+                copyArgs = dict(matcher=fileMatcher, progress=progress, preserveStats=preserveStats,
+                                cloneMode=cloneMode, bufferSize=bufferSize, compare=compare, hashCache=hashCache,
+                                deltaThreshold=deltaThreshold, resumeThreshold=resumeThreshold, atomic=atomic,
+                                durability=durability, limiter=limiter)
+                if (plan != None):
+                    # The plan already holds the outcome of the walk
+                    events = _iterPlanTree(plan, src, dst, forceOverwrite, syncDirs, queue, dryRun, **copyArgs)
+                else:
+                    # A negative level is relative to the bottom of the tree so the max depth must be known before
+                    # anything is copied. Rather than walking the tree twice the walk is captured in the same pass that
+                    # computes the depth. Otherwise the tree is only walked once while copying.
+                    tree = _walkTree(src, followLinks)
+                    maxDepth = 0
+                    if (level < 0):
+                        tree, maxDepth = _indexTree(tree)
+                        if (treeInfo != None):
+                            treeInfo['maxDepth'] = maxDepth
+
+                    # Directories whose entire subtree is skipped. Their contents are never listed.
+                    prunedDirs = set()
+                    if (treeInfo != None):
+                        treeInfo['prunedDirs'] = prunedDirs
+
+                    events = _iterCopyTree(tree, dst, level, maxDepth, followLinks, forceOverwrite, dirMatcher,
+                                           prunedDirs, syncDirs, manifestDb, queue, **copyArgs)
+                for event in events:
+                    yield event
+
+                # Wait for all remaining copies to finish
+                for event in queue.finish():
+                    yield event
+            finally:
+                # Stop the workers and save the manifest even when the caller stops consuming the events early
+                queue.finish(cancel=True)
+                if (manifestDb != None):
+                    manifestDb.close()
+        else:
+            logger.error("Source path is not valid: %s", src)
+            yield CopyEvent('failed', src)
+    else:
+        logger.error("Cannot perform a copy to the same location.")
+        yield CopyEvent('failed', '.', isDir=True)
 
-                # Is the root a symlink? Should we follow?
-                if (os.path.islink(root) and not followLinks):
-                    logger.info("Skipped: %s", relRoot)
-                    results['dirsSkipped'] += 1
-                    if (detailedResults):
-                        results['dirsSkippedList'].append(relRoot)
-                    continue
+    if (progress != None):
+        progress.finish()
 
-                # Exclude items not at the desired depth
-                if (level != 0):
-                    # Determine the current depth of relRoot
-                    depth = 0
-                    if (relRoot != '.'):
-                        depth = relRoot.count(os.path.sep) + 1
+    if (syncDirs != None):
+        syncTime = _flushDestination(syncDirs, durability)
+        if (syncTime != None):
+            yield CopyEvent('synced', '.', isDir=True, elapsed=syncTime)
 
-                    # If traversing in reverse we need to subtract the max depth to get the relative level
-                    if (level < 0):
-                        depth = maxDepth - depth
 
-                    # Now check the level
-                    if (depth >= abs(level)):
-                        logger.info("Skipped: %s", relRoot)
-                        results['dirsSkipped'] += 1
-                        if (detailedResults):
-                            results['dirsSkippedList'].append(relRoot)
-                        continue
+'''
+Copies the files of a walk of the source tree to the destination. Implements the directory traversal of _iterCopy().
 
-                # Should the directory be traversed?
-                if (relRoot != '.' and
-                        not _checkShouldCopy(relRoot, False, includeDirPatterns, excludeDirPatterns)):
-                    logger.info("Skipped: %s", relRoot)
-                    results['dirsSkipped'] += 1
-                    if (detailedResults):
-                        results['dirsSkippedList'].append(relRoot)
-                    continue
+:type tree:iterable
+:param tree: The walk of the source tree returned by _walkTree() or _indexTree().
 
-                # Make sure the root directory exists at the destination
-                dstRoot = dst
-                if (relRoot != '.'):
-                    dstRoot = os.path.join(dst, relRoot)
-                if (not os.path.isdir(dstRoot)):
-                    mkdir(dstRoot)
+:type dst:string
+:param dst: The destination root.
 
-                if (relRoot != '.'):
-                    if (os.path.isdir(dstRoot)):
-                        results['dirsCopied'] += 1
-                        if (detailedResults):
-                            results['dirsCopiedList'].append(relRoot)
-                    else:
-                        logger.exception("Failed: %s", relRoot)
-                        results['dirsFailed'] += 1
-                        if (detailedResults):
-                            results['dirsFailedList'].append(relRoot)
-                        continue
+:type level:int
+:param level: The level option of the operation.
 
-                for file in files:
-                    filePath = os.path.join(relRoot, file)
-                    srcFullPath = os.path.join(src, root, file)
-                    dstFullPath = os.path.join(dst, filePath)
-
-                    # Copy the file
-                    result = _copyFile(srcFullPath, dstFullPath, includes=includeFilePatterns,
-                                       excludes=excludeFilePatterns, forceOverwrite=forceOverwrite,
-                                       preserveStats=preserveStats)
-                    if (result == 1):
-                        logger.info("Copied: %s => %s", filePath, dstFullPath)
-                        results['filesCopied'] += 1
-                        if (detailedResults):
-                            results['filesCopiedList'].append(filePath)
-                    elif (result == 0):
-                        logger.info("Skipped: %s", filePath)
-                        results['filesSkipped'] += 1
-                        if (detailedResults):
-                            results['filesSkippedList'].append(filePath)
-                    else:
-                        logger.error("Failed: %s => %s", filePath, dstFullPath)
-                        results['filesFailed'] += 1
-                        if (detailedResults):
-                            results['filesFailedList'].append(filePath)
-        else:
-            logger.error("Source path is not valid: %s", src)
-            results['filesFailed'] += 1
-    else:
-        logger.error("Cannot perform a copy to the same location.")
-        results['dirsFailed'] += 1
+:type maxDepth:int
+:param maxDepth: The depth of the source tree. Only used when level is negative.
 
-    return results
+:type followLinks:bool
+:param followLinks: Set to true to traverse through symbolic links.
+
+:type forceOverwrite:bool
+:param forceOverwrite: Set to true to overwrite destination files even if they are newer.
+
+:type dirMatcher:PathMatcher
+:param dirMatcher: The matcher of the directory include and exclude patterns.
+
+:type prunedDirs:set
+:param prunedDirs: The set that receives the directories whose entire subtree is skipped.
+
+:type syncDirs:set
+:param syncDirs: The set that receives the destination directories to sync at the end, or None.
+
+:type manifestDb:_Manifest
+:param manifestDb: The manifest of the operation, or None.
+
+:type queue:_CopyQueue
+:param queue: The queue to create the directories and copy the files through, or a _PlanQueue to only decide what
+              would be done.
+
+:param copyArgs: Additional arguments passed to _copyFile.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the directories and of the files copied so far.
+'''
+
+
+def _iterCopyTree(tree, dst, level, maxDepth, followLinks, forceOverwrite, dirMatcher, prunedDirs, syncDirs, manifestDb,
+                  queue, **copyArgs):
+    # Traverse the tree from the top down and begin copying. Each directory is checked on its own against the inclusion
+    # patterns, so a directory that is skipped doesn't prevent its subdirectories from being copied. The exception is
+    # when the level or an exclusion is guaranteed to skip everything beneath a directory. The subtree is then pruned
+    # from the walk rather than listed only to skip each directory in it.
+    for root, relRoot, dirs, files in tree:
+        # A captured walk still includes the contents of pruned directories
+        if (relRoot != '.' and (os.path.dirname(relRoot) or '.') in prunedDirs):
+            prunedDirs.add(relRoot)
+            continue
+
+        logger.debug("Processing Directory: %s", relRoot)
+
+        # Is the root a symlink? Should we follow? Only the source root itself can be a symlink here as the walk
+        # doesn't descend into linked directories unless following links.
+        if (not followLinks and relRoot == '.' and os.path.islink(root)):
+            logger.info("Skipped: %s", relRoot)
+            yield CopyEvent('skipped', relRoot, isDir=True)
+            continue
+
+        # Exclude items not at the desired depth or not matching the directory patterns
+        skip, prune = _checkDirectory(relRoot, level, maxDepth, dirMatcher)
+        if (skip):
+            logger.info("Skipped: %s", relRoot)
+            yield CopyEvent('skipped', relRoot, isDir=True)
+            if (prune):
+                prunedDirs.add(relRoot)
+                dirs[:] = []
+            continue
+
+        # Make sure the root directory exists at the destination
+        dstRoot = dst
+        if (relRoot != '.'):
+            dstRoot = os.path.join(dst, relRoot)
+
+        if (relRoot != '.'):
+            if (queue.makeDir(dstRoot)):
+                yield CopyEvent('copied', relRoot, isDir=True)
+                if (syncDirs != None):
+                    syncDirs.add(os.path.dirname(dstRoot))
+            else:
+                logger.exception("Failed: %s", relRoot)
+                yield CopyEvent('failed', relRoot, isDir=True)
+                continue
+
+        for entry in files:
+            filePath = os.path.join(relRoot, entry.name)
+            srcFullPath = entry.path
+            dstFullPath = os.path.join(dstRoot, entry.name)
+
+            if (manifestDb != None and not forceOverwrite and
+                    manifestDb.isUnchanged(filePath, _statEntry(entry))):
+                yield _createFileEvent(0, filePath, dstFullPath, {})
+                continue
+
+            # Copy the file, yielding the copies that have completed in the meantime
+            for event in queue.copyFile(filePath, srcFullPath, dstFullPath, forceOverwrite=forceOverwrite,
+                                        syncDirs=syncDirs, srcEntry=entry, **copyArgs):
+                yield event
+
+
+'''
+Carries out the entries of a plan in the order they were planned. Implements the execution of a plan by _iterCopy() in
+place of _iterCopyTree(). Each file is still checked against its destination before it is copied, and a path planned
+for removal is kept if it has since appeared in the source.
+
+:type plan:CopyPlan
+:param plan: The plan to carry out.
+
+:type src:string
+:param src: The source root.
+
+:type dst:string
+:param dst: The destination root.
+
+:type forceOverwrite:bool
+:param forceOverwrite: Set to true to overwrite destination files even if they are newer.
+
+:type syncDirs:set
+:param syncDirs: The set that receives the destination directories to sync at the end, or None.
+
+:type queue:_CopyQueue
+:param queue: The queue to create the directories and copy the files through.
+
+:type dryRun:bool
+:param dryRun: Set to True to only report what would be done.
+
+:param copyArgs: Additional arguments passed to _copyFile.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the entries carried out so far.
+'''
+
+
+def _iterPlanTree(plan, src, dst, forceOverwrite, syncDirs, queue, dryRun, **copyArgs):
+    for entry in plan.entries:
+        dstPath = os.path.join(dst, entry.path)
+
+        if (entry.action == 'removed'):
+            if (os.path.exists(os.path.join(src, entry.path))):
+                continue
+
+            try:
+                if (dryRun):
+                    logger.info("Would remove: %s", dstPath)
+                elif (entry.isDir):
+                    os.rmdir(dstPath)
+                    logger.info("Removed: %s", dstPath)
+                else:
+                    os.remove(dstPath)
+                    logger.info("Removed: %s", dstPath)
+                yield CopyEvent('removed', entry.path, isDir=entry.isDir)
+            except (IOError, OSError):
+                logger.info("Remove failed: %s", entry.path)
+                yield CopyEvent('failed', entry.path, isDir=entry.isDir)
+        elif (entry.action != 'copied'):
+            # Skipped and failed entries are reported as they were planned
+            if (entry.action == 'skipped'):
+                logger.info("Skipped: %s", entry.path)
+            else:
+                logger.error("Failed: %s", entry.path)
+            yield CopyEvent(entry.action, entry.path, isDir=entry.isDir, size=entry.size)
+        elif (entry.isDir):
+            if (queue.makeDir(dstPath)):
+                yield CopyEvent('copied', entry.path, isDir=True)
+                if (syncDirs != None):
+                    syncDirs.add(os.path.dirname(dstPath))
+            else:
+                logger.exception("Failed: %s", entry.path)
+                yield CopyEvent('failed', entry.path, isDir=True)
+        else:
+            for event in queue.copyFile(entry.path, os.path.join(src, entry.path), dstPath,
+                                        forceOverwrite=forceOverwrite, syncDirs=syncDirs, **copyArgs):
+                yield event
 
 
 '''
@@ -314,8 +696,12 @@ def mkdir(path):
     if (pair[0] != '' and not os.path.isdir(pair[0])):
         return False
 
-    # Attempt to create the directory
-    os.mkdir(path)
+    # Attempt to create the directory. Another thread may have created it in the meantime which is fine.
+    try:
+        os.mkdir(path)
+    except OSError as why:
+        if (why.errno != errno.EEXIST):
+            raise
 
     logger.debug("Created: %s", path)
 
@@ -369,10 +755,103 @@ destination and removes any file or directory present in the destination that is
 :param detailedResults: Set to True to include additional details in the results containing a list of all files and
                         directories that were skipped or failed during the operation.
 
+:type workers:int
+:param workers: The number of threads used to copy files in parallel. A value of 1 or less copies one file at a time.
+
+:type cloneMode:string
+:param cloneMode: Controls copy-on-write cloning of file contents on filesystems that support it (e.g. btrfs, XFS).
+                  'auto' attempts to clone each file and falls back to copying the data when cloning is refused.
+                  'always' fails any file that cannot be cloned, leaving its existing destination untouched, as
+                  the clone is made to a temporary file first. 'never' always copies the data.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used when file contents must be copied through userspace. When
+                   None the buffer size is chosen for each file based on its size and the filesystem block size.
+
+:type deltaThreshold:int
+:param deltaThreshold: The size in bytes from which files that already exist at the destination are updated in place,
+                       comparing the destination block by block and rewriting only the blocks that changed. This saves
+                       writes for large files with small changes, e.g. disk images, at the cost of reading the whole
+                       destination. On a network filesystem that transfers as much data as a plain rewrite, so an update
+                       only pays off when few blocks changed. Data inserted or removed mid-file changes every block
+                       after it. An interrupted update leaves the destination partially updated. When None files are
+                       always rewritten in full. Not used when cloneMode is 'always'.
+
+:type resumeThreshold:int
+:param resumeThreshold: The size in bytes from which files are copied resumably. The data is written to a partial file
+                        next to the destination (see PARTIAL_SUFFIX) that is renamed into place once complete, with a
+                        checkpoint of the copied length and its hash saved every CHECKPOINT_MIB. A copy that was
+                        interrupted continues from its last checkpoint on the next run once the partial data has been
+                        verified against the hash. When None files are never copied resumably. Files updated in place
+                        with deltaThreshold and files that must be cloned are not copied resumably.
+                        A file whose source changes while it is copied fails, and its partial data is dropped.
+
+:type atomic:bool
+:param atomic: Set to True to write each file to a temporary file next to the destination (see TEMP_SUFFIX) and rename
+               it over the destination once its contents and stats are complete, so that the destination is never
+               seen partially written. Files are then never updated in place with deltaThreshold.
+
+:type durability:string
+:param durability: Controls how copied files are flushed to disk. One of DURABILITY_MODES. 'none' leaves it to the
+                   operating system. 'file' syncs the contents of each file before it is renamed into place or
+                   completed. 'dir' does everything 'file' does and also syncs each destination directory once after all
+                   of its files are copied, so that new and renamed file entries survive a crash. It makes more sync
+                   calls than 'file', not fewer, as the files are still synced one by one. 'end' syncs each destination
+                   filesystem once all files are copied instead of syncing individual files, which batches the syncs and
+                   is much faster for many small files (on platforms without syncfs all filesystems are synced). The
+                   time spent syncing is reported as 'durabilityTime'.
+
+:type progress:ProgressReporter
+:param progress: The reporter to report the progress of the operation to. When None the progress is displayed on the
+                 terminal if the logger has a handler writing to one at the INFO level, and not tracked otherwise.
+
+:type plan:CopyPlan
+:param plan: The plan of the operation made by planMirror() to carry out instead of walking the source and the
+             destination again. The selection options are then ignored as the plan already applied them. The total
+             size of the plan is passed to the progress reporter, unless it already has one.
+
+:type dryRun:bool
+:param dryRun: Set to True to report what the operation would do without changing anything. Every file and directory
+               goes through the same checks and gets the same result it would get, but only their metadata is read
+               (and the contents of files compared by hash) and nothing is created, written or removed.
+
+:type schedule:string
+:param schedule: Controls the order in which files are handed to the workers when copying in parallel. One of
+                 SCHEDULE_MODES. 'fifo' copies files in the order they are found. 'size' reserves a quarter of the
+                 workers for files of at least LARGE_FILE_MIB and hands small files to the others in batches, so that
+                 a few large files don't hold up the small ones or the reverse. The number, total size and total copy
+                 time of the small and large files copied are reported in 'sizeStats', and the duration of the whole
+                 operation as 'elapsedTime'.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The most bytes per second to copy, shared by all workers and files of the operation, or None for
+                       no limit. May also be a function taking no arguments that returns the current limit or None,
+                       which is called every RATE_POLL_SECONDS so that a long operation can be throttled while it runs.
+                       Cloned files don't count towards the limit as their data isn't copied.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The most files per second to copy, shared by all workers of the operation, or None for no limit.
+                       May also be a function returning the current limit, as with maxBytesPerSec.
+
+:type manifest:bool or string
+:param manifest: Set to True, or to the path of a file, to keep a manifest of the copied files in a SQLite database.
+                 When True the manifest is stored in the destination as MANIFEST_FILENAME. Later runs skip any file
+                 whose source still has the size, modification time and inode recorded in the manifest without
+                 looking at the destination, so changes made directly to the destination files go unnoticed.
+
+:type compare:string
+:param compare: Controls how a destination file is found to be up to date with its source. One of COMPARE_MODES.
+                'mtime' skips files whose destination is at least as new as the source. 'size+mtime' also copies
+                files with the same modification time whose sizes differ. 'hash' compares the contents of files of
+                the same size, so an unchanged file that was touched is skipped and a changed file with the same
+                modification time is copied. Destination files newer than their source are never overwritten. Hashes
+                are cached by inode, size and modification time, and are kept in the manifest when one is used.
+
 :rtype:dict
 :return: Returns a dictionary containing the following stats:
          'filesCopied':int, 'filesFailed':int, 'filesRemoved':int, 'filesSkipped':int, 'dirsCopied':int,
-         'dirsFailed':int, 'dirsRemoved':int, 'dirsSkipped':int
+         'dirsFailed':int, 'dirsRemoved':int, 'dirsSkipped':int, 'copyMethods':dict, 'durabilityTime':float,
+         'sizeStats':dict, 'elapsedTime':float
          If detailedResults is set to True also includes the following:
          'filesCopiedList':list, 'filesFailedList':list, 'filesRemovedList':list, 'filesSkippedList':list,
          'dirsCopiedList':list, 'dirsFailedList':list, 'dirsRemovedList':list, 'dirsSkippedList':list
@@ -380,34 +859,132 @@ destination and removes any file or directory present in the destination that is
 
 
 def mirror(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
-           followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False):
+           followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False, workers=1,
+           cloneMode='auto', bufferSize=None, manifest=None, compare='mtime', deltaThreshold=None,
+           resumeThreshold=None, atomic=False, durability='none', progress=None, plan=None, dryRun=False,
+           schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    results = _createResults(detailedResults, removed=True)
+    for event in iterMirror(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                            forceOverwrite, preserveStats, workers, cloneMode, bufferSize, manifest, compare,
+                            deltaThreshold, resumeThreshold, atomic, durability, progress, plan, dryRun, schedule,
+                            maxBytesPerSec, maxFilesPerSec):
+        _addEvent(results, event, detailedResults)
+    return _finishResults('mirror', results, detailedResults, excludeFiles, excludeDirs)
+
+
+'''
+Creates an exact copy of the given source to the destination like mirror(), yielding a CopyEvent for each file and
+directory as soon as it has been handled. The files and directories removed from the destination are reported with
+'removed' events once the copy is complete.
+
+See mirror() for a description of the arguments. The arguments are checked when called, before anything is copied.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the operation.
+'''
+
+
+def iterMirror(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+               followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto',
+               bufferSize=None, manifest=None, compare='mtime', deltaThreshold=None, resumeThreshold=None,
+               atomic=False, durability='none', progress=None, plan=None, dryRun=False, schedule='fifo',
+               maxBytesPerSec=None, maxFilesPerSec=None):
+    _checkOptions(cloneMode, compare, durability, schedule, maxBytesPerSec, maxFilesPerSec)
+    _checkPlan(plan, 'mirror', src, dst)
+    return _iterMirror(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                       forceOverwrite, preserveStats, workers, cloneMode, bufferSize, manifest, compare,
+                       deltaThreshold, resumeThreshold, atomic, durability, progress, plan, dryRun, schedule,
+                       maxBytesPerSec, maxFilesPerSec)
+
+
+'''
+Implements iterMirror(). See mirror() for a description of the arguments.
+'''
+
+
+def _iterMirror(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+                followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto',
+                bufferSize=None, manifest=None, compare='mtime', deltaThreshold=None, resumeThreshold=None,
+                atomic=False, durability='none', progress=None, plan=None, dryRun=False, schedule='fifo',
+                maxBytesPerSec=None, maxFilesPerSec=None):
     # Always work with absolute paths
     src = os.path.abspath(src)
     dst = os.path.abspath(dst)
 
-    # Attempt to copy everything
-    results = copy(src, dst, includeFiles=includeFiles, includeDirs=includeDirs, excludeFiles=excludeFiles,
-                   excludeDirs=excludeDirs, level=level, followLinks=followLinks, forceOverwrite=forceOverwrite,
-                   preserveStats=preserveStats, detailedResults=True)
+    # Nothing matching the exclude patterns is removed from the destination, nor is anything that failed to copy
+    keepDirs = set(excludeDirs or [])
+    keepFiles = set(excludeFiles or [])
+
+    # Attempt to copy everything. The depth of src is gathered by the copy so that we don't go beyond that level in dst
+    # (if they're different).
+    treeInfo = {}
+    for event in _iterCopy(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                           forceOverwrite, preserveStats, workers, cloneMode, bufferSize, manifest, compare,
+                           deltaThreshold, resumeThreshold, atomic, durability, progress, plan, dryRun, schedule,
+                           maxBytesPerSec, maxFilesPerSec, treeInfo=treeInfo):
+        if (event.action == 'failed'):
+            if (event.isDir):
+                keepDirs.add(event.path)
+            else:
+                keepFiles.add(event.path)
+
+                # Keep the partial data of failed resumable copies so that they can continue on the next run
+                if (resumeThreshold != None):
+                    keepFiles.add(event.path + PARTIAL_SUFFIX)
+                    keepFiles.add(event.path + PARTIAL_SUFFIX + CHECKPOINT_SUFFIX)
+        yield event
+    maxDepth = treeInfo.get('maxDepth', 0)
+
+    # Never remove the manifest when it's kept in the destination
+    if (manifest):
+        manifestPath = os.path.relpath(_getManifestPath(manifest, dst), dst)
+        keepFiles.add(manifestPath)
+        keepFiles.add(os.path.join('.', manifestPath))
+
+    # The removals of a plan were carried out along with the rest of it
+    if (plan != None):
+        return
+
+    for event in _iterMirrorRemovals(src, dst, level, maxDepth, followLinks, keepDirs, keepFiles, dryRun):
+        yield event
 
-    # Add the additional stats not included by copy
-    results['filesRemoved'] = 0
-    results['dirsRemoved'] = 0
-    if (detailedResults):
-        results['filesRemovedList'] = []
-        results['dirsRemovedList'] = []
 
-    # Add the exclude files
-    results['dirsSkippedList'] = []
-    if excludeDirs != None:
-        results['dirsSkippedList'] += excludeDirs
+'''
+Removes the files and directories of the destination that aren't in the source. Implements the cleanup of _iterMirror().
+
+:type src:string
+:param src: The source root.
+
+:type dst:string
+:param dst: The destination root.
+
+:type level:int
+:param level: The level option of the operation.
+
+:type maxDepth:int
+:param maxDepth: The depth of the source tree. Only used when level is negative.
+
+:type followLinks:bool
+:param followLinks: Set to true to traverse through symbolic links.
+
+:type keepDirs:set
+:param keepDirs: The relative paths of the directories never to remove.
+
+:type keepFiles:set
+:param keepFiles: The relative paths of the files never to remove.
 
-    results['filesSkippedList'] = []
-    if excludeFiles != None:
-        results['filesSkippedList'] += excludeFiles
+:type dryRun:bool
+:param dryRun: Set to True to only report what would be removed. A directory is then reported as removed if all of
+               its contents would be.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the files and directories removed, or that failed to be removed.
+'''
 
-    # Determine the max depth of src so that we don't go beyond that level in dst (if they're different)
-    maxDepth = _getTreeDepth(src)
+
+def _iterMirrorRemovals(src, dst, level, maxDepth, followLinks, keepDirs, keepFiles, dryRun=False):
+    # The normalized paths that would have been removed by a dry run
+    removed = set()
 
     # Now traverse through the destination and remove anything not also in source
     for root, dirs, files in os.walk(dst, topdown=False, followlinks=followLinks):
@@ -428,79 +1005,92 @@ def mirror(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, exc
                 continue
 
         # Don't remove any dirs that are in the skipped or failed lists
-        dirSkipped = False
-        for skippedDir in results['dirsSkippedList']:
-            if (relRoot == skippedDir):
-                dirSkipped = True
-                break
-        if (not dirSkipped):
-            for skippedDir in results['dirsFailedList']:
-                if (relRoot == skippedDir):
-                    dirSkipped = True
-                    break
-
-        if (not dirSkipped):
+        if (relRoot not in keepDirs):
             # Go through the files in the directory and remove those not found in src and not skipped or failed
             for file in files:
                 filePath = os.path.join(root, file)
                 relFilePath = os.path.join(relRoot, file)
 
                 # Was the file skipped or failed?
-                fileSkipped = False
-                for skippedFile in results['filesSkippedList']:
-                    if (relFilePath == skippedFile):
-                        fileSkipped = True
-                        break
-                if (not fileSkipped):
-                    for failedFile in results['filesFailedList']:
-                        if (relFilePath == failedFile):
-                            fileSkipped = True
-                            break
-
-                if (not fileSkipped):
+                if (relFilePath not in keepFiles):
                     srcFilePath = os.path.join(src, relFilePath)
                     if (not os.path.exists(srcFilePath)):
                         try:
-                            os.remove(filePath)
-                            logger.info("Removed: %s", filePath)
-                            results['filesRemoved'] += 1
-                            if (detailedResults):
-                                results['filesRemovedList'].append(relFilePath)
+                            if (dryRun):
+                                logger.info("Would remove: %s", filePath)
+                                removed.add(os.path.normpath(relFilePath))
+                            else:
+                                os.remove(filePath)
+                                logger.info("Removed: %s", filePath)
+                            yield CopyEvent('removed', relFilePath)
                         except (IOError, OSError):
                             logger.info("Remove failed: %s", relFilePath)
-                            results['filesFailedList'].append(relFilePath)
+                            yield CopyEvent('failed', relFilePath)
 
             # Should the directory be deleted?
             srcRoot = os.path.join(src, relRoot)
             if (not os.path.exists(srcRoot)):
-                dirlist = os.listdir(root)
+                dirlist = [name for name in os.listdir(root)
+                           if os.path.normpath(os.path.join(relRoot, name)) not in removed]
                 if (len(dirlist) == 0):
                     try:
-                        os.rmdir(root)
-                        logger.info("Removed: %s", root)
-                        results['dirsRemoved'] += 1
-                        if (detailedResults):
-                            results['dirsRemovedList'].append(relRoot)
+                        if (dryRun):
+                            logger.info("Would remove: %s", root)
+                            removed.add(relRoot)
+                        else:
+                            os.rmdir(root)
+                            logger.info("Removed: %s", root)
+                        yield CopyEvent('removed', relRoot, isDir=True)
                     except (IOError, OSError):
                         logger.info("Remove failed: %s", relRoot)
-                        results['dirsFailed'] += 1
-                        if (detailedResults):
-                            results['dirsFailedList'].append(relRoot)
+                        yield CopyEvent('failed', relRoot, isDir=True)
                 else:
-                    results['dirsFailed'] += 1
-                    if (detailedResults):
-                        results['dirsFailedList'].append(relRoot)
+                    yield CopyEvent('failed', relRoot, isDir=True)
 
-    # If detailedResults was not desired remove those entries from the results
-    if (not detailedResults):
-        results['filesCopiedList'] = None
-        results['filesFailedList'] = None
-        results['filesSkippedList'] = None
-        results['dirsCopiedList'] = None
-        results['dirsFailedList'] = None
-        results['dirsSkippedList'] = None
 
-    return results
+'''
+Plans a copy of the given source to the destination without copying anything. The source is walked and every file is
+checked against its destination exactly as copy() would, but only metadata is read (and the contents of files that
+must be compared by hash). The resulting plan lists what copy() would do along with the total number of files and bytes
+to copy, and can be carried out later with copy(src, dst, plan=plan).
+
+See copy() for a description of the arguments.
+
+:rtype:CopyPlan
+:return: The plan of the copy.
+'''
+
+
+def planCopy(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+             followLinks=False, forceOverwrite=False, compare='mtime'):
+    _checkOptions('auto', compare, 'none')
+    plan = CopyPlan('copy', os.path.abspath(src), os.path.abspath(dst))
+    for event in _iterCopy(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                           forceOverwrite, compare=compare, dryRun=True):
+        plan.add(event)
+    return plan
+
+
+'''
+Plans a mirror of the given source to the destination without copying or removing anything. In addition to the
+entries of planCopy() the plan lists the files and directories that mirror() would remove from the destination.
+Carry it out with mirror(src, dst, plan=plan).
+
+See mirror() for a description of the arguments. The manifest is only used to keep it from being removed.
+
+:rtype:CopyPlan
+:return: The plan of the mirror.
+'''
+
+
+def planMirror(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+               followLinks=False, forceOverwrite=False, compare='mtime', manifest=None):
+    _checkOptions('auto', compare, 'none')
+    plan = CopyPlan('mirror', os.path.abspath(src), os.path.abspath(dst))
+    for event in _iterMirror(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                             forceOverwrite, manifest=manifest, compare=compare, dryRun=True):
+        plan.add(event)
+    return plan
 
 
 '''
@@ -549,9 +1139,91 @@ Moves all files and folders from the given source directory to the destination.
 :param detailedResults: Set to True to include additional details in the results containing a list of all files and
                         directories that were skipped or failed during the operation.
 
+:type workers:int
+:param workers: The number of threads used to copy files in parallel. A value of 1 or less copies one file at a time.
+
+:type cloneMode:string
+:param cloneMode: Controls copy-on-write cloning of file contents on filesystems that support it (e.g. btrfs, XFS).
+                  'auto' attempts to clone each file and falls back to copying the data when cloning is refused.
+                  'always' fails any file that cannot be cloned, leaving its existing destination untouched, as
+                  the clone is made to a temporary file first. 'never' always copies the data.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used when file contents must be copied through userspace. When
+                   None the buffer size is chosen for each file based on its size and the filesystem block size.
+
+:type deltaThreshold:int
+:param deltaThreshold: The size in bytes from which files that already exist at the destination are updated in place,
+                       comparing the destination block by block and rewriting only the blocks that changed. This saves
+                       writes for large files with small changes, e.g. disk images, at the cost of reading the whole
+                       destination. On a network filesystem that transfers as much data as a plain rewrite, so an update
+                       only pays off when few blocks changed. Data inserted or removed mid-file changes every block
+                       after it. An interrupted update leaves the destination partially updated. When None files are
+                       always rewritten in full. Not used when cloneMode is 'always'.
+
+:type resumeThreshold:int
+:param resumeThreshold: The size in bytes from which files are copied resumably. The data is written to a partial file
+                        next to the destination (see PARTIAL_SUFFIX) that is renamed into place once complete, with a
+                        checkpoint of the copied length and its hash saved every CHECKPOINT_MIB. A copy that was
+                        interrupted continues from its last checkpoint on the next run once the partial data has been
+                        verified against the hash. When None files are never copied resumably. Files updated in place
+                        with deltaThreshold and files that must be cloned are not copied resumably.
+                        A file whose source changes while it is copied fails, and its partial data is dropped.
+
+:type atomic:bool
+:param atomic: Set to True to write each file to a temporary file next to the destination (see TEMP_SUFFIX) and rename
+               it over the destination once its contents and stats are complete, so that the destination is never
+               seen partially written. Files are then never updated in place with deltaThreshold.
+
+:type durability:string
+:param durability: Controls how copied files are flushed to disk. One of DURABILITY_MODES. 'none' leaves it to the
+                   operating system. 'file' syncs the contents of each file before it is renamed into place or
+                   completed. 'dir' does everything 'file' does and also syncs each destination directory once after all
+                   of its files are copied, so that new and renamed file entries survive a crash. It makes more sync
+                   calls than 'file', not fewer, as the files are still synced one by one. 'end' syncs each destination
+                   filesystem once all files are copied instead of syncing individual files, which batches the syncs and
+                   is much faster for many small files (on platforms without syncfs all filesystems are synced). The
+                   time spent syncing is reported as 'durabilityTime'.
+
+:type progress:ProgressReporter
+:param progress: The reporter to report the progress of the operation to. When None the progress is displayed on the
+                 terminal if the logger has a handler writing to one at the INFO level, and not tracked otherwise.
+
+:type dryRun:bool
+:param dryRun: Set to True to report what the operation would do without changing anything. Every file and directory
+               goes through the same checks and gets the same result it would get, but only their metadata is read
+               (and the contents of files compared by hash) and nothing is created, written or removed.
+
+:type schedule:string
+:param schedule: Controls the order in which files are handed to the workers when copying in parallel. One of
+                 SCHEDULE_MODES. 'fifo' copies files in the order they are found. 'size' reserves a quarter of the
+                 workers for files of at least LARGE_FILE_MIB and hands small files to the others in batches, so that
+                 a few large files don't hold up the small ones or the reverse. The number, total size and total copy
+                 time of the small and large files copied are reported in 'sizeStats', and the duration of the whole
+                 operation as 'elapsedTime'.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The most bytes per second to copy, shared by all workers and files of the operation, or None for
+                       no limit. May also be a function taking no arguments that returns the current limit or None,
+                       which is called every RATE_POLL_SECONDS so that a long operation can be throttled while it runs.
+                       Cloned files don't count towards the limit as their data isn't copied.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The most files per second to copy, shared by all workers of the operation, or None for no limit.
+                       May also be a function returning the current limit, as with maxBytesPerSec.
+
+:type compare:string
+:param compare: Controls how a destination file is found to be up to date with its source. One of COMPARE_MODES.
+                'mtime' skips files whose destination is at least as new as the source. 'size+mtime' also copies
+                files with the same modification time whose sizes differ. 'hash' compares the contents of files of
+                the same size, so an unchanged file that was touched is skipped and a changed file with the same
+                modification time is copied. Destination files newer than their source are never overwritten. Hashes
+                are cached by inode, size and modification time.
+
 :rtype:dict
 :return: Returns a dictionary containing the following stats:
-         'filesMoved', 'filesFailed', 'filesSkipped', 'dirsMoved', 'dirsFailed', 'dirsSkipped'
+         'filesMoved', 'filesFailed', 'filesSkipped', 'dirsMoved', 'dirsFailed', 'dirsSkipped', 'copyMethods',
+         'durabilityTime', 'sizeStats', 'elapsedTime'
          If detailedResults is set to True also includes the following:
          'filesMovedList':list, 'filesFailedList':list, 'filesSkippedList':list,
          'dirsMovedList':list, 'dirsFailedList':list, 'dirsSkippedList':list
@@ -559,32 +1231,85 @@ Moves all files and folders from the given source directory to the destination.
 
 
 def move(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
-         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False):
+         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False, workers=1,
+         cloneMode='auto', bufferSize=None, compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False,
+         durability='none', progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    results = _createResults(detailedResults)
+    for event in iterMove(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                          forceOverwrite, preserveStats, workers, cloneMode, bufferSize, compare, deltaThreshold,
+                          resumeThreshold, atomic, durability, progress, dryRun, schedule, maxBytesPerSec,
+                          maxFilesPerSec):
+        _addEvent(results, event, detailedResults)
+    return _finishResults('move', results, detailedResults)
+
+
+'''
+Moves all files and folders from the given source directory to the destination like move(), yielding a CopyEvent for
+each file and directory as soon as it has been handled. Files and directories are reported as 'copied' when they reach
+the destination, and as 'removed' when they are then deleted from the source.
+
+See move() for a description of the arguments. The arguments are checked when called, before anything is moved.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the operation.
+'''
+
+
+def iterMove(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+             followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto', bufferSize=None,
+             compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False, durability='none',
+             progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    _checkOptions(cloneMode, compare, durability, schedule, maxBytesPerSec, maxFilesPerSec)
+    return _iterMove(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                     forceOverwrite, preserveStats, workers, cloneMode, bufferSize, compare, deltaThreshold,
+                     resumeThreshold, atomic, durability, progress, dryRun, schedule, maxBytesPerSec, maxFilesPerSec)
+
+
+'''
+Implements iterMove(). See move() for a description of the arguments.
+'''
+
+
+def _iterMove(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+              followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto',
+              bufferSize=None, compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False,
+              durability='none', progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None,
+              maxFilesPerSec=None):
     # Always work with absolute paths
     src = os.path.abspath(src)
     dst = os.path.abspath(dst)
 
-    # Attempt to copy everything
-    copyResults = copy(src, dst, includeFiles=includeFiles, includeDirs=includeDirs, excludeFiles=excludeFiles,
-                       excludeDirs=excludeDirs, level=level, followLinks=followLinks, forceOverwrite=forceOverwrite,
-                       preserveStats=preserveStats, detailedResults=True)
+    # Attempt to copy everything, indexing the skipped and failed paths so that each lookup below doesn't scan a list.
+    # Paths are compared without regard to case.
+    treeInfo = {}
+    keepDirs = set()
+    keepFiles = set()
+    for event in _iterCopy(src, dst, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                           forceOverwrite, preserveStats, workers, cloneMode, bufferSize, None, compare,
+                           deltaThreshold, resumeThreshold, atomic, durability, progress, dryRun=dryRun,
+                           schedule=schedule, maxBytesPerSec=maxBytesPerSec, maxFilesPerSec=maxFilesPerSec,
+                           treeInfo=treeInfo):
+        if (event.action in ('failed', 'skipped')):
+            if (event.isDir):
+                keepDirs.add(event.path.lower())
+            else:
+                keepFiles.add(event.path.lower())
+        yield event
+    prunedDirs = treeInfo.get('prunedDirs', set())
+
+    # The normalized paths that would have been removed by a dry run
+    removed = set()
 
     # Delete the source tree. Don't remove anything that was in the list of failed or skipped files/dirs
     for root, dirs, files in os.walk(src, topdown=False):
         relRoot = os.path.relpath(root, src)
 
-        deleteDir = True
-        # Was this directory skipped or failed?
-        for failedDir in copyResults['dirsFailedList']:
-            if (relRoot.lower() == failedDir.lower()):
-                deleteDir = False
-                break
-        for skippedDir in copyResults['dirsSkippedList']:
-            if (relRoot.lower() == skippedDir.lower()):
-                deleteDir = False
-                break
+        # Directories beneath a pruned directory were never visited by the copy and are skipped along with it
+        if (_isWithinDirs(relRoot, prunedDirs)):
+            continue
 
-        if (deleteDir):
+        # Was this directory skipped or failed?
+        if (relRoot.lower() not in keepDirs):
             # Attempt to delete all files in directory
             for file in files:
                 filePath = os.path.join(root, file)
@@ -592,59 +1317,43 @@ def move(src, dst, includeFiles=None, includeDirs=None, excludeFiles=None, exclu
                 if (not os.path.lexists(filePath)):
                     continue
 
-                deleteFile = True
                 # Was the file skipped or failed?
-                for failedFile in copyResults['filesFailedList']:
-                    if (relFilePath.lower() == failedFile.lower()):
-                        deleteFile = False
-                        break
-                for skippedFile in copyResults['filesSkippedList']:
-                    if (relFilePath.lower() == skippedFile.lower()):
-                        deleteFile = False
-                        break
-
-                if (deleteFile):
+                if (relFilePath.lower() not in keepFiles):
                     try:
-                        os.remove(filePath)
+                        if (dryRun):
+                            logger.info("Would remove: %s", filePath)
+                            removed.add(os.path.normpath(relFilePath))
+                        else:
+                            os.remove(filePath)
+                        yield CopyEvent('removed', relFilePath)
                     except (IOError, OSError):
-                        copyResults['filesFailedList'].append(relFilePath)
+                        yield CopyEvent('failed', relFilePath)
 
             # If all files were deleted it is safe to delete the directory
-            dirlist = os.listdir(root)
+            dirlist = [name for name in os.listdir(root)
+                       if os.path.normpath(os.path.join(relRoot, name)) not in removed]
             if (len(dirlist) == 0):
-                if (os.path.islink(root)):
+                if (dryRun):
+                    logger.info("Would remove: %s", root)
+                    removed.add(relRoot)
+                    yield CopyEvent('removed', relRoot, isDir=True)
+                elif (os.path.islink(root)):
                     os.unlink(root)
+                    yield CopyEvent('removed', relRoot, isDir=True)
                 else:
                     try:
                         os.rmdir(root)
+                        yield CopyEvent('removed', relRoot, isDir=True)
                     except (IOError, OSError):
-                        copyResults['dirsFailed'].append(root)
-
-    # Transpose results and return
-    results = {}
-    results['filesMoved'] = copyResults['filesCopied']
-    results['filesFailed'] = copyResults['filesFailed']
-    results['filesSkipped'] = copyResults['filesSkipped']
-    results['dirsMoved'] = copyResults['dirsCopied']
-    results['dirsFailed'] = copyResults['dirsFailed']
-    results['dirsSkipped'] = copyResults['dirsSkipped']
-    if (detailedResults):
-        results['filesMovedList'] = copyResults['filesCopiedList']
-        results['filesFailedList'] = copyResults['filesFailedList']
-        results['filesSkippedList'] = copyResults['filesSkippedList']
-        results['dirsMovedList'] = copyResults['dirsCopiedList']
-        results['dirsFailedList'] = copyResults['dirsFailedList']
-        results['dirsSkippedList'] = copyResults['dirsSkippedList']
-
-    return results
+                        yield CopyEvent('failed', relRoot, isDir=True)
 
 
 '''
 Synchronizes all files and folders between the two given paths.
 
-This is equivalent to making the following calls:
-copy(path1, path2)
-copy(path2, path1)
+Both trees are walked together once. Files and directories found in only one of the paths are copied to the other, and
+files found in both are copied from whichever path has the newer version. Files with the same modification time in
+both paths are skipped, as are directories that already exist in both.
 
 :type path1:string
 :param path1: The first path to synchronize
@@ -671,16 +1380,17 @@ copy(path2, path1)
                     Regex patterns must be prefixed with re:
 
 :type level:int
-:param level: The maximum depth to traverse in the source directory tree.
+:param level: The maximum depth to traverse in the directory trees.
                A value of 0 traverses the entire tree.
-               A positive value traverses N levels from the top with value 1 being the source root.
-               A negative value traverses N levels from the bottom of the source tree.
+               A positive value traverses N levels from the top with value 1 being the root of the paths.
+               A negative value traverses N levels from the bottom of the deeper of the two trees.
 
 :type followLinks:bool
 :param followLinks: Set to true to traverse through symbolic links.
 
 :type forceOverwrite:bool
-:param forceOverwrite: Set to true to overwrite destination files even if they are newer.
+:param forceOverwrite: Set to true to copy files found in both paths from path1 to path2 even if the file in path2 is
+                       newer.
 
 :type preserveStats:bool
 :param preserveStats: Set to True to copy the source file stats to the destination.
@@ -689,95 +1399,817 @@ copy(path2, path1)
 :param detailedResults: Set to True to include additional details in the results containing a list of all files and
                         directories that were skipped or failed during the operation.
 
+:type workers:int
+:param workers: The number of threads used to copy files in parallel. A value of 1 or less copies one file at a time.
+
+:type cloneMode:string
+:param cloneMode: Controls copy-on-write cloning of file contents on filesystems that support it (e.g. btrfs, XFS).
+                  'auto' attempts to clone each file and falls back to copying the data when cloning is refused.
+                  'always' fails any file that cannot be cloned, leaving its existing destination untouched, as
+                  the clone is made to a temporary file first. 'never' always copies the data.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used when file contents must be copied through userspace. When
+                   None the buffer size is chosen for each file based on its size and the filesystem block size.
+
+:type deltaThreshold:int
+:param deltaThreshold: The size in bytes from which files that already exist at the destination are updated in place,
+                       comparing the destination block by block and rewriting only the blocks that changed. This saves
+                       writes for large files with small changes, e.g. disk images, at the cost of reading the whole
+                       destination. On a network filesystem that transfers as much data as a plain rewrite, so an update
+                       only pays off when few blocks changed. Data inserted or removed mid-file changes every block
+                       after it. An interrupted update leaves the destination partially updated. When None files are
+                       always rewritten in full. Not used when cloneMode is 'always'.
+
+:type resumeThreshold:int
+:param resumeThreshold: The size in bytes from which files are copied resumably. The data is written to a partial file
+                        next to the destination (see PARTIAL_SUFFIX) that is renamed into place once complete, with a
+                        checkpoint of the copied length and its hash saved every CHECKPOINT_MIB. A copy that was
+                        interrupted continues from its last checkpoint on the next run once the partial data has been
+                        verified against the hash. When None files are never copied resumably. Files updated in place
+                        with deltaThreshold and files that must be cloned are not copied resumably.
+                        A file whose source changes while it is copied fails, and its partial data is dropped.
+
+:type atomic:bool
+:param atomic: Set to True to write each file to a temporary file next to the destination (see TEMP_SUFFIX) and rename
+               it over the destination once its contents and stats are complete, so that the destination is never
+               seen partially written. Files are then never updated in place with deltaThreshold.
+
+:type durability:string
+:param durability: Controls how copied files are flushed to disk. One of DURABILITY_MODES. 'none' leaves it to the
+                   operating system. 'file' syncs the contents of each file before it is renamed into place or
+                   completed. 'dir' does everything 'file' does and also syncs each destination directory once after all
+                   of its files are copied, so that new and renamed file entries survive a crash. It makes more sync
+                   calls than 'file', not fewer, as the files are still synced one by one. 'end' syncs each destination
+                   filesystem once all files are copied instead of syncing individual files, which batches the syncs and
+                   is much faster for many small files (on platforms without syncfs all filesystems are synced). The
+                   time spent syncing is reported as 'durabilityTime'.
+
+:type progress:ProgressReporter
+:param progress: The reporter to report the progress of the operation to. When None the progress is displayed on the
+                 terminal if the logger has a handler writing to one at the INFO level, and not tracked otherwise.
+
+:type dryRun:bool
+:param dryRun: Set to True to report what the operation would do without changing anything. Every file and directory
+               goes through the same checks and gets the same result it would get, but only their metadata is read
+               (and the contents of files compared by hash) and nothing is created, written or removed.
+
+:type schedule:string
+:param schedule: Controls the order in which files are handed to the workers when copying in parallel. One of
+                 SCHEDULE_MODES. 'fifo' copies files in the order they are found. 'size' reserves a quarter of the
+                 workers for files of at least LARGE_FILE_MIB and hands small files to the others in batches, so that
+                 a few large files don't hold up the small ones or the reverse. The number, total size and total copy
+                 time of the small and large files copied are reported in 'sizeStats', and the duration of the whole
+                 operation as 'elapsedTime'.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The most bytes per second to copy, shared by all workers and files of the operation, or None for
+                       no limit. May also be a function taking no arguments that returns the current limit or None,
+                       which is called every RATE_POLL_SECONDS so that a long operation can be throttled while it runs.
+                       Cloned files don't count towards the limit as their data isn't copied.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The most files per second to copy, shared by all workers of the operation, or None for no limit.
+                       May also be a function returning the current limit, as with maxBytesPerSec.
+
+:type compare:string
+:param compare: Controls how files found in both paths are found to be identical. One of COMPARE_MODES. 'mtime'
+                treats files with the same modification time as identical. 'size+mtime' also requires their sizes to
+                match. 'hash' compares the contents of files of the same size regardless of their modification times.
+                Files that differ but have the same modification time are reported as failed as neither can be
+                picked as the newer version.
+
 :rtype:dict
 :return: Returns a dictionary containing the following stats:
-         'filesCopied':int, 'filesFailed':int, 'filesSkipped':int, 'dirsCopied':int, 'dirsFailed':int, 'dirsSkipped':int
+         'filesCopied':int, 'filesFailed':int, 'filesSkipped':int, 'dirsCopied':int, 'dirsFailed':int, 'dirsSkipped':int,
+         'copyMethods':dict, 'durabilityTime':float, 'sizeStats':dict, 'elapsedTime':float
          If detailedResults is set to True also includes the following:
-         'filesFailedList':list, 'filesSkippedList':list, 'dirsFailedList':list, 'dirsSkippedList':list
+         'filesCopiedList':list, 'filesFailedList':list, 'filesSkippedList':list,
+         'dirsCopiedList':list, 'dirsFailedList':list, 'dirsSkippedList':list
 '''
 
 
 def sync(path1, path2, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
-         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False):
-    # Always work with absolute paths
-    path1 = os.path.abspath(path1)
-    path2 = os.path.abspath(path2)
+         followLinks=False, forceOverwrite=False, preserveStats=True, detailedResults=False, workers=1,
+         cloneMode='auto', bufferSize=None, compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False,
+         durability='none', progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    results = _createResults(detailedResults)
+    for event in iterSync(path1, path2, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                          forceOverwrite, preserveStats, workers, cloneMode, bufferSize, compare, deltaThreshold,
+                          resumeThreshold, atomic, durability, progress, dryRun, schedule, maxBytesPerSec,
+                          maxFilesPerSec):
+        _addEvent(results, event, detailedResults)
+    return _finishResults('sync', results, detailedResults)
 
-    results = copy(path1, path2, includeFiles=includeFiles, includeDirs=includeDirs, excludeFiles=excludeDirs,
-                   level=level, followLinks=followLinks, forceOverwrite=forceOverwrite, preserveStats=preserveStats,
-                   detailedResults=True)
-    results2 = copy(path2, path1, includeFiles=includeFiles, includeDirs=includeDirs, excludeFiles=excludeDirs,
-                    level=level, followLinks=followLinks, forceOverwrite=forceOverwrite, preserveStats=preserveStats,
-                    detailedResults=True)
-
-    # Add new entries from results2 to the various lists of results
-    for dpath in results2['filesCopiedList']:
-        addPath = True
-        for spath in results['filesCopiedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['filesCopiedList'].append(dpath)
-    for dpath in results2['filesFailedList']:
-        addPath = True
-        for spath in results['filesFailedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['filesFailedList'].append(dpath)
-    for dpath in results2['filesSkippedList']:
-        addPath = True
-        for spath in results['filesSkippedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['filesSkippedList'].append(dpath)
-    for dpath in results2['dirsCopiedList']:
-        addPath = True
-        for spath in results['dirsCopiedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['dirsCopiedList'].append(dpath)
-    for dpath in results2['dirsFailedList']:
-        addPath = True
-        for spath in results['dirsFailedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['dirsFailedList'].append(dpath)
-    for dpath in results2['dirsSkippedList']:
-        addPath = True
-        for spath in results['dirsSkippedList']:
-            if (spath == dpath):
-                addPath = False
-                break
-        if (addPath):
-            results['dirsSkippedList'].append(dpath)
-
-    # Update the stats
-    results['filesCopied'] = len(results['filesCopiedList'])
-    results['filesFailed'] = len(results['filesFailedList'])
-    results['filesSkipped'] = len(results['filesSkippedList'])
-    results['dirsCopied'] = len(results['dirsCopiedList'])
-    results['dirsFailed'] = len(results['dirsFailedList'])
-    results['dirsSkipped'] = len(results['dirsSkippedList'])
-
-    # If detailedResults was not desired remove those entries from the results
-    if (not detailedResults):
-        results['filesCopiedList'] = None
-        results['filesFailedList'] = None
-        results['filesSkippedList'] = None
-        results['dirsCopiedList'] = None
-        results['dirsFailedList'] = None
-        results['dirsSkippedList'] = None
 
-    return results
+'''
+Synchronizes the contents of two paths like sync(), yielding a CopyEvent for each file and directory as soon as it has
+been handled. Paths are relative to both sides, whichever direction they were copied in.
+
+See sync() for a description of the arguments. The arguments are checked when called, before anything is copied.
+
+:rtype:generator
+:return: A generator of the CopyEvent records of the operation.
+'''
+
+
+def iterSync(path1, path2, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+             followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto', bufferSize=None,
+             compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False, durability='none',
+             progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    _checkOptions(cloneMode, compare, durability, schedule, maxBytesPerSec, maxFilesPerSec)
+    return _iterSync(path1, path2, includeFiles, includeDirs, excludeFiles, excludeDirs, level, followLinks,
+                     forceOverwrite, preserveStats, workers, cloneMode, bufferSize, compare, deltaThreshold,
+                     resumeThreshold, atomic, durability, progress, dryRun, schedule, maxBytesPerSec, maxFilesPerSec)
+
+
+'''
+Implements iterSync(). See sync() for a description of the arguments.
+'''
+
+
+def _iterSync(path1, path2, includeFiles=None, includeDirs=None, excludeFiles=None, excludeDirs=None, level=0,
+              followLinks=False, forceOverwrite=False, preserveStats=True, workers=1, cloneMode='auto',
+              bufferSize=None, compare='mtime', deltaThreshold=None, resumeThreshold=None, atomic=False,
+              durability='none', progress=None, dryRun=False, schedule='fifo', maxBytesPerSec=None,
+              maxFilesPerSec=None):
+    # Always work with absolute paths
+    path1 = os.path.abspath(path1)
+    path2 = os.path.abspath(path2)
+
+    # Compile the provided patterns once for the whole operation
+    fileMatcher = PathMatcher(includeFiles, excludeFiles, True)
+    dirMatcher = PathMatcher(includeDirs, excludeDirs, False)
+
+    if (progress == None and not dryRun):
+        progress = _getDefaultProgress()
+
+    # The rate limits are shared by the copies in both directions
+    limiter = None
+    if ((maxBytesPerSec != None or maxFilesPerSec != None) and not dryRun):
+        limiter = _RateLimiter(maxBytesPerSec, maxFilesPerSec)
+
+    # Files are copied in whichever direction is needed once both sides of them have been seen
+    if (dryRun):
+        queue = _PlanQueue()
+    else:
+        queue = _CopyQueue(workers, schedule=schedule)
+    copyArgs = dict(matcher=fileMatcher, progress=progress, preserveStats=preserveStats, cloneMode=cloneMode,
+                    bufferSize=bufferSize, deltaThreshold=deltaThreshold, resumeThreshold=resumeThreshold,
+                    atomic=atomic, durability=durability, limiter=limiter)
+
+    # The directories to sync, or whose filesystems to sync, once all files have been copied
+    syncDirs = None
+    if (durability in ('dir', 'end') and not dryRun):
+        syncDirs = set()
+        copyArgs['syncDirs'] = syncDirs
+
+    # Files of the same size found in both paths are hashed to compare their contents
+    hashCache = None
+    if (compare == 'hash'):
+        hashCache = _HashCache()
+
+    isDir1 = os.path.isdir(path1)
+    isDir2 = os.path.isdir(path2)
+    try:
+        if (_isSamePath(path1, path2)):
+            logger.error("Cannot perform a sync of the same location.")
+            yield CopyEvent('failed', '.', isDir=True)
+        elif ((isDir1 and os.path.lexists(path2) and not isDir2) or
+              (isDir2 and os.path.lexists(path1) and not isDir1)):
+            logger.error("Cannot sync a directory with a file: %s <=> %s", path1, path2)
+            yield CopyEvent('failed', path1)
+        elif (isDir1 or isDir2):
+            # Make sure both directories exist
+            if (not isDir1):
+                queue.makeDir(path1)
+            if (not isDir2):
+                queue.makeDir(path2)
+
+            # As with copy() the max depth must be known up front when the level is negative
+            tree = _walkJointTree(path1, path2, followLinks)
+            maxDepth = 0
+            if (level < 0):
+                tree, maxDepth = _indexTree(tree)
+
+            # Directories whose entire subtree is skipped. Their contents are never listed.
+            prunedDirs = set()
+
+            # Walk both trees together from the top down. Each directory is listed once on each side and every entry
+            # is compared against its counterpart to decide which way, if any, it needs to be copied.
+            for roots, relRoot, dirs, files, entries in tree:
+                # A captured walk still includes the contents of pruned directories
+                if (relRoot != '.' and (os.path.dirname(relRoot) or '.') in prunedDirs):
+                    prunedDirs.add(relRoot)
+                    continue
+
+                logger.debug("Processing Directory: %s", relRoot)
+
+                # Are the roots symlinks? Should we follow?
+                if (not followLinks and relRoot == '.' and (os.path.islink(path1) or os.path.islink(path2))):
+                    logger.info("Skipped: %s", relRoot)
+                    yield CopyEvent('skipped', relRoot, isDir=True)
+                    continue
+
+                # Exclude items not at the desired depth or not matching the directory patterns
+                skip, prune = _checkDirectory(relRoot, level, maxDepth, dirMatcher)
+                if (skip):
+                    logger.info("Skipped: %s", relRoot)
+                    yield CopyEvent('skipped', relRoot, isDir=True)
+                    if (prune):
+                        prunedDirs.add(relRoot)
+                        dirs[:] = []
+                    continue
+
+                # Make sure the directory exists on both sides
+                root1, root2 = roots
+                entries1, entries2 = entries
+                if (relRoot != '.'):
+                    if (entries1 != None and entries2 != None):
+                        logger.info("Skipped: %s", relRoot)
+                        yield CopyEvent('skipped', relRoot, isDir=True)
+                    else:
+                        dstRoot = root1
+                        if (entries2 == None):
+                            dstRoot = root2
+
+                        if (queue.makeDir(dstRoot)):
+                            yield CopyEvent('copied', relRoot, isDir=True)
+                            if (syncDirs != None):
+                                syncDirs.add(os.path.dirname(dstRoot))
+                        else:
+                            logger.error("Failed: %s", relRoot)
+                            yield CopyEvent('failed', relRoot, isDir=True)
+                            continue
+
+                for name in files:
+                    # The partial data of resumable and atomic copies belongs to the copy that will replace it
+                    if ((resumeThreshold != None and
+                            name.endswith((PARTIAL_SUFFIX, PARTIAL_SUFFIX + CHECKPOINT_SUFFIX))) or
+                            (atomic and name.endswith(TEMP_SUFFIX))):
+                        continue
+
+                    entry1 = None
+                    if (entries1 != None):
+                        entry1 = entries1.get(name)
+                    entry2 = None
+                    if (entries2 != None):
+                        entry2 = entries2.get(name)
+
+                    for event in _syncFile(queue, os.path.join(relRoot, name), os.path.join(root1, name),
+                                           os.path.join(root2, name), _statEntry(entry1), _statEntry(entry2), entry1,
+                                           entry2, forceOverwrite, copyArgs, compare, hashCache):
+                        yield event
+        elif (os.path.lexists(path1) or os.path.lexists(path2)):
+            # Synchronize a pair of files
+            for event in _syncFile(queue, path1, path1, path2, _statPath(path1), _statPath(path2), None, None,
+                                   forceOverwrite, copyArgs, compare, hashCache):
+                yield event
+        else:
+            logger.error("Source path is not valid: %s", path1)
+            yield CopyEvent('failed', path1)
+
+        # Wait for all remaining copies to finish
+        for event in queue.finish():
+            yield event
+    finally:
+        # Stop the workers even when the caller stops consuming the events early
+        queue.finish(cancel=True)
+
+    if (progress != None):
+        progress.finish()
+
+    if (syncDirs != None):
+        syncTime = _flushDestination(syncDirs, durability)
+        if (syncTime != None):
+            yield CopyEvent('synced', '.', isDir=True, elapsed=syncTime)
+
+
+'''
+A record of what happened to a single file or directory during an operation, as yielded by iterCopy(), iterMirror(),
+iterMove() and iterSync().
+
+:type action:string
+:param action: One of EVENT_ACTIONS. 'synced' reports the time spent syncing the destination at the end of an operation
+               with durability 'dir' or 'end'.
+
+:type path:string
+:param path: The path of the file or directory, relative to the root of the operation.
+
+:type isDir:bool
+:param isDir: True if the path is a directory.
+
+:type size:int
+:param size: The size in bytes of the source file, when known.
+
+:type elapsed:float
+:param elapsed: The time in seconds spent copying the file, or syncing the destination for a 'synced' event.
+
+:type method:string
+:param method: The method used to copy the file contents, one of COPY_METHODS, or None.
+
+:type syncTime:float
+:param syncTime: The time in seconds spent syncing the file to disk.
+'''
+
+
+class CopyEvent(object):
+    __slots__ = ('action', 'path', 'isDir', 'size', 'elapsed', 'method', 'syncTime')
+
+    def __init__(self, action, path, isDir=False, size=0, elapsed=0.0, method=None, syncTime=0.0):
+        self.action = action
+        self.path = path
+        self.isDir = isDir
+        self.size = size
+        self.elapsed = elapsed
+        self.method = method
+        self.syncTime = syncTime
+
+    def __repr__(self):
+        return "CopyEvent(%r, %r, isDir=%r, size=%r, elapsed=%r, method=%r)" % (self.action, self.path, self.isDir,
+                                                                              self.size, self.elapsed, self.method)
+
+
+'''
+The plan of a copy or mirror operation, made by planCopy() or planMirror() without copying or removing anything. The
+plan holds an entry for each file and directory in the order the operation reaches them, as the CopyEvent it would get:
+'copied' for the directories to create and the files to copy, 'skipped' and 'failed' for those left alone and
+'removed' for the destination files and directories a mirror removes. The totals are known before anything is copied,
+so the plan can be reviewed, saved with save() and handed to copy() or mirror() to carry out, e.g.
+
+    plan = pyrocopy.planMirror(src, dst)
+    print(plan.totalFiles, plan.totalBytes, len(plan.removals))
+    pyrocopy.mirror(src, dst, plan=plan)
+
+:type operation:string
+:param operation: The operation the plan is for, 'copy' or 'mirror'.
+
+:type src:string
+:param src: The absolute source path of the operation.
+
+:type dst:string
+:param dst: The absolute destination path of the operation.
+'''
+
+
+class CopyPlan(object):
+
+    def __init__(self, operation, src, dst):
+        self.operation = operation
+        self.src = src
+        self.dst = dst
+        self.entries = []
+        self.totalFiles = 0
+        self.totalBytes = 0
+
+    '''
+    Adds an entry to the plan.
+
+    :type event:CopyEvent
+    :param event: The event the file or directory would get.
+    '''
+
+    def add(self, event):
+        self.entries.append(event)
+        if (event.action == 'copied' and not event.isDir):
+            self.totalFiles += 1
+            self.totalBytes += event.size
+
+    '''
+    The files to copy as tuples of their path and size in bytes.
+
+    :rtype:list
+    :return: The list of the files to copy.
+    '''
+
+    @property
+    def files(self):
+        return [(e.path, e.size) for e in self.entries if e.action == 'copied' and not e.isDir]
+
+    '''
+    The directories to create at the destination, or that already exist there.
+
+    :rtype:list
+    :return: The list of the paths of the directories.
+    '''
+
+    @property
+    def dirs(self):
+        return [e.path for e in self.entries if e.action == 'copied' and e.isDir]
+
+    '''
+    The files and directories to remove from the destination.
+
+    :rtype:list
+    :return: The list of the CopyEvent records of the paths to remove.
+    '''
+
+    @property
+    def removals(self):
+        return [e for e in self.entries if e.action == 'removed']
+
+    '''
+    Converts the plan to a dictionary of plain types that can be serialized, e.g. as JSON. Each entry is a list of its
+    action, path, whether it's a directory and its size.
+
+    :rtype:dict
+    :return: The dictionary of the plan.
+    '''
+
+    def toDict(self):
+        return dict(version=PLAN_VERSION, operation=self.operation, src=self.src, dst=self.dst,
+                    totalFiles=self.totalFiles, totalBytes=self.totalBytes,
+                    entries=[[e.action, e.path, e.isDir, e.size] for e in self.entries])
+
+    '''
+    Creates a plan from a dictionary returned by toDict().
+
+    :type data:dict
+    :param data: The dictionary of the plan.
+
+    :rtype:CopyPlan
+    :return: The plan.
+    '''
+
+    @staticmethod
+    def fromDict(data):
+        if (data.get('version') != PLAN_VERSION):
+            raise ValueError("Unsupported plan version: %r" % data.get('version'))
+
+        plan = CopyPlan(data['operation'], data['src'], data['dst'])
+        for action, path, isDir, size in data['entries']:
+            if (action not in EVENT_ACTIONS):
+                raise ValueError("Invalid plan entry action: %r" % action)
+            plan.add(CopyEvent(action, path, isDir, size))
+        return plan
+
+    '''
+    Saves the plan to a JSON file.
+
+    :type path:string
+    :param path: The path of the file to write.
+    '''
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.toDict(), f)
+
+    '''
+    Loads a plan saved by save().
+
+    :type path:string
+    :param path: The path of the file to read.
+
+    :rtype:CopyPlan
+    :return: The plan.
+    '''
+
+    @staticmethod
+    def load(path):
+        with open(path, 'r') as f:
+            return CopyPlan.fromDict(json.load(f))
+
+    def __repr__(self):
+        return "CopyPlan(%r, %r, %r, totalFiles=%r, totalBytes=%r)" % (self.operation, self.src, self.dst,
+                                                                       self.totalFiles, self.totalBytes)
+
+
+'''
+Reports the progress of operations, aggregated across all files and worker threads. The bytes copied are counted as
+they are written, and the progress is reported at most once every interval seconds along with the average copy rate
+and the estimated time remaining. Without a total the estimate covers the files currently being copied.
+
+By default the progress is written to the given stream on a single line. Override report() to display it differently,
+e.g.
+
+    class MyReporter(ProgressReporter):
+        def report(self, bytesCopied, bytesPerSec, eta):
+            progressBar.setValue(bytesCopied)
+
+    pyrocopy.copy(src, dst, progress=MyReporter())
+
+:type stream:file
+:param stream: The stream to write the progress to, or None.
+
+:type interval:float
+:param interval: The minimum time in seconds between two reports.
+
+:type totalBytes:int
+:param totalBytes: The total number of bytes expected to be copied, if known.
+'''
+
+
+class ProgressReporter(object):
+
+    def __init__(self, stream=None, interval=0.1, totalBytes=None):
+        self.stream = stream
+        self.interval = interval
+        self.totalBytes = totalBytes
+        self.bytesCopied = 0
+        self.bytesPending = 0
+        self.startTime = None
+        self._nextReport = 0.0
+        self._lineLength = 0
+        self._lock = threading.Lock()
+
+    '''
+    Reports the start of the copy of a file.
+
+    :type size:int
+    :param size: The size of the file in bytes.
+
+    :rtype:_FileProgress
+    :return: The progress of the file to report the bytes copied to.
+    '''
+
+    def startFile(self, size):
+        with self._lock:
+            if (self.startTime == None):
+                self.startTime = time.perf_counter()
+            self.bytesPending += size
+        return _FileProgress(self, size)
+
+    '''
+    Reports bytes as copied. Thread safe and cheap to call for every chunk of data.
+
+    :type count:int
+    :param count: The number of bytes copied since the last update.
+    '''
+
+    def update(self, count):
+        with self._lock:
+            self.bytesCopied += count
+            self.bytesPending -= count
+            now = time.perf_counter()
+            if (now >= self._nextReport):
+                self._nextReport = now + self.interval
+                self._report(now)
+
+    '''
+    Reports the end of the copy of a file.
+
+    :type remaining:int
+    :param remaining: The number of bytes of the file that weren't copied.
+    '''
+
+    def finishFile(self, remaining=0):
+        with self._lock:
+            self.bytesPending -= remaining
+
+    '''
+    Reports the end of an operation. The final progress is reported and the line written to the stream is ended.
+    '''
+
+    def finish(self):
+        with self._lock:
+            if (self.startTime != None):
+                self._report(time.perf_counter())
+            if (self._lineLength > 0):
+                self.stream.write("\n")
+                self.stream.flush()
+                self._lineLength = 0
+
+    '''
+    Displays the progress. Called at most once every interval seconds, never from two threads at once.
+
+    :type bytesCopied:int
+    :param bytesCopied: The total number of bytes copied.
+
+    :type bytesPerSec:float
+    :param bytesPerSec: The average number of bytes copied per second.
+
+    :type eta:float
+    :param eta: The estimated time remaining in seconds, or None if unknown.
+    '''
+
+    def report(self, bytesCopied, bytesPerSec, eta):
+        if (self.stream == None):
+            return
+
+        line = "%s copied, %s/s" % (_formatSize(bytesCopied), _formatSize(bytesPerSec))
+        if (eta != None):
+            line += ", %d:%02d:%02d remaining" % (eta // 3600, eta // 60 % 60, eta % 60)
+
+        # Pad with spaces to overwrite any longer line reported before
+        self.stream.write("\r" + line.ljust(self._lineLength))
+        self.stream.flush()
+        self._lineLength = len(line)
+
+    def _report(self, now):
+        elapsed = now - self.startTime
+        bytesPerSec = 0.0
+        if (elapsed > 0):
+            bytesPerSec = self.bytesCopied / elapsed
+
+        eta = None
+        remaining = self.bytesPending
+        if (self.totalBytes != None):
+            remaining = self.totalBytes - self.bytesCopied
+        if (bytesPerSec > 0):
+            eta = max(remaining, 0) / bytesPerSec
+        self.report(self.bytesCopied, bytesPerSec, eta)
+
+
+'''
+Matches paths against a set of include and exclude patterns. Patterns are compiled once when the matcher is created.
+Matching a path then normalizes every pattern for the depth of the path (see _normalizeDirPattern and
+_normalizeFilePattern) and combines them into a single regular expression for each kind of pattern. The combined
+expressions are cached by depth, so each path is tested against a precompiled expression instead of every pattern
+being rebuilt for every path.
+
+A matcher can be used on its own, e.g.
+
+    matcher = PathMatcher(includes=['*.txt', 're:notes[0-9]+'], isFile=True)
+    matcher.shouldCopy(os.path.join('Level1', 'MyFile.txt'))
+
+:type includes:array
+:param includes: A list of regex and wildcard patterns of paths to include. Paths not matching at least one pattern in
+                 the include list are rejected. Regex patterns must be prefixed with re: or be compiled regex objects.
+
+:type excludes:array
+:param excludes: A list of regex and wildcard patterns of paths to exclude. Regex patterns must be prefixed with re: or
+                 be compiled regex objects.
+
+:type isFile:bool
+:param isFile: Set to True if the matched paths are files, False if they are directories.
+'''
+
+
+class PathMatcher(object):
+
+    def __init__(self, includes=None, excludes=None, isFile=False):
+        self.isFile = isFile
+        self.includes = PathMatcher._compilePatterns(includes)
+        self.excludes = PathMatcher._compilePatterns(excludes)
+        self._depthCache = {}
+        self._subtreeCache = {}
+
+    '''
+    Determines if the given path matches at least one of the include patterns.
+
+    :type path:string
+    :param path: The path to check.
+
+    :rtype:bool
+    :return: Returns True if the path matches an include pattern, otherwise False.
+    '''
+
+    def isIncluded(self, path):
+        return PathMatcher._matchAny(self._getMatchers(path)[0], path)
+
+    '''
+    Determines if the given path matches at least one of the exclude patterns.
+
+    :type path:string
+    :param path: The path to check.
+
+    :rtype:bool
+    :return: Returns True if the path matches an exclude pattern, otherwise False.
+    '''
+
+    def isExcluded(self, path):
+        return PathMatcher._matchAny(self._getMatchers(path)[1], path)
+
+    '''
+    Determines if the given path will be copied. When include patterns are provided the path must match at least one
+    of them, otherwise the path must not match any of the exclude patterns.
+
+    :type path:string
+    :param path: The path to check.
+
+    :rtype:bool
+    :return: Returns True if the path should be copied, otherwise False.
+    '''
+
+    def shouldCopy(self, path):
+        if (len(self.includes) > 0):
+            return self.isIncluded(path)
+        if (len(self.excludes) > 0):
+            return not self.isExcluded(path)
+        return True
+
+    '''
+    Determines if the given directory and everything beneath it are guaranteed to be rejected by shouldCopy(). This is
+    the case when the directory fully matches a wildcard exclude pattern, or a regex exclude pattern that doesn't
+    depend on what follows the match (e.g. using $ or a lookahead), as the same pattern then also matches every
+    subdirectory. A directory that merely fails to match the include patterns may still have subdirectories that do.
+
+    :type path:string
+    :param path: The path of the directory to check.
+
+    :rtype:bool
+    :return: Returns True if the subtree at path can be skipped entirely, otherwise False.
+    '''
+
+    def excludesSubtree(self, path):
+        if (self.isFile or len(self.includes) > 0 or len(self.excludes) == 0):
+            return False
+
+        # Only built when pruning is attempted so that a pattern that can't be anchored never affects matching
+        depth = path.count(os.path.sep)
+        matchers = self._subtreeCache.get(depth)
+        if (matchers == None):
+            matchers = self._buildMatchers(self.excludes, path, True)
+            self._subtreeCache[depth] = matchers
+        return PathMatcher._matchAny(matchers, path)
+
+    '''
+    Compiles the regex patterns (prefixed with re:) in the given list. Wildcard patterns are left as is.
+    '''
+
+    @staticmethod
+    def _compilePatterns(patterns):
+        compiled = []
+        if (patterns != None):
+            for pattern in patterns:
+                if (not isinstance(pattern, _PATTERN_TYPE) and pattern.startswith("re:")):
+                    pattern = re.compile(pattern[3:])
+                compiled.append(pattern)
+        return compiled
+
+    '''
+    Retrieves the combined include and exclude expressions for the depth of the given path, building and caching them
+    the first time a path of that depth is seen.
+    '''
+
+    def _getMatchers(self, path):
+        depth = path.count(os.path.sep)
+        matchers = self._depthCache.get(depth)
+        if (matchers == None):
+            matchers = (self._buildMatchers(self.includes, path), self._buildMatchers(self.excludes, path))
+            self._depthCache[depth] = matchers
+        return matchers
+
+    '''
+    Normalizes the given patterns for the depth of path and combines them into a list of wildcard expressions and a
+    list of regex expressions. Each list usually contains a single alternation of all of its patterns. When subtree is
+    True only the patterns that also match every subdirectory of a path they match are included, and regex patterns
+    must match the whole path. Leading inline flags such as (?i) are kept at the front of the anchored expression, and
+    a regex pattern that still can't be anchored is left out so that nothing is pruned because of it.
+    '''
+
+    def _buildMatchers(self, patterns, path, subtree=False):
+        wildcards = []
+        regexes = []
+        for pattern in patterns:
+            if (self.isFile):
+                normPattern = _normalizeFilePattern(pattern, path)
+            else:
+                normPattern = _normalizeDirPattern(pattern, path)
+
+            if (isinstance(normPattern, _PATTERN_TYPE)):
+                if (not subtree):
+                    regexes.append(normPattern.pattern)
+                elif (_UNBOUNDED_REGEX_PATTERN.search(normPattern.pattern) == None):
+                    flags = _INLINE_FLAGS_PATTERN.match(normPattern.pattern).group(0)
+                    expression = '%s(?:%s)\\Z' % (flags, normPattern.pattern[len(flags):])
+                    try:
+                        re.compile(expression)
+                    except re.error:
+                        continue
+                    regexes.append(expression)
+            else:
+                wildcards.append(fnmatch.translate(os.path.normcase(normPattern)))
+
+        return (PathMatcher._combine(wildcards), PathMatcher._combine(regexes))
+
+    '''
+    Combines the given regular expressions into a single alternation. Expressions that can't be safely combined, such
+    as those using backreferences whose group numbers would shift, are compiled individually instead.
+    '''
+
+    @staticmethod
+    def _combine(expressions):
+        if (len(expressions) > 1 and not any(_BACKREFERENCE_PATTERN.search(exp) for exp in expressions)):
+            try:
+                return [re.compile('|'.join('(?:%s)' % exp for exp in expressions))]
+            except re.error:
+                pass
+        return [re.compile(exp) for exp in expressions]
+
+    '''
+    Determines if the given path matches any of the given wildcard or regex expressions.
+    '''
+
+    @staticmethod
+    def _matchAny(matchers, path):
+        wildcards, regexes = matchers
+        if (len(wildcards) > 0):
+            normPath = os.path.normcase(path)
+            for expression in wildcards:
+                if (expression.match(normPath) != None):
+                    return True
+
+        if (len(regexes) > 0):
+            # The patterns will have '/' path separators (even on Windows). Make sure the path does too.
+            rePath = path
+            if (os.path.sep == '\\'):
+                rePath = path.replace(os.path.sep, '/')
+            for expression in regexes:
+                if (expression.match(rePath) != None):
+                    return True
+
+        return False
 
 
 '''
@@ -807,6 +2239,185 @@ def _isSamePath(src, dst):
             os.path.normcase(os.path.abspath(dst)))
 
 
+'''
+Checks if the two given stat results refer to the same file.
+
+:type srcStat:os.stat_result
+:param srcStat: The stat info of the source path.
+
+:type dstStat:os.stat_result
+:param dstStat: The stat info of the destination path.
+
+:type src:string
+:param src: The source path, used when the stat info doesn't identify the file.
+
+:type dst:string
+:param dst: The destination path, used when the stat info doesn't identify the file.
+
+:rtype:bool
+:return: Returns True if src and dst are the same file, otherwise False.
+'''
+
+
+def _isSameFile(srcStat, dstStat, src, dst):
+    # Some platforms (e.g. Windows) don't provide inode numbers in cached directory entries
+    if (srcStat.st_ino == 0 or dstStat.st_ino == 0):
+        return _isSamePath(src, dst)
+
+    return (srcStat.st_dev == dstStat.st_dev and srcStat.st_ino == dstStat.st_ino)
+
+
+'''
+Walks the directory tree rooted at the given path from the top down, like os.walk(), using os.scandir.
+
+Rather than names, the directory entries found are returned. These cache the file type and (depending on the
+platform) the stat info of each entry so that they don't need to be queried again. As with os.walk() the caller can
+remove entries from dirs to prune them from the walk.
+
+:type path:string
+:param path: The path of the directory to walk.
+
+:type followLinks:bool
+:param followLinks: Set to True to descend into symbolic links to directories.
+
+:type relRoot:string
+:param relRoot: The path of the directory relative to the top of the walk.
+
+:rtype:generator
+:return: Yields a tuple (root, relRoot, dirs, files) for each directory where dirs and files are lists of os.DirEntry.
+         relRoot is '.' for the top of the walk.
+'''
+
+
+def _walkTree(path, followLinks=False, relRoot='.'):
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            isDir = entry.is_dir()
+        except OSError:
+            isDir = False
+
+        if (isDir):
+            dirs.append(entry)
+        else:
+            files.append(entry)
+
+    yield path, relRoot, dirs, files
+
+    for entry in dirs:
+        if (followLinks or not entry.is_symlink()):
+            childRelRoot = entry.name
+            if (relRoot != '.'):
+                childRelRoot = os.path.join(relRoot, entry.name)
+            for item in _walkTree(entry.path, followLinks, childRelRoot):
+                yield item
+
+
+'''
+Walks two directory trees together from the top down, pairing up the entries found at the same relative path in each.
+A directory found in only one of the trees is still walked, with the missing side reported as None.
+
+As with _walkTree() the caller can remove names from dirs to prune them from the walk. Directories that are symbolic
+links in either tree are only walked when following links.
+
+:type path1:string
+:param path1: The path of the directory to walk in the first tree.
+
+:type path2:string
+:param path2: The path of the directory to walk in the second tree.
+
+:type followLinks:bool
+:param followLinks: Set to True to descend into symbolic links to directories.
+
+:type relRoot:string
+:param relRoot: The path of the directory relative to the top of the walk.
+
+:rtype:generator
+:return: Yields a tuple (roots, relRoot, dirs, files, entries) for each directory. roots is the pair of paths of the
+         directory in each tree, dirs and files are lists of the names of the subdirectories and files found in either
+         tree and entries is a pair of dictionaries mapping the names found in each tree to their os.DirEntry. A
+         dictionary is None when the directory doesn't exist in that tree. A name that is a directory in one tree and a
+         file in the other is included in both dirs and files.
+'''
+
+
+def _walkJointTree(path1, path2, followLinks=False, relRoot='.'):
+    entries = (_scanDir(path1), _scanDir(path2))
+
+    dirs = []
+    files = []
+    seen = set()
+    for side in entries:
+        if (side == None):
+            continue
+        for name in side:
+            if (name in seen):
+                continue
+            seen.add(name)
+
+            isDir = False
+            isFile = False
+            descend = True
+            for other in entries:
+                entry = None
+                if (other != None):
+                    entry = other.get(name)
+                if (entry == None):
+                    continue
+
+                try:
+                    entryIsDir = entry.is_dir()
+                except OSError:
+                    entryIsDir = False
+
+                if (entryIsDir):
+                    isDir = True
+                    if (not followLinks and entry.is_symlink()):
+                        descend = False
+                else:
+                    isFile = True
+
+            if (isDir and descend):
+                dirs.append(name)
+            if (isFile):
+                files.append(name)
+
+    yield (path1, path2), relRoot, dirs, files, entries
+
+    for name in dirs:
+        childRelRoot = name
+        if (relRoot != '.'):
+            childRelRoot = os.path.join(relRoot, name)
+        for item in _walkJointTree(os.path.join(path1, name), os.path.join(path2, name), followLinks, childRelRoot):
+            yield item
+
+
+'''
+Lists the entries of the given directory.
+
+:type path:string
+:param path: The path of the directory to list.
+
+:rtype:dict
+:return: A dictionary mapping the name of each entry to its os.DirEntry, or None if the directory can't be listed.
+'''
+
+
+def _scanDir(path):
+    try:
+        with os.scandir(path) as it:
+            return dict((entry.name, entry) for entry in it)
+    except OSError:
+        return None
+
+
 '''
 Normalizes the given pattern by adding wildcards when path has more levels.
 
@@ -831,13 +2442,19 @@ Given a path 'Level1/Level2/Level3' and a pattern 'Level1' would return 'Level1/
 def _normalizeDirPattern(pattern, path):
     bIsRegex = False
     tmpPattern = pattern
-    if (isinstance(pattern, re._pattern_type)):
+    if (isinstance(pattern, _PATTERN_TYPE)):
         tmpPattern = pattern.pattern
         bIsRegex = True
     elif (pattern.startswith('re:')):
         tmpPattern = pattern[3:]
         bIsRegex = True
 
+    # Inline flags must stay at the start of the expression once it's filled in
+    flags = ''
+    if (bIsRegex):
+        flags = _INLINE_FLAGS_PATTERN.match(tmpPattern).group(0)
+        tmpPattern = tmpPattern[len(flags):]
+
     numPathSep = path.count(os.path.sep)
     numPatternSep = tmpPattern.count(os.path.sep)
 
@@ -854,7 +2471,7 @@ def _normalizeDirPattern(pattern, path):
             numPatternSep = numPatternSep + 1
 
     if (bIsRegex):
-        return re.compile(tmpPattern)
+        return re.compile(flags + tmpPattern)
     else:
         return tmpPattern
 
@@ -888,13 +2505,19 @@ Given a filepath 'Level1/Level2/MyFile.txt' and a pattern 'Level1/*.txt' will re
 def _normalizeFilePattern(pattern, filepath):
     bIsRegex = False
     tmpPattern = pattern
-    if (isinstance(pattern, re._pattern_type)):
+    if (isinstance(pattern, _PATTERN_TYPE)):
         tmpPattern = pattern.pattern
         bIsRegex = True
     elif (pattern.startswith('re:')):
         tmpPattern = pattern[3:]
         bIsRegex = True
 
+    # Inline flags must stay at the start of the expression once it's filled in
+    flags = ''
+    if (bIsRegex):
+        flags = _INLINE_FLAGS_PATTERN.match(tmpPattern).group(0)
+        tmpPattern = tmpPattern[len(flags):]
+
     # Separate the file pattern from the dir/path pattern
     patternParts = os.path.split(tmpPattern)
     tmpPattern = patternParts[0]
@@ -923,7 +2546,7 @@ def _normalizeFilePattern(pattern, filepath):
         tmpPattern = os.path.join(tmpPattern, patternParts[1])
 
     if (bIsRegex):
-        return re.compile(tmpPattern)
+        return re.compile(flags + tmpPattern)
     else:
         return tmpPattern
 
@@ -948,48 +2571,7 @@ given and cannot be excluded
 
 
 def _checkShouldCopy(path, bIsFile, includes, excludes):
-    # The pattern will have '/' path separators (even on Windows). Make sure the path does too.
-    rePath = path
-    if (os.path.sep == '\\'):
-        rePath = path.replace(os.path.sep, '/')
-
-    # Now check the path against the include list.
-    if (includes != None and len(includes) > 0):
-        isIncluded = False
-        for pattern in includes:
-            normPattern = None
-            if (bIsFile):
-                normPattern = _normalizeFilePattern(pattern, path)
-            else:
-                normPattern = _normalizeDirPattern(pattern, path)
-
-            if (isinstance(normPattern, re._pattern_type)):
-                if (normPattern.match(rePath) != None):
-                    isIncluded = True
-                    break
-            else:
-                if (fnmatch.fnmatch(path, normPattern)):
-                    isIncluded = True
-                    break
-        return isIncluded
-
-    # Now check the exclude lists
-    if (excludes != None):
-        for pattern in excludes:
-            normPattern = None
-            if (bIsFile):
-                normPattern = _normalizeFilePattern(pattern, path)
-            else:
-                normPattern = _normalizeDirPattern(pattern, path)
-
-            if (isinstance(normPattern, re._pattern_type)):
-                if (normPattern.match(rePath) != None):
-                    return False
-            else:
-                if (fnmatch.fnmatch(path, normPattern)):
-                    return False
-
-    return True
+    return PathMatcher(includes, excludes, bIsFile).shouldCopy(path)
 
 
 '''
@@ -1001,15 +2583,11 @@ Copies a file from the give source path to the destination.
 :type dst:string
 :param dst: The path of the destination to copy src to.
 
-:type includes:array
-:param includes: The list of compiled inclusive regex patterns to check the source path against.
-
-:type excludes:array
-:param excludes: The list of compiled exclusive regex patterns to check the source path against.
+:type matcher:PathMatcher
+:param matcher: The matcher used to check if the source path should be copied. When None the file is always copied.
 
-:type showProgress:bool
-:param showProgress: Set to True to display real-time progress information about the operation. Progress is only shown
-                     to stdout and stderr.
+:type progress:ProgressReporter
+:param progress: The reporter to report the bytes copied to, or None.
 
 :type forceOverwrite:bool
 :param forceOverwrite: Set to True to overwrite destination files even if they are newer.
@@ -1017,74 +2595,1940 @@ Copies a file from the give source path to the destination.
 :type preserveStats:bool
 :param preserveStats: Set to True to copy the source file stats to the destination.
 
-:rtype:int
-:return: Returns a value 1 if the file was copied, value 0 if the file was skipped and -1 if an error occurred.
-'''
+:type cloneMode:string
+:param cloneMode: One of CLONE_MODES controlling whether the file contents are cloned instead of copied.
 
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used to copy the contents through userspace, or None to size the
+                   buffer adaptively.
 
-def _copyFile(src, dst, includes=None, excludes=None, showProgress=True, forceOverwrite=False, preserveStats=True):
-    # Only copy files
-    if (not os.path.isfile(src)):
-        return -1
+:type compare:string
+:param compare: One of COMPARE_MODES deciding if an existing destination that isn't newer than src is up to date.
 
-    # Don't copy files to the same location
-    if (_isSamePath(src, dst)):
-        return -1
+:type hashCache:_HashCache
+:param hashCache: The cache of file hashes used when compare is 'hash'. When None the files are always hashed.
 
-    # Should the file be copied?
-    if (not _checkShouldCopy(src, True, includes, excludes)):
-        return 0
+:type deltaThreshold:int
+:param deltaThreshold: The size in bytes from which an existing destination is updated in place by rewriting only the
+                       blocks that changed, or None to always rewrite the whole file.
 
-    # Don't overwrite older copies of files unless explicitly desired
-    if (not forceOverwrite and os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)):
-        return 0
+:type resumeThreshold:int
+:param resumeThreshold: The size in bytes from which the file is copied resumably through a partial file, or None to
+                        always write the destination directly.
 
-    # Make sure the directory at the destination exists
-    dstRoot = os.path.split(dst)[0]
-    if (not os.path.isdir(dstRoot)):
-        mkdir(dstRoot)
+:type atomic:bool
+:param atomic: Set to True to write the file to a temporary file that is renamed over the destination once complete.
 
-    # Finally perform the copy
-    logger.info("Copying: %s => %s", src, dst)
-    if (os.path.islink(src)):
+:type durability:string
+:param durability: One of DURABILITY_MODES. When 'file' or 'dir' the contents of the file are synced to disk once
+                   written.
+
+:type syncDirs:set
+:param syncDirs: A set that receives the directory of the destination once the file is copied, so that the caller can
+                 sync each directory once after all of its files are copied. When None directories aren't recorded.
+
+:type stats:dict
+:param stats: An optional dictionary that receives details about the copy. When file contents are copied the key
+              'method' is set to the name of the data path used (see COPY_METHODS). 'srcStat' is set to the stats of
+              the source file once queried and 'upToDate' is set to True when the file is skipped because the
+              destination is already up to date. 'srcHash' is set to the hash of the source file when it is found
+              to be up to date by its hash. 'durabilityTime' is set to the seconds spent syncing the file to disk.
+
+:type srcEntry:os.DirEntry
+:param srcEntry: The directory entry of src from a scan of its parent directory, if available. Its cached stat info
+                 is used instead of querying the source file again.
+
+:type limiter:_RateLimiter
+:param limiter: The rate limits of the operation that the file and the bytes copied count against, or None.
+
+:rtype:int
+:return: Returns a value 1 if the file was copied, value 0 if the file was skipped and -1 if an error occurred.
+'''
+
+
+def _copyFile(src, dst, matcher=None, progress=None, forceOverwrite=False, preserveStats=True,
+              cloneMode='auto', bufferSize=None, compare='mtime', hashCache=None, deltaThreshold=None,
+              resumeThreshold=None, atomic=False, durability='none', syncDirs=None, stats=None, srcEntry=None,
+              limiter=None):
+    result, srcStat, dstStat, isLink = _checkCopyFile(src, dst, matcher, forceOverwrite, compare, hashCache, stats,
+                                                      srcEntry)
+    if (result != None):
+        return result
+
+    # Finally perform the copy. An atomic copy is written to a temporary file that replaces the destination once it is
+    # complete, so that the destination is never seen partially written.
+    logger.info("Copying: %s => %s", src, dst)
+    if (limiter != None):
+        limiter.startFile()
+    writePath = dst
+    if (atomic):
+        writePath = dst + TEMP_SUFFIX
+
+    if (isLink):
         try:
-            os.symlink(os.readlink(src), dst)
+            if (atomic and os.path.lexists(writePath)):
+                os.remove(writePath)
+            _createAtDestination(writePath, os.symlink, os.readlink(src), writePath)
+            if (atomic):
+                os.replace(writePath, dst)
         except (IOError, OSError):
             return -1
-    else:
-        # The number of bytes per read operation
-        global BUFFERSIZE_KIB
-        maxReadLength = BUFFERSIZE_KIB * 1024
+        if (syncDirs != None):
+            syncDirs.add(os.path.dirname(dst))
+        return 1
+
+    # A clone that must be made is also written to a temporary file, so that a clone the filesystem refuses leaves the
+    # existing destination as it was
+    if (cloneMode == 'always'):
+        writePath = dst + TEMP_SUFFIX
+
+    # Large files that already exist at the destination are updated in place, rewriting only the blocks that changed
+    useDelta = (deltaThreshold != None and not atomic and cloneMode != 'always' and dstStat != None and
+                stat.S_ISREG(dstStat.st_mode) and srcStat.st_size >= deltaThreshold)
+
+    # Otherwise large files may be copied through a partial file that a later run can continue from. The partial file
+    # replaces the destination once it is complete, like the temporary file of an atomic copy.
+    useResume = (not useDelta and resumeThreshold != None and cloneMode != 'always' and
+                 srcStat.st_size >= resumeThreshold)
+    sourceChanged = False
+    if (useResume):
+        writePath = dst + PARTIAL_SUFFIX
+
+    # Each file is synced on its own unless the whole filesystem is synced at the end
+    syncFile = durability in ('file', 'dir')
+    syncTime = 0.0
+
+    fileProgress = None
+    if (progress != None):
+        fileProgress = progress.startFile(srcStat.st_size)
+    if (limiter != None):
+        fileProgress = limiter.wrapProgress(fileProgress)
+
+    try:
+        with open(src, 'rb') as fsrc:
+            if (useResume):
+                method, bytesWritten = _copyFileResumable(fsrc, dst, srcStat, fileProgress, bufferSize, cloneMode,
+                                                          syncFile)
+                # The partial data only matches its checkpoint if the source didn't change while it was copied
+                currentStat = os.fstat(fsrc.fileno())
+                sourceChanged = (currentStat.st_size != srcStat.st_size or
+                                 currentStat.st_mtime_ns != srcStat.st_mtime_ns)
+            elif (useDelta):
+                with open(dst, 'r+b') as fdst:
+                    method = 'delta'
+                    bytesWritten = _deltaFileData(fsrc, fdst, srcStat.st_size, fileProgress, bufferSize,
+                                                  getattr(srcStat, 'st_blksize', 0))
+                    if (syncFile):
+                        syncTime = _fsyncFile(fdst)
+            else:
+                with _createAtDestination(writePath, open, writePath, 'wb') as fdst:
+                    method = None
+                    bytesWritten = srcStat.st_size
+                    if (cloneMode != 'never' and _cloneFileData(fsrc, fdst)):
+                        method = 'clone'
+                    elif (cloneMode != 'always'):
+                        method, bytesWritten = _copyFileData(fsrc, fdst, srcStat.st_size, fileProgress, bufferSize,
+                                                             getattr(srcStat, 'st_blksize', 0))
+                    if (method != None and syncFile):
+                        syncTime = _fsyncFile(fdst)
+    except (IOError, OSError):
+        # The partial data of a resumable copy is kept along with its checkpoint for the next attempt to continue from
+        if (writePath != dst and not useResume):
+            _discardFile(writePath)
+        return -1
+    finally:
+        if (fileProgress != None):
+            fileProgress.finish()
+
+    # Don't leave behind the empty file that was opened for a clone that couldn't be made
+    if (method == None):
+        logger.error("Clone failed: %s => %s", src, dst)
+        _discardFile(writePath)
+        return -1
+
+    if (stats != None):
+        stats['method'] = method
+        stats['durabilityTime'] = syncTime
+
+    # Was the copy successful? Partial data of a source that changed can't be continued from, so it's dropped along
+    # with its checkpoint.
+    if (bytesWritten != srcStat.st_size or sourceChanged):
+        if (sourceChanged):
+            logger.error("Source changed while copying: %s", src)
+        if (writePath != dst):
+            _discardFile(writePath)
+        if (useResume):
+            _discardFile(writePath + CHECKPOINT_SUFFIX)
+        return -1
+
+    # Copy file stats
+    if (preserveStats):
+        _copyStats(src, writePath, srcStat)
+
+    # Replace the destination with the completed copy
+    if (writePath != dst):
         try:
-            with open(src, 'rb') as fsrc:
-                with open(dst, 'wb') as fdst:
-                    bytesTotal = os.path.getsize(src)
-                    bytesWritten = 0
-                    while 1:
-                        buf = fsrc.read(maxReadLength)
-                        if not buf:
-                            break
-                        fdst.write(buf)
-
-                        bytesWritten += len(buf)
-                        _displayProgress(bytesWritten, bytesTotal)
+            os.replace(writePath, dst)
+        except OSError:
+            _discardFile(writePath)
+            return -1
+        if (useResume):
+            _discardFile(writePath + CHECKPOINT_SUFFIX)
+
+    if (syncDirs != None):
+        syncDirs.add(os.path.dirname(dst))
+
+    return 1
+
+
+'''
+Decides whether a file should be copied, without reading or writing any file contents unless the files must be compared
+by hash. Implements the checks of _copyFile() so that an operation can be planned with exactly the same decisions.
+
+See _copyFile() for a description of the arguments.
+
+:rtype:tuple
+:return: The result of _copyFile() when the file isn't to be copied, 0 if skipped or -1 on error, otherwise None.
+         Followed by the stats of the source and destination files, when known, and whether the source is a link.
+'''
+
+
+def _checkCopyFile(src, dst, matcher=None, forceOverwrite=False, compare='mtime', hashCache=None, stats=None,
+                   srcEntry=None):
+    # Should the file be copied?
+    if (matcher != None and not matcher.shouldCopy(src)):
+        return 0, None, None, False
+
+    # Gather the stats of both files. Each file is queried at most once (links in the source are also followed once).
+    try:
+        if (srcEntry != None):
+            srcStat = srcEntry.stat(follow_symlinks=False)
+        else:
+            srcStat = os.lstat(src)
+        isLink = stat.S_ISLNK(srcStat.st_mode)
+        if (isLink):
+            srcStat = os.stat(src)
+    except OSError:
+        return -1, None, None, False
+
+    if (stats != None):
+        stats['srcStat'] = srcStat
+
+    try:
+        dstStat = os.stat(dst)
+    except OSError:
+        dstStat = None
+
+    # Only copy files
+    if (not stat.S_ISREG(srcStat.st_mode)):
+        return -1, None, None, False
+
+    # Don't copy files to the same location
+    if (dstStat != None and _isSameFile(srcStat, dstStat, src, dst)):
+        return -1, None, None, False
+
+    # Don't overwrite newer copies of files, or those identical to the source, unless explicitly desired
+    if (not forceOverwrite and dstStat != None):
+        if (compare == 'hash' and hashCache == None):
+            hashCache = _HashCache()
+
+        try:
+            upToDate = (dstStat.st_mtime > srcStat.st_mtime or
+                        _isSameContent(src, dst, srcStat, dstStat, compare, hashCache))
         except (IOError, OSError):
+            return -1, None, None, False
+
+        if (upToDate):
+            if (stats != None):
+                stats['upToDate'] = True
+                if (compare == 'hash'):
+                    stats['srcHash'] = hashCache.getHash(src, srcStat)
+            return 0, srcStat, dstStat, isLink
+
+    return None, srcStat, dstStat, isLink
+
+
+'''
+Removes a temporary file left by a failed copy, ignoring any errors.
+
+:type path:string
+:param path: The path of the file to remove.
+'''
+
+
+def _discardFile(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+'''
+Flushes the contents of an open file and syncs it to disk.
+
+:type f:file
+:param f: The file opened for writing.
+
+:rtype:float
+:return: The number of seconds spent syncing.
+'''
+
+
+def _fsyncFile(f):
+    startTime = time.perf_counter()
+    f.flush()
+    os.fsync(f.fileno())
+    return time.perf_counter() - startTime
+
+
+'''
+Makes the copied files durable once an operation has copied all of them, according to the durability option, and adds
+the time spent to the 'durabilityTime' of the results.
+
+:type syncDirs:set
+:param syncDirs: The destination directories that files were copied to.
+
+:type durability:string
+:param durability: 'dir' to sync each directory, 'end' to sync each filesystem the directories are on.
+
+:rtype:float
+:return: The time in seconds spent syncing, or None if nothing was written.
+'''
+
+
+def _flushDestination(syncDirs, durability):
+    # Nothing was written
+    if (len(syncDirs) == 0):
+        return None
+
+    startTime = time.perf_counter()
+    if (durability == 'dir'):
+        _syncDirectories(syncDirs)
+    elif (durability == 'end'):
+        _syncFilesystems(syncDirs)
+    return time.perf_counter() - startTime
+
+
+'''
+Syncs each of the given directories to disk so that the files created or renamed in them are persisted. Directories
+that can't be opened (e.g. on Windows) are skipped.
+
+:type dirs:set
+:param dirs: The paths of the directories to sync.
+'''
+
+
+def _syncDirectories(dirs):
+    for path in sorted(dirs):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            logger.debug("Failed to sync directory: %s", path)
+        finally:
+            os.close(fd)
+
+
+'''
+Syncs each filesystem containing one of the given directories to disk with a single syncfs call per filesystem. Where
+syncfs isn't available every filesystem is synced at once with os.sync instead, if possible.
+
+:type dirs:set
+:param dirs: The paths of the directories whose filesystems should be synced.
+'''
+
+
+def _syncFilesystems(dirs):
+    # Pick one directory on each filesystem
+    devices = {}
+    for path in dirs:
+        try:
+            devices.setdefault(os.stat(path).st_dev, path)
+        except OSError:
+            continue
+
+    for path in devices.values():
+        if (_syncfs != None):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                if (_syncfs(fd) == 0):
+                    continue
+                logger.debug("syncfs failed for %s: %s", path, os.strerror(ctypes.get_errno()))
+            finally:
+                os.close(fd)
+
+        # Syncing everything covers all of the remaining filesystems
+        if (hasattr(os, 'sync')):
+            os.sync()
+        break
+
+
+'''
+Calls a function that creates the given destination path. If the parent directory of the destination doesn't exist
+yet it is created and the call is retried. This avoids checking for the parent directory before every file.
+
+:type dst:string
+:param dst: The destination path being created.
+
+:type func:function
+:param func: The function creating the destination (e.g. open or os.symlink).
+
+:type args:list
+:param args: The arguments to call func with.
+
+:rtype:object
+:return: The value returned by func.
+'''
+
+
+def _createAtDestination(dst, func, *args):
+    try:
+        return func(*args)
+    except (IOError, OSError) as why:
+        if (why.errno != errno.ENOENT):
+            raise
+
+    mkdir(os.path.dirname(dst))
+    return func(*args)
+
+
+'''
+Checks the values of the options of an operation that only accept certain values.
+
+:type cloneMode:string
+:param cloneMode: The cloneMode option. Must be one of CLONE_MODES.
+
+:type compare:string
+:param compare: The compare option. Must be one of COMPARE_MODES.
+
+:type durability:string
+:param durability: The durability option. Must be one of DURABILITY_MODES.
+
+:type schedule:string
+:param schedule: The schedule option. Must be one of SCHEDULE_MODES.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The maxBytesPerSec option. Must be None, a function or a number greater than 0.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The maxFilesPerSec option. Must be None, a function or a number greater than 0.
+'''
+
+
+def _checkOptions(cloneMode, compare, durability, schedule='fifo', maxBytesPerSec=None, maxFilesPerSec=None):
+    if (cloneMode not in CLONE_MODES):
+        raise ValueError("Invalid cloneMode: " + str(cloneMode))
+    if (compare not in COMPARE_MODES):
+        raise ValueError("Invalid compare: " + str(compare))
+    if (durability not in DURABILITY_MODES):
+        raise ValueError("Invalid durability: " + str(durability))
+    if (schedule not in SCHEDULE_MODES):
+        raise ValueError("Invalid schedule: " + str(schedule))
+    for name, limit in (('maxBytesPerSec', maxBytesPerSec), ('maxFilesPerSec', maxFilesPerSec)):
+        if (limit != None and not callable(limit) and not limit > 0):
+            raise ValueError("Invalid %s: %s" % (name, limit))
+
+
+'''
+Checks that a plan was made for the given operation.
+
+:type plan:CopyPlan
+:param plan: The plan passed to the operation, or None.
+
+:type operation:string
+:param operation: The name of the operation; 'copy' or 'mirror'.
+
+:type src:string
+:param src: The source path of the operation.
+
+:type dst:string
+:param dst: The destination path of the operation.
+'''
+
+
+def _checkPlan(plan, operation, src, dst):
+    if (plan == None):
+        return
+    if (plan.operation != operation):
+        raise ValueError("The plan is for a %s operation, not %s" % (plan.operation, operation))
+    if (os.path.normcase(plan.src) != os.path.normcase(os.path.abspath(src)) or
+            os.path.normcase(plan.dst) != os.path.normcase(os.path.abspath(dst))):
+        raise ValueError("The plan is for copying %s to %s" % (plan.src, plan.dst))
+
+
+'''
+The table of paths recorded by the detailed results of an operation. Rather than keeping a string for every path, each
+path is split into its directory, stored once for all of the paths in it, and its name. The names are encoded one after
+another in a single buffer. The directory, end of the name, action, size and copy time of each path are kept in arrays
+with one entry per path.
+'''
+
+
+class _ResultStore(object):
+    __slots__ = ('dirs', 'dirIds', 'names', 'nameEnds', 'codes', 'sizes', 'elapsed', 'dirIndex')
+
+    def __init__(self):
+        self.dirs = []
+        self.dirIndex = {}
+        self.dirIds = array.array('I')
+        self.names = bytearray()
+        self.nameEnds = array.array('L')
+        self.codes = array.array('B')
+        self.sizes = array.array('q')
+        self.elapsed = array.array('d')
+
+    '''
+    Adds a path to the table.
+
+    :type code:int
+    :param code: The code of the list the path belongs to (see _ResultList).
+
+    :type path:string
+    :param path: The path to add.
+
+    :type size:int
+    :param size: The size of the file in bytes.
+
+    :type elapsed:float
+    :param elapsed: The time in seconds spent copying the file.
+
+    :rtype:int
+    :return: The index of the new row.
+    '''
+
+    def add(self, code, path, size=0, elapsed=0.0):
+        head, name = os.path.split(path)
+        dirId = self.dirIndex.get(head)
+        if (dirId == None):
+            dirId = len(self.dirs)
+            self.dirIndex[head] = dirId
+            self.dirs.append(head)
+
+        self.dirIds.append(dirId)
+        self.names += os.fsencode(name)
+        self.nameEnds.append(len(self.names))
+        self.codes.append(code)
+        self.sizes.append(size)
+        self.elapsed.append(elapsed)
+        return len(self.codes) - 1
+
+    '''
+    Retrieves the path of a row of the table.
+
+    :type row:int
+    :param row: The index of the row.
+
+    :rtype:string
+    :return: The path of the row.
+    '''
+
+    def path(self, row):
+        start = 0
+        if (row > 0):
+            start = self.nameEnds[row - 1]
+        name = os.fsdecode(bytes(self.names[start:self.nameEnds[row]]))
+        return os.path.join(self.dirs[self.dirIds[row]], name)
+
+    '''
+    Finds the first of the given rows holding a path.
+
+    :type rows:array
+    :param rows: The indexes of the rows to search.
+
+    :type path:string
+    :param path: The path to find.
+
+    :rtype:int
+    :return: The index of the row in rows, or -1 if the path isn't found.
+    '''
+
+    def find(self, rows, path):
+        head, name = os.path.split(path)
+        dirId = self.dirIndex.get(head)
+        if (dirId == None):
             return -1
 
-        # Spit out an empty line so subsequent text starts on the next line
-        logger.info("")
+        # Only the names of the rows in the same directory are compared, without decoding them
+        name = os.fsencode(name)
+        for i, row in enumerate(rows):
+            if (self.dirIds[row] == dirId):
+                start = 0
+                if (row > 0):
+                    start = self.nameEnds[row - 1]
+                if (self.names[start:self.nameEnds[row]] == name):
+                    return i
+        return -1
+
+
+'''
+A read-only view of the paths of a _ResultStore recorded with one action for either files or directories, e.g. the
+files copied. It is used for the list entries of the detailed results and behaves like a list of paths, with each
+path built only when it is read. The view keeps the indexes of its rows in the table, so indexing it takes constant
+time and reading it doesn't go through the rows of the other views.
+
+The view is a Sequence rather than a list. It can be indexed, sliced into a list, searched and added to a list, while
+list(view) or toList() gives a list that can be sorted, extended or serialized, e.g. with json.dumps(results,
+default=list).
+
+:type store:_ResultStore
+:param store: The table of the paths.
+
+:type action:string
+:param action: One of EVENT_ACTIONS.
+
+:type isDir:bool
+:param isDir: True to view the directories, False to view the files.
+'''
+
+
+class _ResultList(collections.abc.Sequence):
+    __slots__ = ('store', 'action', 'isDir', 'code', 'rows')
+
+    def __init__(self, store, action, isDir):
+        self.store = store
+        self.action = action
+        self.isDir = isDir
+        self.code = EVENT_ACTIONS.index(action) * 2 + int(isDir)
+        self.rows = array.array('L')
+
+    '''
+    Adds a path to the view.
+
+    :type path:string
+    :param path: The path to add.
+
+    :type size:int
+    :param size: The size of the file in bytes.
+
+    :type elapsed:float
+    :param elapsed: The time in seconds spent copying the file.
+    '''
+
+    def append(self, path, size=0, elapsed=0.0):
+        self.rows.append(self.store.add(self.code, path, size, elapsed))
+
+    '''
+    Retrieves the full records of the paths of the view.
+
+    :rtype:generator
+    :return: A generator of a CopyEvent for each path with its size and copy time.
+    '''
+
+    def records(self):
+        for row in self.rows:
+            yield CopyEvent(self.action, self.store.path(row), isDir=self.isDir, size=self.store.sizes[row],
+                            elapsed=self.store.elapsed[row])
+
+    '''
+    Copies the paths of the view to a list.
+
+    :rtype:list
+    :return: The paths of the view.
+    '''
+
+    def toList(self):
+        return list(self)
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.store.path(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            return [self.store.path(row) for row in self.rows[index]]
+        return self.store.path(self.rows[index])
+
+    def __contains__(self, path):
+        if (not isinstance(path, str)):
+            return False
+        return self.store.find(self.rows, path) >= 0
+
+    def index(self, path, start=0, stop=None):
+        if (isinstance(path, str)):
+            i = self.store.find(self.rows[start:stop], path)
+            if (i >= 0):
+                return i + len(self.rows[:start])
+        raise ValueError("%r is not in list" % (path,))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if (isinstance(other, (list, tuple, _ResultList))):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if (result is NotImplemented):
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+'''
+Creates the results dictionary of a copy with all stats set to zero.
+
+:type detailedResults:bool
+:param detailedResults: Set to True to include the lists of paths in the results.
+
+:type removed:bool
+:param removed: Set to True to include the stats of the files and directories removed by a mirror.
+
+:rtype:dict
+:return: The new results dictionary.
+'''
+
+
+def _createResults(detailedResults, removed=False):
+    actions = ['Copied', 'Failed', 'Skipped']
+    if (removed):
+        actions.append('Removed')
+
+    results = {}
+    for action in actions:
+        results['files' + action] = 0
+        results['dirs' + action] = 0
+    results['copyMethods'] = dict((method, 0) for method in COPY_METHODS)
+    results['durabilityTime'] = 0.0
+    results['sizeStats'] = dict((size, dict(files=0, bytes=0, copyTime=0.0)) for size in ('small', 'large'))
+
+    # Holds the start time of the operation until _finishResults()
+    results['elapsedTime'] = time.perf_counter()
+    if (detailedResults):
+        # All of the lists share one table of paths
+        store = _ResultStore()
+        for action in actions:
+            results['files' + action + 'List'] = _ResultList(store, action.lower(), False)
+            results['dirs' + action + 'List'] = _ResultList(store, action.lower(), True)
+    return results
+
+
+'''
+Records a single event of an operation in the given results.
+
+:type results:dict
+:param results: The results dictionary of the operation to update.
+
+:type event:CopyEvent
+:param event: The event to record.
+
+:type detailedResults:bool
+:param detailedResults: Set to True to add the path to the detailed results lists.
+'''
+
+
+def _addEvent(results, event, detailedResults):
+    if (event.action == 'synced'):
+        results['durabilityTime'] += event.elapsed
+        return
+
+    # Only a mirror reports its removals. The files a move deletes from the source were already reported as copied.
+    if (event.action == 'removed' and 'filesRemoved' not in results):
+        return
+
+    key = 'files'
+    if (event.isDir):
+        key = 'dirs'
+    key += event.action.capitalize()
+    results[key] += 1
+    if (detailedResults):
+        results[key + 'List'].append(event.path, event.size, event.elapsed)
+
+    if (event.action == 'copied' and not event.isDir):
+        if (event.method != None):
+            results['copyMethods'][event.method] += 1
+        results['durabilityTime'] += event.syncTime
+
+        sizeStats = results['sizeStats']['small']
+        if (event.size >= LARGE_FILE_MIB * 1024 * 1024):
+            sizeStats = results['sizeStats']['large']
+        sizeStats['files'] += 1
+        sizeStats['bytes'] += event.size
+        sizeStats['copyTime'] += event.elapsed
+
+
+'''
+Completes the results of an operation once all of its events have been added with _addEvent().
+
+:type operation:string
+:param operation: The name of the operation; 'copy', 'mirror', 'move' or 'sync'.
+
+:type results:dict
+:param results: The results dictionary created for the operation by _createResults().
+
+:type detailedResults:bool
+:param detailedResults: The detailedResults option of the operation.
+
+:type excludeFiles:array
+:param excludeFiles: The excludeFiles option of a mirror.
+
+:type excludeDirs:array
+:param excludeDirs: The excludeDirs option of a mirror.
+
+:rtype:dict
+:return: The results to return from the operation.
+'''
+
+
+def _finishResults(operation, results, detailedResults, excludeFiles=None, excludeDirs=None):
+    results['elapsedTime'] = time.perf_counter() - results['elapsedTime']
+
+    if (operation == 'move'):
+        # Transpose results and return
+        moveResults = {}
+        moveResults['filesMoved'] = results['filesCopied']
+        moveResults['filesFailed'] = results['filesFailed']
+        moveResults['filesSkipped'] = results['filesSkipped']
+        moveResults['dirsMoved'] = results['dirsCopied']
+        moveResults['dirsFailed'] = results['dirsFailed']
+        moveResults['dirsSkipped'] = results['dirsSkipped']
+        moveResults['copyMethods'] = results['copyMethods']
+        moveResults['durabilityTime'] = results['durabilityTime']
+        moveResults['sizeStats'] = results['sizeStats']
+        moveResults['elapsedTime'] = results['elapsedTime']
+        if (detailedResults):
+            moveResults['filesMovedList'] = results['filesCopiedList']
+            moveResults['filesFailedList'] = results['filesFailedList']
+            moveResults['filesSkippedList'] = results['filesSkippedList']
+            moveResults['dirsMovedList'] = results['dirsCopiedList']
+            moveResults['dirsFailedList'] = results['dirsFailedList']
+            moveResults['dirsSkippedList'] = results['dirsSkippedList']
+        return moveResults
+
+    if (operation == 'mirror' and detailedResults):
+        # The skipped lists report the exclude patterns
+        results['dirsSkippedList'] = list(excludeDirs or [])
+        results['filesSkippedList'] = list(excludeFiles or [])
+    elif (operation != 'copy' and not detailedResults):
+        # If detailedResults was not desired remove those entries from the results
+        results['filesCopiedList'] = None
+        results['filesFailedList'] = None
+        results['filesSkippedList'] = None
+        results['dirsCopiedList'] = None
+        results['dirsFailedList'] = None
+        results['dirsSkippedList'] = None
+
+    return results
+
+
+'''
+Logs the outcome of a single file copy and creates its event.
+
+:type result:int
+:param result: The value returned by _copyFile for the file.
+
+:type path:string
+:param path: The path of the file to report.
+
+:type dstPath:string
+:param dstPath: The path the file was copied to.
+
+:type fileStats:dict
+:param fileStats: The stats dictionary that was passed to _copyFile for the file.
+
+:type manifest:_Manifest
+:param manifest: The manifest to record the file in when it was copied or is up to date, if any.
+
+:rtype:CopyEvent
+:return: The event of the file.
+'''
+
+
+def _createFileEvent(result, path, dstPath, fileStats, manifest=None):
+    if (result == 1):
+        logger.info("Copied: %s => %s", path, dstPath)
+        action = 'copied'
+        if ('method' in fileStats):
+            logger.debug("Copy method: %s", fileStats['method'])
+    elif (result == 0):
+        logger.info("Skipped: %s", path)
+        action = 'skipped'
+    else:
+        logger.error("Failed: %s => %s", path, dstPath)
+        action = 'failed'
+
+    # Remember the files that are now identical to their source
+    if (manifest != None and (result == 1 or fileStats.get('upToDate'))):
+        manifest.update(path, fileStats['srcStat'], fileStats.get('srcHash'))
+
+    size = 0
+    if (fileStats.get('srcStat') != None):
+        size = fileStats['srcStat'].st_size
+    return CopyEvent(action, path, size=size, elapsed=fileStats.get('elapsed', 0.0), method=fileStats.get('method'),
+                     syncTime=fileStats.get('durabilityTime', 0.0))
+
+
+'''
+Copies files one at a time, or on a pool of worker threads, and creates the event of each copy. When copying in
+parallel the number of copies in flight is bounded so that the caller doesn't run arbitrarily far ahead of the workers.
+
+With the 'size' schedule files of at least LARGE_FILE_MIB are copied by a quarter of the workers (at least one)
+reserved for them, while the other workers copy the small files in batches of up to SMALL_BATCH_FILES files. A few
+streams are enough to keep the bandwidth of the device busy with large files, and the small files keep the remaining
+workers issuing requests, so neither kind of file holds up the other. Large files are set aside while their workers are
+busy so that the traversal keeps feeding the small files.
+
+:type workers:int
+:param workers: The number of threads used to copy files. A value of 1 or less copies each file immediately.
+
+:type manifest:_Manifest
+:param manifest: The manifest to record the files that are copied or up to date in, if any.
+
+:type schedule:string
+:param schedule: The order in which files are handed to the workers. One of SCHEDULE_MODES. 'fifo' copies the files in
+                 the order they are found, 'size' copies large and small files on separate workers.
+'''
+
+
+class _CopyQueue(object):
+
+    def __init__(self, workers=1, manifest=None, schedule='fifo'):
+        self.manifest = manifest
+        self.executor = None
+        self.pending = set()
+        self.maxPending = workers * 2
+
+        # The workers, copies in flight and files waiting for the workers reserved for large files
+        self.largeExecutor = None
+        self.largePending = set()
+        self.maxLargePending = 0
+        self.largeFiles = collections.deque()
+
+        # The small files waiting to be handed to a worker together
+        self.batch = []
+        self.batchSize = 0
+
+        if (workers > 1):
+            if (schedule == 'size'):
+                largeWorkers = max(1, workers // 4)
+                self.largeExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=largeWorkers)
+                self.maxLargePending = largeWorkers
+                workers -= largeWorkers
+                self.maxPending = workers * 2
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    '''
+    Copies a file with _copyFile, or queues it to be copied by a worker thread.
+
+    :type path:string
+    :param path: The path of the file to report.
+
+    :type src:string
+    :param src: The path of the source file to copy.
+
+    :type dst:string
+    :param dst: The path of the destination to copy src to.
+
+    :param kwargs: Additional arguments passed to _copyFile.
+
+    :rtype:list
+    :return: The events of the copies that completed, which may not include this one when copying in parallel.
+    '''
+
+    def copyFile(self, path, src, dst, **kwargs):
+        fileStats = {}
+        if (self.executor == None):
+            result = _timedCopyFile(src, dst, fileStats, **kwargs)
+            return [_createFileEvent(result, path, dst, fileStats, self.manifest)]
+
+        file = (path, src, dst, fileStats, kwargs)
+        if (self.largeExecutor == None):
+            return self._submit([file])
+
+        size = _getSourceSize(src, kwargs.get('srcEntry'))
+        if (size >= LARGE_FILE_MIB * 1024 * 1024):
+            self.largeFiles.append(file)
+            return self._submitLarge()
+
+        # Small files are handed over in batches bounded in number of files and bytes
+        self.batch.append(file)
+        self.batchSize += size
+        if (len(self.batch) < SMALL_BATCH_FILES and self.batchSize < LARGE_FILE_MIB * 1024 * 1024):
+            return self._submitLarge()
+
+        files = self.batch
+        self.batch = []
+        self.batchSize = 0
+        return self._submit(files) + self._submitLarge()
+
+    '''
+    Creates a destination directory with mkdir().
+
+    :type path:string
+    :param path: The path of the directory to create.
+
+    :rtype:bool
+    :return: Returns True if the directory exists, otherwise False.
+    '''
+
+    def makeDir(self, path):
+        return mkdir(path)
+
+    '''
+    Waits for all queued copies to finish and shuts down the worker threads. Does nothing once finished.
+
+    :type cancel:bool
+    :param cancel: Set to True to drop the files that haven't been handed to a worker yet, when the operation is
+                   stopped early. The copies already in flight are still waited for.
+
+    :rtype:list
+    :return: The events of the copies that were still queued.
+    '''
+
+    def finish(self, cancel=False):
+        events = []
+        if (self.executor != None):
+            if (cancel):
+                self.largeFiles.clear()
+            elif (len(self.batch) > 0):
+                events.extend(self._submit(self.batch))
+            self.batch = []
+
+            while (len(self.pending) > 0 or len(self.largePending) > 0 or len(self.largeFiles) > 0):
+                events.extend(self._submitLarge())
+                notDone, done = _collectFileEvents(self.pending | self.largePending, self.manifest)
+                self.pending &= notDone
+                self.largePending &= notDone
+                events.extend(done)
+
+            self.executor.shutdown()
+            self.executor = None
+            if (self.largeExecutor != None):
+                self.largeExecutor.shutdown()
+                self.largeExecutor = None
+        return events
+
+    '''
+    Hands files to a worker to be copied one after the other, first waiting for a worker to free up when the bound of
+    copies in flight is reached.
+
+    :type files:list
+    :param files: The files to copy, as tuples of the path to report, the source, the destination, the stats dictionary
+                  and the additional arguments to pass to _copyFile.
+
+    :rtype:list
+    :return: The events of the copies that completed while waiting.
+    '''
+
+    def _submit(self, files):
+        events = []
+        if (len(self.pending) >= self.maxPending):
+            self.pending, events = _collectFileEvents(self.pending, self.manifest)
+
+        future = self.executor.submit(_copyFiles, files)
+        future.files = files
+        self.pending.add(future)
+        return events
+
+    '''
+    Collects the large file copies that have completed and hands the large files that were set aside to the workers
+    reserved for them as they free up. Never waits.
+
+    :rtype:list
+    :return: The events of the large file copies that completed.
+    '''
+
+    def _submitLarge(self):
+        events = []
+        if (len(self.largePending) > 0):
+            done, self.largePending = concurrent.futures.wait(self.largePending, timeout=0)
+            events = _createBatchEvents(done, self.manifest)
+
+        while (len(self.largeFiles) > 0 and len(self.largePending) < self.maxLargePending):
+            files = [self.largeFiles.popleft()]
+            future = self.largeExecutor.submit(_copyFiles, files)
+            future.files = files
+            self.largePending.add(future)
+        return events
+
+
+'''
+Stands in for _CopyQueue when an operation is only planned. Each file is checked with _checkCopyFile() exactly as it
+would be before being copied, but nothing is created or written.
+'''
+
+
+class _PlanQueue(object):
+
+    '''
+    Decides whether a file would be copied.
+
+    :type path:string
+    :param path: The path of the file to report.
+
+    :type src:string
+    :param src: The path of the source file.
+
+    :type dst:string
+    :param dst: The path of the destination of the file.
+
+    :param kwargs: The arguments that would be passed to _copyFile. Those that don't affect the decision are ignored.
+
+    :rtype:list
+    :return: The event of the file, 'copied' if the file would be copied.
+    '''
+
+    def copyFile(self, path, src, dst, matcher=None, forceOverwrite=False, compare='mtime', hashCache=None,
+                 srcEntry=None, **kwargs):
+        fileStats = {}
+        result, srcStat, dstStat, isLink = _checkCopyFile(src, dst, matcher, forceOverwrite, compare, hashCache,
+                                                          fileStats, srcEntry)
+        if (result == None):
+            if (dstStat != None):
+                logger.info("Would overwrite: %s => %s", path, dst)
+            else:
+                logger.info("Would copy: %s => %s", path, dst)
+            action = 'copied'
+        elif (result == 0):
+            logger.info("Skipped: %s", path)
+            action = 'skipped'
+        else:
+            logger.error("Failed: %s => %s", path, dst)
+            action = 'failed'
+
+        size = 0
+        if (fileStats.get('srcStat') != None):
+            size = fileStats['srcStat'].st_size
+        return [CopyEvent(action, path, size=size)]
+
+    '''
+    Plans the creation of a destination directory.
+
+    :rtype:bool
+    :return: Always True.
+    '''
+
+    def makeDir(self, path):
+        return True
+
+    '''
+    Does nothing as files are never queued.
+
+    :rtype:list
+    :return: An empty list.
+    '''
+
+    def finish(self, cancel=False):
+        return []
+
+
+'''
+Copies a file with _copyFile and records the time it took in its stats as 'elapsed'.
+
+:type src:string
+:param src: The path of the source file to copy.
+
+:type dst:string
+:param dst: The path of the destination to copy src to.
+
+:type stats:dict
+:param stats: The stats dictionary passed to _copyFile.
+
+:param kwargs: Additional arguments passed to _copyFile.
+
+:rtype:int
+:return: The value returned by _copyFile.
+'''
+
+
+def _timedCopyFile(src, dst, stats, **kwargs):
+    startTime = time.perf_counter()
+    try:
+        return _copyFile(src, dst, stats=stats, **kwargs)
+    finally:
+        stats['elapsed'] = time.perf_counter() - startTime
+
+
+'''
+Copies files one after the other with _copyFile, recording the time each one took in its stats as 'elapsed'. Run by the
+workers of _CopyQueue.
+
+:type files:list
+:param files: The files to copy, as tuples of the path to report, the source, the destination, the stats dictionary
+              and the additional arguments to pass to _copyFile.
+
+:rtype:list
+:return: The values returned by _copyFile for each file, -1 if it raised an error.
+'''
+
+
+def _copyFiles(files):
+    results = []
+    for path, src, dst, fileStats, kwargs in files:
+        try:
+            results.append(_timedCopyFile(src, dst, fileStats, **kwargs))
+        except (IOError, OSError):
+            results.append(-1)
+    return results
+
+
+'''
+Retrieves the size of a source file to schedule its copy, following symbolic links.
+
+:type src:string
+:param src: The path of the source file.
+
+:type srcEntry:os.DirEntry
+:param srcEntry: The directory entry of src, if available. Its cached stat info is used when possible.
+
+:rtype:int
+:return: The size of the file in bytes, or 0 if it can't be queried.
+'''
+
+
+def _getSourceSize(src, srcEntry=None):
+    try:
+        if (srcEntry != None):
+            return srcEntry.stat().st_size
+        return os.stat(src).st_size
+    except OSError:
+        return 0
+
+
+'''
+Waits for at least one of the given file copy futures to complete and creates the events of all completed copies.
+
+:type pending:set
+:param pending: The set of futures of _copyFiles submitted by _CopyQueue.
+
+:type manifest:_Manifest
+:param manifest: The manifest to record the files that were copied or are up to date in, if any.
+
+:rtype:tuple
+:return: The set of futures that have not yet completed and the list of events of those that have.
+'''
+
+
+def _collectFileEvents(pending, manifest=None):
+    done, notDone = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+    return notDone, _createBatchEvents(done, manifest)
+
+
+'''
+Creates the events of the files copied by completed futures of _copyFiles.
+
+:type done:set
+:param done: The completed futures.
+
+:type manifest:_Manifest
+:param manifest: The manifest to record the files that were copied or are up to date in, if any.
+
+:rtype:list
+:return: The events of the files.
+'''
+
+
+def _createBatchEvents(done, manifest=None):
+    events = []
+    for future in done:
+        for (path, src, dst, fileStats, kwargs), result in zip(future.files, future.result()):
+            events.append(_createFileEvent(result, path, dst, fileStats, manifest))
+    return events
+
+
+'''
+The persistent record of the files copied by previous runs of an operation, stored in a SQLite database. Each file is
+recorded with the size, modification time and inode of its source when it was last copied or found to be up to date,
+so that later runs can skip the file while its source still matches without looking at the destination.
+
+Every run increments a generation number and marks the files it sees with it. Files not seen during a run, e.g. those
+since removed from the source, are dropped from the manifest when it is closed.
+
+The manifest also keeps the content hashes computed when comparing files by hash, keyed by device and inode along with
+the size and modification time they were computed for. Hashes not used during a run are dropped in the same way. The
+manifest may be used from several threads.
+
+:type path:string
+:param path: The path of the database file. It is created if it doesn't exist.
+
+:type src:string
+:param src: The source root of the operation. The recorded files are discarded when it differs from the last run.
+
+:type dst:string
+:param dst: The destination root of the operation. The recorded files are discarded when it differs from the last run.
+'''
+
+
+class _Manifest(object):
+
+    def __init__(self, path, src, dst):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, "
+                                "inode INTEGER, hash TEXT, generation INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (device INTEGER, inode INTEGER, size INTEGER, "
+                                "mtime INTEGER, hash TEXT, generation INTEGER, PRIMARY KEY (device, inode))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+
+        info = dict(self.connection.execute("SELECT key, value FROM info"))
+        if (info.get('src') != src or info.get('dst') != dst):
+            self.connection.execute("DELETE FROM files")
+        self.generation = int(info.get('generation', 0)) + 1
+        self.connection.executemany("INSERT OR REPLACE INTO info VALUES (?, ?)",
+                                    [('src', src), ('dst', dst), ('generation', str(self.generation))])
+
+    '''
+    Determines if the given source stats match those recorded for a file, marking the file as seen if they do.
+
+    :type path:string
+    :param path: The relative path of the file.
+
+    :type st:os.stat_result
+    :param st: The current stats of the source file.
+
+    :rtype:bool
+    :return: Returns True if the file is recorded with the same size, modification time and inode, otherwise False.
+    '''
+
+    def isUnchanged(self, path, st):
+        if (st == None):
+            return False
+
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime, inode FROM files WHERE path = ?", (path,)).fetchone()
+            if (row == None or tuple(row) != (st.st_size, st.st_mtime_ns, st.st_ino)):
+                return False
+
+            self.connection.execute("UPDATE files SET generation = ? WHERE path = ?", (self.generation, path))
+        return True
+
+    '''
+    Records the source stats of a file that was copied or found to be up to date.
+
+    :type path:string
+    :param path: The relative path of the file.
+
+    :type st:os.stat_result
+    :param st: The stats of the source file.
+
+    :type fileHash:string
+    :param fileHash: The hash of the contents of the file, if known.
+    '''
+
+    def update(self, path, st, fileHash=None):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                    (path, st.st_size, st.st_mtime_ns, st.st_ino, fileHash, self.generation))
+
+    '''
+    Looks up the recorded hash of a file, marking it as used if found.
+
+    :type st:os.stat_result
+    :param st: The current stats of the file.
+
+    :rtype:string
+    :return: The hash recorded for the file's device and inode if its size and modification time still match, otherwise
+             None.
+    '''
+
+    def getHash(self, st):
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime, hash FROM hashes WHERE device = ? AND inode = ?",
+                                          (st.st_dev, st.st_ino)).fetchone()
+            if (row == None or (row[0], row[1]) != (st.st_size, st.st_mtime_ns)):
+                return None
+
+            self.connection.execute("UPDATE hashes SET generation = ? WHERE device = ? AND inode = ?",
+                                    (self.generation, st.st_dev, st.st_ino))
+        return row[2]
+
+    '''
+    Records the hash of a file.
+
+    :type st:os.stat_result
+    :param st: The stats of the file the hash was computed for.
+
+    :type fileHash:string
+    :param fileHash: The hash of the contents of the file.
+    '''
+
+    def setHash(self, st, fileHash):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                                    (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, fileHash, self.generation))
+
+    '''
+    Drops the files and hashes not seen during this run, then saves and closes the manifest.
+    '''
+
+    def close(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM files WHERE generation < ?", (self.generation,))
+            self.connection.execute("DELETE FROM hashes WHERE generation < ?", (self.generation,))
+            self.connection.commit()
+            self.connection.close()
+
+
+'''
+Opens the manifest at the given path.
+
+:type path:string
+:param path: The path of the manifest file.
+
+:type src:string
+:param src: The source root of the operation.
+
+:type dst:string
+:param dst: The destination root of the operation.
+
+:rtype:_Manifest
+:return: The opened manifest, or None if manifests aren't supported or the manifest couldn't be opened.
+'''
+
+
+def _openManifest(path, src, dst):
+    if (sqlite3 == None):
+        logger.warning("Manifests are not supported: the sqlite3 module is not available.")
+        return None
+
+    try:
+        mkdir(os.path.dirname(path))
+        return _Manifest(path, src, dst)
+    except (sqlite3.Error, IOError, OSError):
+        logger.exception("Failed to open manifest: %s", path)
+        return None
+
+
+'''
+Determines the path of the manifest file from the value of the manifest option.
+
+:type manifest:bool or string
+:param manifest: True to use the default manifest file in dst, otherwise the path of the manifest file.
+
+:type dst:string
+:param dst: The destination root of the operation.
+
+:rtype:string
+:return: The absolute path of the manifest file.
+'''
+
+
+def _getManifestPath(manifest, dst):
+    if (manifest is True):
+        return os.path.join(dst, MANIFEST_FILENAME)
+    return os.path.abspath(manifest)
+
+
+'''
+Caches the content hashes of files for the duration of an operation so that no file is read more than once to compare
+it. Hashes are keyed by the device, inode, size and modification time of the file, so a file that changes is hashed
+again. Files without an inode number (e.g. on some Windows filesystems) are never cached.
+
+The cache may be used from several threads. Two threads hashing the same file at once both read it, which is harmless.
+
+:type manifest:_Manifest
+:param manifest: The manifest to look up and record hashes in so that they persist between runs, if any.
+'''
+
+
+class _HashCache(object):
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    '''
+    Retrieves the hash of the contents of a file, hashing the file if it isn't cached yet.
+
+    :type path:string
+    :param path: The path of the file.
+
+    :type st:os.stat_result
+    :param st: The current stats of the file.
+
+    :rtype:string
+    :return: The hash of the file as a string of hex digits.
+    '''
+
+    def getHash(self, path, st):
+        key = None
+        if (st.st_ino != 0):
+            key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            with self.lock:
+                fileHash = self.hashes.get(key)
+            if (fileHash == None and self.manifest != None):
+                fileHash = self.manifest.getHash(st)
+            if (fileHash != None):
+                return fileHash
+
+        fileHash = _hashFile(path, st.st_size, getattr(st, 'st_blksize', 0))
+
+        if (key != None):
+            with self.lock:
+                self.hashes[key] = fileHash
+            if (self.manifest != None):
+                self.manifest.setHash(st, fileHash)
+        return fileHash
+
+
+'''
+Clones the contents of one open file into another using a copy-on-write reflink. Only the file metadata is written,
+the data blocks are shared between both files until one of them is modified.
+
+Cloning is only possible on Linux when both files are on the same filesystem and that filesystem supports reflinks
+(e.g. btrfs, XFS).
+
+:type fsrc:file
+:param fsrc: The source file opened for binary reading.
+
+:type fdst:file
+:param fdst: The destination file opened for binary writing.
+
+:rtype:bool
+:return: Returns True if the contents were cloned, otherwise False.
+'''
+
+
+def _cloneFileData(fsrc, fdst):
+    if (fcntl == None or not sys.platform.startswith('linux')):
+        return False
+
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError) as why:
+        logger.debug("Clone not possible: %s", why)
+        return False
+
+    return True
+
+
+'''
+Copies the contents of one open file to another.
+
+The copy is performed kernel-side whenever possible, first with copy_file_range (which also lets the filesystem
+reflink or perform a server-side copy) then with sendfile. When neither is supported for the given pair of files the
+contents are copied through a userspace buffer. Each method resumes from where the previous one left off.
+
+:type fsrc:file
+:param fsrc: The source file opened for binary reading.
+
+:type fdst:file
+:param fdst: The destination file opened for binary writing.
+
+:type bytesTotal:int
+:param bytesTotal: The expected size of the source file.
+
+:type progress:_FileProgress
+:param progress: The progress of the file to report the bytes copied to, or None.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer used for the userspace copy, or None to size it adaptively.
+
+:type blockSize:int
+:param blockSize: The preferred I/O block size of the filesystem in bytes used for adaptive sizing, or 0 if unknown.
+
+:rtype:tuple
+:return: The name of the method that finished the copy (see COPY_METHODS) and the total number of bytes copied.
+'''
+
+
+def _copyFileData(fsrc, fdst, bytesTotal, progress=None, bufferSize=None, blockSize=0):
+    srcFd = fsrc.fileno()
+    dstFd = fdst.fileno()
+    bytesWritten = 0
+
+    for method in ('copy_file_range', 'sendfile'):
+        if (not hasattr(os, method)):
+            continue
+
+        # Each method may start after another one has already copied some of the data
+        os.lseek(dstFd, bytesWritten, os.SEEK_SET)
+
+        chunkSize = KERNELCOPY_CHUNK_MIB * 1024 * 1024
+        try:
+            while 1:
+                if (method == 'copy_file_range'):
+                    count = os.copy_file_range(srcFd, dstFd, chunkSize, bytesWritten, bytesWritten)
+                else:
+                    count = os.sendfile(dstFd, srcFd, bytesWritten, chunkSize)
+                if (count == 0):
+                    break
+
+                bytesWritten += count
+                if (progress != None):
+                    progress.update(count)
+        except OSError as why:
+            if (why.errno not in _COPY_FALLBACK_ERRNOS):
+                raise
+            continue
+
+        # Some pseudo filesystems report no data to the kernel copy methods even though the file can be read
+        if (bytesWritten == 0 and bytesTotal > 0):
+            continue
+
+        return method, bytesWritten
+
+    # Fall back to copying through a userspace buffer. The same buffer is read into and written from for every chunk.
+    if (bufferSize == None):
+        bufferSize = _getAdaptiveBufferSize(bytesTotal, blockSize)
+    buf = _getCopyBuffer(bufferSize)
+    fsrc.seek(bytesWritten)
+    fdst.seek(bytesWritten)
+    while 1:
+        count = fsrc.readinto(buf)
+        if not count:
+            break
+        fdst.write(buf[:count])
+
+        bytesWritten += count
+        if (progress != None):
+            progress.update(count)
+
+    return COPY_METHODS[-1], bytesWritten
+
+
+'''
+Updates the contents of an existing destination file in place to match the source. Both files are read in chunks and
+each chunk is compared in blocks of DELTA_BLOCK_KIB. Only the runs of blocks that differ are written, and the
+destination is truncated to the size of the source.
+
+Blocks are compared at the same offsets, without rolling checksums, so data inserted or removed in the middle of a file
+changes every block after it. The whole destination is read to compare it, so on a network filesystem an update
+transfers more data than a plain rewrite unless only a few blocks changed.
+
+The files handled this way are large, so the two buffers needed are allocated for each file rather than reused.
+
+:type fsrc:file
+:param fsrc: The source file opened for binary reading.
+
+:type fdst:file
+:param fdst: The destination file opened for binary reading and writing.
+
+:type bytesTotal:int
+:param bytesTotal: The size of the source file in bytes.
+
+:type progress:_FileProgress
+:param progress: The progress of the file to report the bytes copied to, or None.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the chunks to read, or None to size them adaptively.
+
+:type blockSize:int
+:param blockSize: The preferred I/O block size of the source filesystem in bytes, or 0 if unknown.
+
+:rtype:int
+:return: The number of bytes of the source that the destination now matches.
+'''
+
+
+def _deltaFileData(fsrc, fdst, bytesTotal, progress=None, bufferSize=None, blockSize=0):
+    if (bufferSize == None):
+        bufferSize = _getAdaptiveBufferSize(bytesTotal, blockSize)
+    deltaBlockSize = DELTA_BLOCK_KIB * 1024
+    srcBuf = bytearray(bufferSize)
+    dstBuf = bytearray(bufferSize)
+    srcView = memoryview(srcBuf)
+    dstView = memoryview(dstBuf)
+
+    offset = 0
+    bytesChanged = 0
+    while 1:
+        count = fsrc.readinto(srcBuf)
+        if not count:
+            break
+        fdst.seek(offset)
+        dstCount = fdst.readinto(dstBuf)
+
+        # Skip identical chunks with a single comparison. Otherwise find the runs of blocks that differ, treating
+        # anything beyond the end of the destination as changed.
+        if (dstCount != count or not _isSameData(srcView[:count], dstView[:count])):
+            start = None
+            for pos in range(0, count + deltaBlockSize, deltaBlockSize):
+                end = min(pos + deltaBlockSize, count)
+                changed = pos < count and (end > dstCount or not _isSameData(srcView[pos:end], dstView[pos:end]))
+                if (changed and start == None):
+                    start = pos
+                elif (not changed and start != None):
+                    stop = min(pos, count)
+                    fdst.seek(offset + start)
+                    fdst.write(srcView[start:stop])
+                    bytesChanged += stop - start
+                    start = None
+
+        offset += count
+        if (progress != None):
+            progress.update(count)
+
+    fdst.truncate(offset)
+    logger.debug("Rewrote %d of %d bytes", bytesChanged, offset)
+    return offset
+
+
+'''
+Compares two ranges of buffers without copying them. A bytearray compared with a buffer uses a single memcmp, while
+memoryviews are compared item by item, so a range covering a whole bytearray is compared through the bytearray and other
+ranges as 8 byte items where possible.
+
+:type view1:memoryview
+:param view1: The first range to compare.
+
+:type view2:memoryview
+:param view2: The second range to compare.
+
+:rtype:bool
+:return: True if both ranges hold the same bytes, otherwise False.
+'''
+
+
+def _isSameData(view1, view2):
+    if (len(view1) != len(view2)):
+        return False
+    if (isinstance(view1.obj, bytearray) and len(view1.obj) == len(view1)):
+        return view1.obj == view2
+    if (len(view1) % 8 == 0):
+        return view1.cast('Q') == view2.cast('Q')
+    return view1 == view2
+
+
+'''
+Copies the contents of a file to a partial file next to the destination. Every CHECKPOINT_MIB the length copied so far
+and a hash of it are saved to a checkpoint file. If a checkpoint for the same source is found the partial data is
+verified against it and the copy continues from there, otherwise it starts over.
+
+The partial file and its checkpoint are left in place. The caller renames the partial file over the destination and
+removes the checkpoint once it has checked that the copy is complete and the source didn't change.
+
+:type fsrc:file
+:param fsrc: The source file opened for binary reading.
+
+:type dst:string
+:param dst: The path of the destination file.
+
+:type srcStat:os.stat_result
+:param srcStat: The stats of the source file. The checkpoint is only used while the size and modification time of the
+                source still match.
+
+:type progress:_FileProgress
+:param progress: The progress of the file to report the bytes copied to, or None.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer to copy through, or None to size it adaptively.
+
+:type cloneMode:string
+:param cloneMode: One of CLONE_MODES. A copy that starts from the beginning is cloned when possible unless 'never'.
+
+:type fsync:bool
+:param fsync: Set to True to sync the partial file to disk once written.
+
+:rtype:tuple
+:return: The name of the data path used (see COPY_METHODS) and the total number of bytes in the partial file.
+'''
+
+
+def _copyFileResumable(fsrc, dst, srcStat, progress=None, bufferSize=None, cloneMode='auto', fsync=False):
+    partPath = dst + PARTIAL_SUFFIX
+    checkpointPath = partPath + CHECKPOINT_SUFFIX
+    if (bufferSize == None):
+        bufferSize = _getAdaptiveBufferSize(srcStat.st_size, getattr(srcStat, 'st_blksize', 0))
+
+    offset, hasher = _loadCheckpoint(checkpointPath, partPath, srcStat, bufferSize)
+    if (offset > 0):
+        logger.info("Resuming: %s from %d bytes", dst, offset)
+
+    with _createAtDestination(partPath, open, partPath, 'r+b' if offset > 0 else 'wb') as fpart:
+        if (offset == 0 and cloneMode != 'never' and _cloneFileData(fsrc, fpart)):
+            method = 'clone'
+            bytesWritten = srcStat.st_size
+        else:
+            method = COPY_METHODS[-1]
+            buf = _getCopyBuffer(bufferSize)
+            checkpointSize = CHECKPOINT_MIB * 1024 * 1024
+            nextCheckpoint = offset + checkpointSize
+            bytesWritten = offset
+            fsrc.seek(offset)
+            fpart.seek(offset)
+            while 1:
+                count = fsrc.readinto(buf)
+                if not count:
+                    break
+                fpart.write(buf[:count])
+                hasher.update(buf[:count])
+
+                bytesWritten += count
+                if (bytesWritten >= nextCheckpoint):
+                    fpart.flush()
+                    _saveCheckpoint(checkpointPath, srcStat, bytesWritten, hasher)
+                    nextCheckpoint = bytesWritten + checkpointSize
+                if (progress != None):
+                    progress.update(count)
+
+            # Drop anything written past the last checkpoint by an earlier attempt
+            fpart.truncate(bytesWritten)
+
+        if (fsync):
+            _fsyncFile(fpart)
+
+    return method, bytesWritten
+
+
+'''
+Loads the checkpoint of a resumable copy and verifies the partial data against it.
+
+:type checkpointPath:string
+:param checkpointPath: The path of the checkpoint file.
+
+:type partPath:string
+:param partPath: The path of the partial file.
+
+:type srcStat:os.stat_result
+:param srcStat: The current stats of the source file.
+
+:type bufferSize:int
+:param bufferSize: The size in bytes of the buffer to read the partial data through.
+
+:rtype:tuple
+:return: The number of bytes the copy can continue from and a hash object fed with those bytes. The length is 0 if
+         there is no usable checkpoint.
+'''
+
+
+def _loadCheckpoint(checkpointPath, partPath, srcStat, bufferSize):
+    hasher = hashlib.blake2b(digest_size=32)
+    try:
+        with open(checkpointPath, 'r') as f:
+            checkpoint = json.load(f)
+        if (checkpoint['size'] != srcStat.st_size or checkpoint['mtime'] != srcStat.st_mtime_ns):
+            return 0, hasher
+
+        offset = checkpoint['offset']
+        buf = _getCopyBuffer(bufferSize)
+        bytesRead = 0
+        with open(partPath, 'rb') as fpart:
+            while (bytesRead < offset):
+                count = fpart.readinto(buf[:min(bufferSize, offset - bytesRead)])
+                if not count:
+                    break
+                hasher.update(buf[:count])
+                bytesRead += count
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return 0, hashlib.blake2b(digest_size=32)
+
+    if (bytesRead != offset or hasher.hexdigest() != checkpoint['hash']):
+        logger.warning("Checkpoint doesn't match the partial data, restarting: %s", partPath)
+        return 0, hashlib.blake2b(digest_size=32)
+    return offset, hasher
+
+
+'''
+Saves the checkpoint of a resumable copy. The checkpoint file is replaced atomically so that an interruption never
+leaves it half written.
+
+:type checkpointPath:string
+:param checkpointPath: The path of the checkpoint file.
+
+:type srcStat:os.stat_result
+:param srcStat: The stats of the source file being copied.
+
+:type offset:int
+:param offset: The number of bytes copied so far.
+
+:type hasher:hashlib.blake2b
+:param hasher: The hash object fed with the bytes copied so far.
+'''
+
+
+def _saveCheckpoint(checkpointPath, srcStat, offset, hasher):
+    tmpPath = checkpointPath + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(dict(size=srcStat.st_size, mtime=srcStat.st_mtime_ns, offset=offset, hash=hasher.hexdigest()), f)
+    os.replace(tmpPath, checkpointPath)
+
+
+'''
+Chooses the size of the buffer to copy a file through based on the size of the file and the block size of the
+filesystem. Small files use small buffers while large files use progressively larger buffers (up to
+BUFFERSIZE_MAX_KIB) so that the number of read/write calls stays low.
+
+:type fileSize:int
+:param fileSize: The size of the file to copy in bytes.
+
+:type blockSize:int
+:param blockSize: The preferred I/O block size of the filesystem in bytes, or 0 if unknown.
+
+:rtype:int
+:return: The buffer size in bytes.
+'''
+
+
+def _getAdaptiveBufferSize(fileSize, blockSize):
+    bufferSize = max(BUFFERSIZE_KIB * 1024, blockSize)
+    maxBufferSize = max(BUFFERSIZE_MAX_KIB * 1024, bufferSize)
+
+    # Grow the buffer in powers of two until the file takes no more than 8 chunks to copy
+    while (bufferSize < maxBufferSize and bufferSize * 8 < fileSize):
+        bufferSize *= 2
+
+    return min(bufferSize, maxBufferSize)
+
+
+# Copy buffers are allocated once per thread and reused for every file copied by that thread.
+_copyBuffers = threading.local()
+
+'''
+Retrieves the calling thread's copy buffer, growing it as necessary.
+
+:type size:int
+:param size: The number of bytes the buffer must hold.
+
+:rtype:memoryview
+:return: A writable view of exactly size bytes.
+'''
+
+
+def _getCopyBuffer(size):
+    buf = getattr(_copyBuffers, 'buf', None)
+    if (buf == None or len(buf) < size):
+        buf = bytearray(size)
+        _copyBuffers.buf = buf
+    return memoryview(buf)[:size]
+
+
+'''
+Computes a BLAKE2 hash of the contents of a file. The file is read in chunks into the calling thread's copy buffer.
+
+:type path:string
+:param path: The path of the file to hash.
+
+:type fileSize:int
+:param fileSize: The size of the file in bytes, used to choose the chunk size.
 
-        # Copy file stats
-        if (preserveStats):
-            _copyStats(src, dst)
+:type blockSize:int
+:param blockSize: The preferred I/O block size of the file's filesystem, or 0 if unknown.
+
+:rtype:string
+:return: The hash of the file as a string of hex digits.
+'''
 
-    # Was the copy successful?
-    if (os.path.exists(dst)):
-        # If the file isn't a symlink, check the size
-        if (os.path.islink(dst) or os.path.getsize(src) == os.path.getsize(dst)):
-            return 1
 
-    return -1
+def _hashFile(path, fileSize, blockSize=0):
+    hasher = hashlib.blake2b(digest_size=32)
+    buf = _getCopyBuffer(_getAdaptiveBufferSize(fileSize, blockSize))
+    with open(path, 'rb') as f:
+        while (True):
+            bytesRead = f.readinto(buf)
+            if (not bytesRead):
+                break
+            hasher.update(buf[:bytesRead])
+    return hasher.hexdigest()
 
 
 '''
@@ -1095,11 +4539,15 @@ Copies the stat info (mode bits, atime, mtime, flags) from src to dst.
 
 :type dst:string
 :param dst: The destination path to copy stat info to.
+
+:type st:os.stat_result
+:param st: The already known stat info of src, if available.
 '''
 
 
-def _copyStats(src, dst):
-    st = os.stat(src)
+def _copyStats(src, dst, st=None):
+    if (st == None):
+        st = os.stat(src)
     mode = stat.S_IMODE(st.st_mode)
     if hasattr(os, 'utime'):
         os.utime(dst, (st.st_atime, st.st_mtime))
@@ -1117,54 +4565,244 @@ def _copyStats(src, dst):
 
 
 '''
-Prints the current progress for the given file operation to any stdout or stderr handler attached to logger using the
-INFO level.
+The progress of a single file copy reported to a ProgressReporter. Keeps track of the bytes of the file still to be
+copied so that they can be dropped from the reporter's pending bytes if the copy stops early.
+
+:type reporter:ProgressReporter
+:param reporter: The reporter of the operation.
+
+:type size:int
+:param size: The size of the file in bytes.
+'''
+
+
+class _FileProgress(object):
+    __slots__ = ('reporter', 'remaining')
+
+    def __init__(self, reporter, size):
+        self.reporter = reporter
+        self.remaining = size
+
+    '''
+    Reports bytes of the file as copied.
+
+    :type count:int
+    :param count: The number of bytes copied since the last update.
+    '''
+
+    def update(self, count):
+        self.remaining -= count
+        self.reporter.update(count)
+
+    '''
+    Reports the end of the copy of the file, whether or not all of it was copied.
+    '''
+
+    def finish(self):
+        self.reporter.finishFile(max(self.remaining, 0))
+        self.remaining = 0
+
+
+'''
+Limits the rate at which an operation copies data and files. The limits are shared by all of the files and worker
+threads of the operation, each of them being enforced by a _TokenBucket.
+
+:type maxBytesPerSec:int
+:param maxBytesPerSec: The most bytes per second to copy, a function returning it, or None for no limit.
+
+:type maxFilesPerSec:int
+:param maxFilesPerSec: The most files per second to copy, a function returning it, or None for no limit.
+'''
+
+
+class _RateLimiter(object):
+
+    def __init__(self, maxBytesPerSec=None, maxFilesPerSec=None):
+        self.bytes = None
+        if (maxBytesPerSec != None):
+            self.bytes = _TokenBucket(maxBytesPerSec)
+        self.files = None
+        if (maxFilesPerSec != None):
+            self.files = _TokenBucket(maxFilesPerSec)
+
+    '''
+    Waits until another file may be copied.
+    '''
+
+    def startFile(self):
+        if (self.files != None):
+            self.files.consume(1)
+
+    '''
+    Wraps the progress of a file copy so that the bytes reported as copied are also counted against the limit.
+
+    :type progress:_FileProgress
+    :param progress: The progress of the file, or None.
+
+    :rtype:_FileProgress
+    :return: The progress to report the bytes copied to, or None if neither reporting nor limiting is needed.
+    '''
+
+    def wrapProgress(self, progress):
+        if (self.bytes == None):
+            return progress
+        return _ThrottledProgress(self.bytes, progress)
+
+
+'''
+A token bucket refilled at a given rate per second and holding at most RATE_BURST_SECONDS worth of tokens, so that a
+pause doesn't let the next copies run unchecked. Thread safe.
+
+Tokens are taken as soon as they are asked for, even if that overdraws the bucket, and the caller then waits until the
+bucket has refilled. A chunk of data larger than what the bucket holds is so let through, and the limit holds on
+average over the chunks copied.
+
+:type rate:int
+:param rate: The number of tokens added per second, or a function taking no arguments that returns it. The function is
+             called again every RATE_POLL_SECONDS, and there is no limit while it returns None or 0.
+'''
+
+
+class _TokenBucket(object):
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._limit = None
+        self._tokens = 0.0
+        self._lastTime = time.perf_counter()
+        self._nextPoll = 0.0
+        self._lock = threading.Lock()
+
+    '''
+    Takes tokens from the bucket, waiting while it is overdrawn.
+
+    :type count:int
+    :param count: The number of tokens to take.
+    '''
+
+    def consume(self, count):
+        with self._lock:
+            self._refill()
+            self._tokens -= count
+
+        while (True):
+            with self._lock:
+                limit = self._refill()
+                if (limit == None or self._tokens >= 0):
+                    return
+                # Wake up at least every poll interval in case the limit is raised in the meantime
+                wait = min(-self._tokens / limit, RATE_POLL_SECONDS)
+            time.sleep(wait)
+
+    '''
+    Adds the tokens accumulated since the last call. Must be called with the lock held.
+
+    :rtype:float
+    :return: The current limit, or None if there is none.
+    '''
+
+    def _refill(self):
+        now = time.perf_counter()
+        if (now >= self._nextPoll):
+            self._nextPoll = now + RATE_POLL_SECONDS
+            limit = self.rate
+            if (callable(limit)):
+                limit = limit()
+            if (limit != None and limit <= 0):
+                limit = None
+            self._limit = limit
+
+        if (self._limit == None):
+            # Nothing is owed or saved up while there is no limit
+            self._tokens = 0.0
+        else:
+            self._tokens = min(self._tokens + (now - self._lastTime) * self._limit,
+                               self._limit * RATE_BURST_SECONDS)
+        self._lastTime = now
+        return self._limit
+
+
+'''
+The progress of a single file copy whose bytes are counted against a rate limit. The bytes are reported to the
+progress of the file, if any, before waiting for the limit.
+
+:type bucket:_TokenBucket
+:param bucket: The bucket limiting the bytes copied per second.
+
+:type progress:_FileProgress
+:param progress: The progress of the file to report the bytes copied to, or None.
+'''
+
 
-:type currentValue:int
-:param currentValue: The value representing the current progress.
+class _ThrottledProgress(object):
+    __slots__ = ('bucket', 'progress')
 
-:type totalValue:int
-:param totalValue: The maximum value of the progress to be achieved.
+    def __init__(self, bucket, progress):
+        self.bucket = bucket
+        self.progress = progress
+
+    '''
+    Reports bytes of the file as copied and waits until the limit allows more to be copied.
+
+    :type count:int
+    :param count: The number of bytes copied since the last update.
+    '''
+
+    def update(self, count):
+        if (self.progress != None):
+            self.progress.update(count)
+        self.bucket.consume(count)
+
+    '''
+    Reports the end of the copy of the file.
+    '''
+
+    def finish(self):
+        if (self.progress != None):
+            self.progress.finish()
+
+
+'''
+Creates the reporter that displays the progress of an operation on the terminal when the logger has a handler writing
+to one at the INFO level. Nothing is reported otherwise, so that copies don't pay for progress no one can see.
+
+:rtype:ProgressReporter
+:return: The reporter, or None if progress shouldn't be displayed.
 '''
 
 
-def _displayProgress(currentValue, totalValue):
-    # Displaying the progress bar should only be shown at the appropriate log level (INFO)
+def _getDefaultProgress():
+    # Progress should only be shown at the appropriate log level (INFO)
     if (logger.getEffectiveLevel() > logging.INFO):
-        return
+        return None
 
-    # Attempt to grab all available stdout/stderr streams from the list of logger handlers
-    streams = []
     for handler in logger.handlers:
-        if (isinstance(handler, logging.StreamHandler) and
-                (handler.stream is sys.stderr or handler.stream is sys.stdout)):
-            streams.append(handler.stream)
+        stream = getattr(handler, 'stream', None)
+        if (isinstance(handler, logging.StreamHandler) and (stream is sys.stderr or stream is sys.stdout) and
+                hasattr(stream, 'isatty') and stream.isatty()):
+            return ProgressReporter(stream)
+    return None
 
-    # If no output streams were found we can't display the progress bar
-    if (len(streams) == 0):
-        return
 
-    strToDisplay = str(currentValue) + " / " + str(totalValue) + " ["
-
-    # Add the progress bar
-    maxLineLength = 80
-    percentComplete = float(currentValue) / float(totalValue)
-    currentBarValue = int(maxLineLength * percentComplete)
-    i = 0
-    while (i < maxLineLength):
-        if (i < currentBarValue):
-            strToDisplay += "="
-        elif (i == currentBarValue):
-            strToDisplay += ">"
-        else:
-            strToDisplay += " "
-        i += 1
+'''
+Formats a number of bytes for display, e.g. 1.5 MiB.
+
+:type size:float
+:param size: The number of bytes.
+
+:rtype:string
+:return: The formatted size.
+'''
 
-    strToDisplay += "]\r"
 
-    for stream in streams:
-        stream.write(strToDisplay)
-        stream.flush()
+def _formatSize(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if (size < 1024 or unit == 'TiB'):
+            break
+        size /= 1024.0
+    if (unit == 'B'):
+        return "%d B" % size
+    return "%.1f %s" % (size, unit)
 
 
 '''
@@ -1224,6 +4862,234 @@ def _displayCopyResults(results, display_filenames=False, display_dirs=False, di
     logger.info("--------------------")
 
 
+'''
+Determines if the given directory should be skipped because of its depth or the directory patterns, and if everything
+beneath it will be skipped as well.
+
+:type relRoot:string
+:param relRoot: The path of the directory relative to the top of the tree.
+
+:type level:int
+:param level: The level option of the operation.
+
+:type maxDepth:int
+:param maxDepth: The maximum depth of the tree. Only used when level is negative.
+
+:type dirMatcher:PathMatcher
+:param dirMatcher: The matcher of the directory include and exclude patterns.
+
+:rtype:tuple
+:return: A tuple of two bools. The first is True if the directory should be skipped, the second is True if its entire
+         subtree should be skipped and can be pruned from the walk.
+'''
+
+
+def _checkDirectory(relRoot, level, maxDepth, dirMatcher):
+    # Exclude items not at the desired depth
+    if (level != 0):
+        # Determine the current depth of relRoot
+        depth = 0
+        if (relRoot != '.'):
+            depth = relRoot.count(os.path.sep) + 1
+
+        # If traversing in reverse we need to subtract the max depth to get the relative level
+        if (level < 0):
+            depth = maxDepth - depth
+
+        # Now check the level. Everything beneath a directory that is too deep is also too deep.
+        if (depth >= abs(level)):
+            return (True, level > 0)
+
+    # Should the directory be traversed?
+    if (relRoot != '.' and not dirMatcher.shouldCopy(relRoot)):
+        return (True, dirMatcher.excludesSubtree(relRoot))
+
+    return (False, False)
+
+
+'''
+Decides which way a file found at the same relative path in one or both sides of a sync needs to be copied and copies
+it. A file found on one side only is copied to the other. A file found on both sides is copied from the newer side, or
+from the first side when forcing overwrites, and skipped when both have the same modification time.
+
+:type queue:_CopyQueue
+:param queue: The queue used to copy the file and record the result.
+
+:type path:string
+:param path: The path of the file to record in the results.
+
+:type path1:string
+:param path1: The path of the file on the first side.
+
+:type path2:string
+:param path2: The path of the file on the second side.
+
+:type stat1:os.stat_result
+:param stat1: The stats of the file on the first side, or None if it doesn't exist.
+
+:type stat2:os.stat_result
+:param stat2: The stats of the file on the second side, or None if it doesn't exist.
+
+:type entry1:os.DirEntry
+:param entry1: The directory entry of the file on the first side, if available.
+
+:type entry2:os.DirEntry
+:param entry2: The directory entry of the file on the second side, if available.
+
+:type forceOverwrite:bool
+:param forceOverwrite: Set to True to copy files found on both sides from the first side regardless of their age.
+
+:type copyArgs:dict
+:param copyArgs: Additional arguments passed to _copyFile.
+
+:type compare:string
+:param compare: One of COMPARE_MODES deciding if files found on both sides are identical.
+
+:type hashCache:_HashCache
+:param hashCache: The cache of file hashes used when compare is 'hash'.
+'''
+
+
+def _syncFile(queue, path, path1, path2, stat1, stat2, entry1, entry2, forceOverwrite, copyArgs, compare='mtime',
+              hashCache=None):
+    src, dst, srcEntry = path1, path2, entry1
+    if (stat1 == None and stat2 == None):
+        return [_createFileEvent(-1, path, path2, {})]
+    elif (stat1 != None and stat2 != None):
+        if (stat.S_ISDIR(stat1.st_mode) or stat.S_ISDIR(stat2.st_mode)):
+            logger.error("Cannot sync a directory with a file: %s", path)
+            return [_createFileEvent(-1, path, path2, {})]
+        elif (not forceOverwrite):
+            try:
+                isSame = _isSameContent(path1, path2, stat1, stat2, compare, hashCache)
+            except (IOError, OSError):
+                logger.exception("Failed to compare: %s", path)
+                return [_createFileEvent(-1, path, path2, {})]
+
+            if (isSame):
+                return [_createFileEvent(0, path, path2, {})]
+            elif (stat2.st_mtime > stat1.st_mtime):
+                src, dst, srcEntry = path2, path1, entry2
+            elif (stat2.st_mtime == stat1.st_mtime):
+                # Both files changed without either becoming newer so there's no telling which one to keep
+                logger.error("Conflicting changes with the same modification time: %s", path)
+                return [_createFileEvent(-1, path, path2, {})]
+    elif (stat1 == None):
+        src, dst, srcEntry = path2, path1, entry2
+
+    # The direction has already been decided so the copy is forced
+    return queue.copyFile(path, src, dst, forceOverwrite=True, srcEntry=srcEntry, **copyArgs)
+
+
+'''
+Retrieves the stats of the given directory entry, following symbolic links. The stats of the link itself are returned
+when it can't be followed.
+
+:type entry:os.DirEntry
+:param entry: The directory entry, or None.
+
+:rtype:os.stat_result
+:return: The stats of the entry, or None if entry is None or can't be queried.
+'''
+
+
+def _statEntry(entry):
+    if (entry == None):
+        return None
+    try:
+        return entry.stat()
+    except OSError:
+        try:
+            return entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+
+
+'''
+Retrieves the stats of the given path, following symbolic links. The stats of the link itself are returned when it
+can't be followed.
+
+:type path:string
+:param path: The path to query.
+
+:rtype:os.stat_result
+:return: The stats of the path, or None if it doesn't exist.
+'''
+
+
+def _statPath(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        try:
+            return os.lstat(path)
+        except OSError:
+            return None
+
+
+'''
+Determines if two files are identical according to the given compare mode. Hashes are only computed for files of the
+same size.
+
+:type path1:string
+:param path1: The path of the first file.
+
+:type path2:string
+:param path2: The path of the second file.
+
+:type stat1:os.stat_result
+:param stat1: The stats of the first file.
+
+:type stat2:os.stat_result
+:param stat2: The stats of the second file.
+
+:type compare:string
+:param compare: One of COMPARE_MODES. 'mtime' compares the modification times, 'size+mtime' the modification times and
+                sizes, and 'hash' the sizes and contents of the files.
+
+:type hashCache:_HashCache
+:param hashCache: The cache of file hashes to use when compare is 'hash'.
+
+:rtype:bool
+:return: Returns True if the files are considered identical, otherwise False.
+'''
+
+
+def _isSameContent(path1, path2, stat1, stat2, compare, hashCache=None):
+    if (compare == 'mtime'):
+        return stat1.st_mtime == stat2.st_mtime
+    elif (compare == 'size+mtime'):
+        return stat1.st_mtime == stat2.st_mtime and stat1.st_size == stat2.st_size
+
+    if (stat1.st_size != stat2.st_size):
+        return False
+    if (hashCache == None):
+        hashCache = _HashCache()
+    return hashCache.getHash(path1, stat1) == hashCache.getHash(path2, stat2)
+
+
+'''
+Determines if the given relative path is one of, or is beneath one of, the given directories.
+
+:type path:string
+:param path: The relative path to check.
+
+:type dirs:set
+:param dirs: The set of relative directory paths to check against.
+
+:rtype:bool
+:return: Returns True if path or one of its parents is in dirs, otherwise False.
+'''
+
+
+def _isWithinDirs(path, dirs):
+    while (path != '' and path != '.'):
+        if (path in dirs):
+            return True
+        path = os.path.dirname(path)
+    return False
+
+
 '''
 Determines the maximum depth of the tree for a given path.
 
@@ -1236,10 +5102,27 @@ Determines the maximum depth of the tree for a given path.
 
 
 def _getTreeDepth(path):
+    return _indexTree(_walkTree(path))[1]
+
+
+'''
+Consumes a tree walk produced by _walkTree, capturing each visited directory while computing the maximum depth of the
+tree in the same pass.
+
+:type tree:iterable
+:param tree: The walk to consume.
+
+:rtype:tuple
+:return: A tuple of the list of walked directories, in walk order, and the maximum depth of the tree.
+'''
+
+
+def _indexTree(tree):
+    index = []
     maxDepth = 0
-    for root, dirs, files in os.walk(path):
-        relRoot = os.path.relpath(root, path)
-        depth = relRoot.count(os.path.sep) + 1
+    for item in tree:
+        index.append(item)
+        depth = item[1].count(os.path.sep) + 1
         if (depth > maxDepth):
             maxDepth = depth
-    return maxDepth
+    return (index, maxDepth)
@@ -46,13 +46,23 @@ For complete documentation please visit the project page on `GitHub <https://git
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 
     keywords='file utilities admin filesystem copy move mirror sync',
 
     packages=find_packages(exclude=['tests']),
 
+    python_requires='>=3.6',
+
     install_requires=[],
     entry_points={
         'console_scripts': [
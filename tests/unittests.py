@@ -3,14 +3,19 @@
 Copyright (C) 2016 Jean-Philippe Steinmetz
 '''
 
+import asyncio
+import hashlib
+import json
 import logging
 import os
+from pyrocopy import aio
 from pyrocopy import pyrocopy
 import random
 import re
 import shutil
 import sys
 import tempfile
+import threading
 import time
 
 # Set up the logger
@@ -35,8 +40,6 @@ def genRandomContents(path, maxFileSize):
         while (curChar < totalChars):
             file.write(chr(random.randint(1,255)))
             curChar += 1
-            if (curChar % (maxFileSize / 100) == 0):
-                pyrocopy._displayProgress(curChar, totalChars)
         file.flush()
         logger.info("")
 
@@ -210,6 +213,69 @@ try:
     if (not pyrocopy._checkShouldCopy(os.path.join("Level1", "SubPath1", "SubPath2", "f2342080"), True, ['re:f[0-9]+'], None)):
         raise Exception("Failed _checkShouldCopy")
 
+    # PathMatcher tests
+    matcher = pyrocopy.PathMatcher(['*.txt', 're:.*/notes[0-9]+'], None, True)
+    if (not matcher.shouldCopy(os.path.join("Level1", "myFile.txt")) or
+            not matcher.shouldCopy(os.path.join("Level1", "notes42")) or
+            matcher.shouldCopy(os.path.join("Level1", "myFile.log")) or
+            not matcher.shouldCopy(os.path.join("Level1", "Level2", "myFile.txt"))):
+        raise Exception("Failed PathMatcher include test")
+    matcher = pyrocopy.PathMatcher(None, ['Level2', 're:Level[0-9]+/Tmp.*', 're:(a)\\1'], False)
+    if (not matcher.shouldCopy("Level1") or matcher.shouldCopy("Level2") or matcher.shouldCopy("aa") or
+            matcher.shouldCopy(os.path.join("Level1", "Tmp1")) or matcher.shouldCopy(os.path.join("Level2", "Level3")) or
+            not matcher.shouldCopy(os.path.join("Level1", "Level3"))):
+        raise Exception("Failed PathMatcher exclude test")
+    if (not matcher.isExcluded("Level2") or matcher.isIncluded("Level2")):
+        raise Exception("Failed PathMatcher exclude test")
+    if (not matcher.excludesSubtree("Level2") or not matcher.excludesSubtree(os.path.join("Level1", "Tmp1")) or
+            matcher.excludesSubtree("Level1") or not matcher.excludesSubtree("aa")):
+        raise Exception("Failed PathMatcher excludesSubtree test")
+    if (pyrocopy.PathMatcher(None, ['re:Level2$'], False).excludesSubtree("Level2") or
+            pyrocopy.PathMatcher(None, ['re:Lev'], False).excludesSubtree("Level2") or
+            pyrocopy.PathMatcher(['Level1'], ['Level2'], False).excludesSubtree("Level2")):
+        raise Exception("Failed PathMatcher excludesSubtree test")
+
+    # _ResultList tests
+    store = pyrocopy._ResultStore()
+    copiedList = pyrocopy._ResultList(store, 'copied', False)
+    skippedList = pyrocopy._ResultList(store, 'skipped', False)
+    copiedList.append(os.path.join('.', 'a'), 10, 0.5)
+    skippedList.append(os.path.join('sub', 'b'))
+    copiedList.append(os.path.join('sub', 'c'), 20)
+    if (copiedList != [os.path.join('.', 'a'), os.path.join('sub', 'c')] or len(copiedList) != 2 or
+            copiedList[1] != os.path.join('sub', 'c') or os.path.join('sub', 'b') in copiedList or
+            os.path.join('sub', 'b') not in skippedList or len(store.dirs) != 2):
+        raise Exception("Failed _ResultList test")
+    if ([(e.path, e.size, e.elapsed) for e in copiedList.records()] !=
+            [(os.path.join('.', 'a'), 10, 0.5), (os.path.join('sub', 'c'), 20, 0.0)]):
+        raise Exception("Failed _ResultList records test")
+    if (copiedList[-1] != os.path.join('sub', 'c') or copiedList[:1] != [os.path.join('.', 'a')] or
+            copiedList + ['d'] != [os.path.join('.', 'a'), os.path.join('sub', 'c'), 'd'] or
+            ['d'] + copiedList != ['d', os.path.join('.', 'a'), os.path.join('sub', 'c')] or
+            copiedList.index(os.path.join('sub', 'c')) != 1 or 'c' in copiedList or None in copiedList or
+            json.loads(json.dumps(copiedList.toList())) != copiedList or
+            json.loads(json.dumps({'list': copiedList}, default=list))['list'] != copiedList):
+        raise Exception("Failed _ResultList sequence test")
+
+    # Indexing and searching a view doesn't decode the whole table
+    for i in range(0, 20000):
+        skippedList.append(os.path.join('sub', 'many' + str(i)))
+    startTime = time.perf_counter()
+    for i in range(0, 20000, 10):
+        if (skippedList[i + 1] != os.path.join('sub', 'many' + str(i))):
+            raise Exception("Failed _ResultList indexing test")
+    if (copiedList[0] != os.path.join('.', 'a') or os.path.join('sub', 'many19999') not in skippedList or
+            time.perf_counter() - startTime > 1.0):
+        raise Exception("Failed _ResultList indexing test")
+
+    # _getAdaptiveBufferSize tests
+    if (pyrocopy._getAdaptiveBufferSize(100, 4096) != pyrocopy.BUFFERSIZE_KIB * 1024):
+        raise Exception("Failed _getAdaptiveBufferSize test with a small file")
+    if (pyrocopy._getAdaptiveBufferSize(1024 * 1024 * 1024, 4096) != pyrocopy.BUFFERSIZE_MAX_KIB * 1024):
+        raise Exception("Failed _getAdaptiveBufferSize test with a large file")
+    if (pyrocopy._getAdaptiveBufferSize(100, 1024 * 1024) != 1024 * 1024):
+        raise Exception("Failed _getAdaptiveBufferSize test with a large block size")
+
     # mkdir test
     logger.info("Testing pyrocopy.mkdir() ...")
     mkdirTestPath = "New Folder"
@@ -261,6 +327,8 @@ try:
         raise Exception("Failed to copy all files.")
     if (results['filesFailed'] > 0 or results['dirsFailed'] > 0):
         raise Exception("Failed to copy some files or directories.")
+    if (sum(results['copyMethods'].values()) != numFiles):
+        raise Exception("Failed to report the copy method of all files.")
     # TODO Diff src and dst
 
     # check second copy (should skip all files)
@@ -281,6 +349,513 @@ try:
 
     shutil.rmtree(dst)
 
+    # check parallel copy
+    results = pyrocopy.copy(src, dst, preserveStats=PRESERVE_TIMESTAMPS, workers=4)
+    if (results['filesCopied'] != numFiles):
+        raise Exception("Failed to copy all files in parallel.")
+    if (results['filesFailed'] > 0 or results['dirsFailed'] > 0):
+        raise Exception("Failed to copy some files or directories in parallel.")
+
+    results = pyrocopy.copy(src, dst, preserveStats=PRESERVE_TIMESTAMPS, detailedResults=True, workers=4)
+    if (results['filesSkipped'] != numFiles or len(results['filesSkippedList']) != numFiles):
+        raise Exception("Failed to skip all files in parallel.")
+
+    shutil.rmtree(dst)
+
+    # check fixed buffer size
+    results = pyrocopy.copy(src, dst, bufferSize=4096)
+    if (results['filesCopied'] != numFiles or results['filesFailed'] > 0):
+        raise Exception("Failed to copy with a fixed buffer size.")
+
+    shutil.rmtree(dst)
+
+    # check symlinked files are copied as links
+    if (hasattr(os, 'symlink')):
+        linkSrc = os.path.join(tmpdir, "linkSrc")
+        pyrocopy.mkdir(linkSrc)
+        genRandomContents(os.path.join(linkSrc, "target"), MAX_FILE_SIZE)
+        os.symlink("target", os.path.join(linkSrc, "link"))
+        results = pyrocopy.copy(linkSrc, linkSrc + "Copy")
+        if (results['filesCopied'] != 2 or not os.path.islink(os.path.join(linkSrc + "Copy", "link"))):
+            raise Exception("Failed to copy a symlinked file.")
+        shutil.rmtree(linkSrc)
+        shutil.rmtree(linkSrc + "Copy")
+
+    # check clone modes
+    results = pyrocopy.copy(src, dst, cloneMode='never')
+    if (results['filesCopied'] != numFiles or results['copyMethods']['clone'] != 0):
+        raise Exception("Failed to copy without cloning.")
+    try:
+        pyrocopy.copy(src, dst, cloneMode='sometimes')
+        raise Exception("Failed to reject an invalid clone mode.")
+    except ValueError:
+        pass
+
+    # A clone the filesystem refuses leaves an older destination as it was
+    cloneSrc = os.path.join(tmpdir, "cloneSrc")
+    cloneDst = cloneSrc + "Copy"
+    pyrocopy.mkdir(cloneSrc)
+    pyrocopy.mkdir(cloneDst)
+    with open(os.path.join(cloneDst, "file"), 'wb') as f:
+        f.write(b"old contents")
+    os.utime(os.path.join(cloneDst, "file"), (1000000000, 1000000000))
+    with open(os.path.join(cloneSrc, "file"), 'wb') as f:
+        f.write(b"new contents")
+    results = pyrocopy.copy(cloneSrc, cloneDst, cloneMode='always')
+    expected = b"old contents"
+    if (results['filesCopied'] == 1):
+        expected = b"new contents"
+    with open(os.path.join(cloneDst, "file"), 'rb') as f:
+        if (results['filesCopied'] + results['filesFailed'] != 1 or f.read() != expected or
+                os.listdir(cloneDst) != ["file"]):
+            raise Exception("Failed to keep the destination of a refused clone.")
+    shutil.rmtree(cloneSrc)
+    shutil.rmtree(cloneDst)
+
+    shutil.rmtree(dst)
+
+    # check copy with a manifest
+    if (pyrocopy.sqlite3 != None):
+        manifestPath = os.path.join(dst, pyrocopy.MANIFEST_FILENAME)
+        results = pyrocopy.copy(src, dst, preserveStats=PRESERVE_TIMESTAMPS, manifest=True)
+        if (results['filesCopied'] != numFiles or not os.path.isfile(manifestPath)):
+            raise Exception("Failed to copy with a manifest.")
+
+        # Files recorded in the manifest are skipped without looking at the destination
+        removedFile = None
+        for root, dirs, files in os.walk(dst):
+            for file in files:
+                if (file != pyrocopy.MANIFEST_FILENAME):
+                    removedFile = os.path.join(root, file)
+        os.remove(removedFile)
+        results = pyrocopy.copy(src, dst, preserveStats=PRESERVE_TIMESTAMPS, manifest=True)
+        if (results['filesSkipped'] != numFiles or os.path.exists(removedFile)):
+            raise Exception("Failed to skip files recorded in the manifest.")
+
+        # Mirroring must keep the manifest in the destination
+        results = pyrocopy.mirror(src, dst, preserveStats=PRESERVE_TIMESTAMPS, manifest=True)
+        if (results['filesRemoved'] != 0 or not os.path.isfile(manifestPath)):
+            raise Exception("Failed to mirror with a manifest.")
+
+        shutil.rmtree(dst)
+
+    # check compare modes
+    compareSrc = os.path.join(tmpdir, "compareSrc")
+    compareDst = compareSrc + "Copy"
+    pyrocopy.mkdir(compareSrc)
+    with open(os.path.join(compareSrc, "file"), 'wb') as f:
+        f.write(b"original")
+    pyrocopy.copy(compareSrc, compareDst)
+
+    # An edit that keeps the size and modification time is only found by hashing
+    with open(os.path.join(compareSrc, "file"), 'wb') as f:
+        f.write(b"modified")
+    os.utime(os.path.join(compareSrc, "file"), (1000000000, 1000000000))
+    os.utime(os.path.join(compareDst, "file"), (1000000000, 1000000000))
+    results = pyrocopy.copy(compareSrc, compareDst, compare='size+mtime')
+    if (results['filesSkipped'] != 1):
+        raise Exception("Failed to skip a file of the same size and modification time.")
+    results = pyrocopy.copy(compareSrc, compareDst, compare='hash')
+    if (results['filesCopied'] != 1):
+        raise Exception("Failed to copy a modified file by its hash.")
+
+    # A touched file with the same contents is skipped
+    os.utime(os.path.join(compareSrc, "file"), (2000000000, 2000000000))
+    results = pyrocopy.copy(compareSrc, compareDst, compare='hash')
+    if (results['filesSkipped'] != 1):
+        raise Exception("Failed to skip an unmodified file by its hash.")
+    results = pyrocopy.copy(compareSrc, compareDst, compare='mtime')
+    if (results['filesCopied'] != 1):
+        raise Exception("Failed to copy a touched file by its modification time.")
+
+    # A changed size is found without hashing
+    with open(os.path.join(compareSrc, "file"), 'wb') as f:
+        f.write(b"resized file")
+    os.utime(os.path.join(compareSrc, "file"), (2000000000, 2000000000))
+    results = pyrocopy.copy(compareSrc, compareDst, compare='size+mtime')
+    if (results['filesCopied'] != 1):
+        raise Exception("Failed to copy a resized file with the same modification time.")
+
+    # Sync can't pick a side when both changed with the same modification time
+    with open(os.path.join(compareDst, "file"), 'wb') as f:
+        f.write(b"changed file")
+    os.utime(os.path.join(compareDst, "file"), (2000000000, 2000000000))
+    results = pyrocopy.sync(compareSrc, compareDst, compare='hash')
+    if (results['filesFailed'] != 1):
+        raise Exception("Failed to report a sync conflict.")
+
+    try:
+        pyrocopy.copy(compareSrc, compareDst, compare='size')
+        raise Exception("Failed to reject an invalid compare mode.")
+    except ValueError:
+        pass
+
+    shutil.rmtree(compareSrc)
+    shutil.rmtree(compareDst)
+
+    # check delta updates of large files
+    deltaSrc = os.path.join(tmpdir, "deltaSrc")
+    deltaDst = deltaSrc + "Copy"
+    pyrocopy.mkdir(deltaSrc)
+    genRandomContents(os.path.join(deltaSrc, "file"), MAX_FILE_SIZE)
+    pyrocopy.copy(deltaSrc, deltaDst)
+    with open(os.path.join(deltaSrc, "file"), 'rb') as f:
+        contents = bytearray(f.read())
+    for i in range(0, len(contents), 3000):
+        contents[i] = (contents[i] + 1) % 256
+    contents += b"appended"
+    with open(os.path.join(deltaSrc, "file"), 'wb') as f:
+        f.write(contents)
+    os.utime(os.path.join(deltaSrc, "file"), (2000000000, 2000000000))
+    results = pyrocopy.copy(deltaSrc, deltaDst, deltaThreshold=1)
+    with open(os.path.join(deltaDst, "file"), 'rb') as f:
+        if (results['copyMethods']['delta'] != 1 or f.read() != contents):
+            raise Exception("Failed to update a file in place.")
+
+    # A shorter source truncates the destination
+    with open(os.path.join(deltaSrc, "file"), 'wb') as f:
+        f.write(contents[:100])
+    os.utime(os.path.join(deltaSrc, "file"), (2000000001, 2000000001))
+    results = pyrocopy.copy(deltaSrc, deltaDst, deltaThreshold=1)
+    with open(os.path.join(deltaDst, "file"), 'rb') as f:
+        if (results['copyMethods']['delta'] != 1 or f.read() != contents[:100]):
+            raise Exception("Failed to truncate a file updated in place.")
+
+    # Data inserted or removed in the middle shifts every block after it, across chunks and partial blocks
+    blockSize = pyrocopy.DELTA_BLOCK_KIB * 1024
+    contents = bytearray(os.urandom(blockSize * 7 + 123))
+    with open(os.path.join(deltaDst, "file"), 'wb') as f:
+        f.write(contents)
+    for i, edited in enumerate((contents[:1000] + b"inserted" + contents[1000:] + b"appended",
+                                contents[:blockSize * 2] + contents[blockSize * 2 + 77:blockSize * 5])):
+        with open(os.path.join(deltaSrc, "file"), 'wb') as f:
+            f.write(edited)
+        os.utime(os.path.join(deltaSrc, "file"), (2000000002 + i, 2000000002 + i))
+        results = pyrocopy.copy(deltaSrc, deltaDst, deltaThreshold=1, bufferSize=blockSize * 3 + 5)
+        with open(os.path.join(deltaDst, "file"), 'rb') as f:
+            if (results['copyMethods']['delta'] != 1 or f.read() != edited):
+                raise Exception("Failed to update a file with inserted or removed data in place.")
+
+    shutil.rmtree(deltaSrc)
+    shutil.rmtree(deltaDst)
+
+    # check resumable copies
+    resumeSrc = os.path.join(tmpdir, "resumeSrc")
+    resumeDst = resumeSrc + "Copy"
+    pyrocopy.mkdir(resumeSrc)
+    pyrocopy.mkdir(resumeDst)
+    contents = os.urandom(100000)
+    with open(os.path.join(resumeSrc, "file"), 'wb') as f:
+        f.write(contents)
+    srcStat = os.stat(os.path.join(resumeSrc, "file"))
+
+    # Leave behind the partial data of an interrupted copy along with its checkpoint
+    partPath = os.path.join(resumeDst, "file" + pyrocopy.PARTIAL_SUFFIX)
+    with open(partPath, 'wb') as f:
+        f.write(contents[:60000] + b"garbage past the checkpoint")
+    hasher = hashlib.blake2b(contents[:50000], digest_size=32)
+    pyrocopy._saveCheckpoint(partPath + pyrocopy.CHECKPOINT_SUFFIX, srcStat, 50000, hasher)
+    if (pyrocopy._loadCheckpoint(partPath + pyrocopy.CHECKPOINT_SUFFIX, partPath, srcStat, 4096)[0] != 50000):
+        raise Exception("Failed to load a checkpoint.")
+
+    results = pyrocopy.copy(resumeSrc, resumeDst, resumeThreshold=1, cloneMode='never')
+    with open(os.path.join(resumeDst, "file"), 'rb') as f:
+        if (results['filesCopied'] != 1 or f.read() != contents or os.listdir(resumeDst) != ["file"]):
+            raise Exception("Failed to resume a copy.")
+
+    # Partial data that doesn't match its checkpoint is copied again from the start
+    os.remove(os.path.join(resumeDst, "file"))
+    with open(partPath, 'wb') as f:
+        f.write(b"x" * 60000)
+    pyrocopy._saveCheckpoint(partPath + pyrocopy.CHECKPOINT_SUFFIX, srcStat, 50000, hasher)
+    if (pyrocopy._loadCheckpoint(partPath + pyrocopy.CHECKPOINT_SUFFIX, partPath, srcStat, 4096)[0] != 0):
+        raise Exception("Failed to reject a checkpoint that doesn't match.")
+
+    results = pyrocopy.copy(resumeSrc, resumeDst, resumeThreshold=1)
+    with open(os.path.join(resumeDst, "file"), 'rb') as f:
+        if (results['filesCopied'] != 1 or f.read() != contents or os.listdir(resumeDst) != ["file"]):
+            raise Exception("Failed to restart a copy with a bad checkpoint.")
+
+    # A source that grows while it is copied fails without touching the destination or leaving partial data behind
+    class GrowingSource(pyrocopy.ProgressReporter):
+        def update(self, count):
+            pyrocopy.ProgressReporter.update(self, count)
+            if (self.bytesCopied == count):
+                with open(os.path.join(resumeSrc, "file"), 'ab') as f:
+                    f.write(b"more")
+    os.utime(os.path.join(resumeSrc, "file"), (srcStat.st_atime, srcStat.st_mtime + 10))
+    results = pyrocopy.copy(resumeSrc, resumeDst, resumeThreshold=1, cloneMode='never', bufferSize=4096,
+                            progress=GrowingSource())
+    with open(os.path.join(resumeDst, "file"), 'rb') as f:
+        if (results['filesFailed'] != 1 or f.read() != contents or os.listdir(resumeDst) != ["file"] or
+                os.stat(os.path.join(resumeDst, "file")).st_mtime == os.stat(os.path.join(resumeSrc, "file")).st_mtime):
+            raise Exception("Failed to reject a copy of a source that changed.")
+
+    # The next run copies the changed source in full
+    results = pyrocopy.copy(resumeSrc, resumeDst, resumeThreshold=1, cloneMode='never')
+    with open(os.path.join(resumeDst, "file"), 'rb') as f:
+        if (results['filesCopied'] != 1 or f.read() != contents + b"more" or os.listdir(resumeDst) != ["file"]):
+            raise Exception("Failed to copy a source that changed.")
+
+    shutil.rmtree(resumeSrc)
+    shutil.rmtree(resumeDst)
+
+    # check atomic copies
+    atomicSrc = os.path.join(tmpdir, "atomicSrc")
+    atomicDst = atomicSrc + "Copy"
+    pyrocopy.mkdir(atomicSrc)
+    pyrocopy.mkdir(atomicDst)
+    with open(os.path.join(atomicSrc, "file"), 'wb') as f:
+        f.write(b"new contents")
+    with open(os.path.join(atomicDst, "file"), 'wb') as f:
+        f.write(b"old")
+    os.utime(os.path.join(atomicDst, "file"), (1000000000, 1000000000))
+
+    # A temporary file left by an interrupted copy is replaced
+    with open(os.path.join(atomicDst, "file" + pyrocopy.TEMP_SUFFIX), 'wb') as f:
+        f.write(b"stale")
+    results = pyrocopy.copy(atomicSrc, atomicDst, atomic=True, durability='file')
+    with open(os.path.join(atomicDst, "file"), 'rb') as f:
+        if (results['filesCopied'] != 1 or f.read() != b"new contents" or os.listdir(atomicDst) != ["file"]):
+            raise Exception("Failed to copy a file atomically.")
+
+    shutil.rmtree(atomicDst)
+    results = pyrocopy.copy(atomicSrc, atomicDst, atomic=True, durability='dir')
+    if (results['filesCopied'] != 1 or os.listdir(atomicDst) != ["file"]):
+        raise Exception("Failed to copy a file atomically with durable directories.")
+
+    # Syncing the whole filesystem at the end is timed like the other durability modes
+    shutil.rmtree(atomicDst)
+    results = pyrocopy.copy(atomicSrc, atomicDst, durability='end')
+    if (results['filesCopied'] != 1 or results['durabilityTime'] <= 0):
+        raise Exception("Failed to copy with a durable filesystem.")
+    results = pyrocopy.sync(atomicSrc, atomicDst, durability='end')
+    if (results['filesSkipped'] != 1 or results['durabilityTime'] != 0):
+        raise Exception("Failed to skip syncing the filesystem when nothing was copied.")
+
+    try:
+        pyrocopy.copy(atomicSrc, atomicDst, durability='always')
+        raise Exception("Failed to reject an invalid durability mode.")
+    except ValueError:
+        pass
+
+    shutil.rmtree(atomicSrc)
+    shutil.rmtree(atomicDst)
+
+    # check the generator API
+    eventSrc = os.path.join(tmpdir, "eventSrc")
+    eventDst = eventSrc + "Copy"
+    pyrocopy.mkdir(os.path.join(eventSrc, "sub"))
+    for name in ("a", os.path.join("sub", "b")):
+        with open(os.path.join(eventSrc, name), 'wb') as f:
+            f.write(b"event")
+    events = list(pyrocopy.iterCopy(eventSrc, eventDst, workers=2))
+    copied = sorted(e.path for e in events if e.action == 'copied' and not e.isDir)
+    if (copied != [os.path.join('.', 'a'), os.path.join('sub', 'b')] or
+            [e.path for e in events if e.isDir] != ['sub'] or any(e.size != 5 for e in events if not e.isDir)):
+        raise Exception("Failed to yield the events of a copy.")
+
+    with open(os.path.join(eventDst, "extra"), 'wb') as f:
+        f.write(b"extra")
+    events = [(e.action, e.path) for e in pyrocopy.iterMirror(eventSrc, eventDst) if not e.isDir]
+    if (events != [('skipped', os.path.join('.', 'a')), ('skipped', os.path.join('sub', 'b')),
+                   ('removed', os.path.join('.', 'extra'))]):
+        raise Exception("Failed to yield the events of a mirror.")
+
+    try:
+        pyrocopy.iterSync(eventSrc, eventDst, compare='size')
+        raise Exception("Failed to reject an invalid compare mode before iterating.")
+    except ValueError:
+        pass
+
+    # check progress reporting
+    class RecordingReporter(pyrocopy.ProgressReporter):
+        def report(self, bytesCopied, bytesPerSec, eta):
+            self.reports.append(bytesCopied)
+
+    progress = RecordingReporter(interval=0)
+    progress.reports = []
+    pyrocopy.copy(eventSrc, eventDst + "0", progress=progress, workers=2, cloneMode='never')
+    if (progress.bytesCopied != 10 or progress.bytesPending != 0 or progress.reports[-1] != 10):
+        raise Exception("Failed to report the progress of a copy.")
+
+    progress = RecordingReporter(interval=3600)
+    progress.reports = []
+    fileProgress = progress.startFile(8)
+    for i in range(5):
+        fileProgress.update(1)
+    fileProgress.finish()
+    if (progress.bytesCopied != 5 or progress.bytesPending != 0 or len(progress.reports) != 1):
+        raise Exception("Failed to limit the rate of progress reports.")
+
+    # check planning operations before carrying them out
+    planDst = eventDst + "5"
+    plan = pyrocopy.planCopy(eventSrc, planDst)
+    if (plan.totalFiles != 2 or plan.totalBytes != 10 or plan.dirs != ['sub'] or os.path.exists(planDst)):
+        raise Exception("Failed to plan a copy without copying anything.")
+
+    planPath = os.path.join(tmpdir, "plan.json")
+    plan.save(planPath)
+    progress = RecordingReporter(interval=0)
+    progress.reports = []
+    results = pyrocopy.copy(eventSrc, planDst, progress=progress, plan=pyrocopy.CopyPlan.load(planPath))
+    if (results['filesCopied'] != 2 or results['dirsCopied'] != 1 or progress.totalBytes != 10):
+        raise Exception("Failed to carry out a saved copy plan.")
+    os.remove(planPath)
+
+    extraPath = os.path.join(planDst, "extra")
+    with open(extraPath, 'wb') as f:
+        f.write(b"extra")
+    plan = pyrocopy.planMirror(eventSrc, planDst)
+    if (plan.totalFiles != 0 or [e.path for e in plan.removals] != [os.path.join('.', 'extra')] or
+            not os.path.exists(extraPath)):
+        raise Exception("Failed to plan the removals of a mirror without removing anything.")
+
+    results = pyrocopy.mirror(eventSrc, planDst, plan=plan)
+    if (results['filesRemoved'] != 1 or results['filesSkipped'] != 2 or os.path.exists(extraPath)):
+        raise Exception("Failed to carry out a mirror plan.")
+
+    try:
+        pyrocopy.copy(eventSrc, planDst, plan=plan)
+        raise Exception("Failed to reject a plan made for another operation.")
+    except ValueError:
+        pass
+
+    # check dry runs
+    dryDst = eventDst + "6"
+    results = pyrocopy.copy(eventSrc, dryDst, dryRun=True)
+    if (results['filesCopied'] != 2 or results['dirsCopied'] != 1 or os.path.exists(dryDst)):
+        raise Exception("Failed to dry run a copy.")
+
+    results = pyrocopy.move(eventSrc, dryDst, dryRun=True)
+    if (results['filesMoved'] != 2 or not os.path.exists(os.path.join(eventSrc, "a")) or os.path.exists(dryDst)):
+        raise Exception("Failed to dry run a move.")
+
+    extraPath = os.path.join(eventDst, "extra")
+    with open(extraPath, 'wb') as f:
+        f.write(b"extra")
+    results = pyrocopy.mirror(eventSrc, eventDst, dryRun=True)
+    if (results['filesRemoved'] != 1 or results['filesSkipped'] != 2 or not os.path.exists(extraPath)):
+        raise Exception("Failed to dry run a mirror.")
+
+    results = pyrocopy.sync(eventSrc, eventDst, dryRun=True)
+    if (results['filesCopied'] != 1 or results['filesSkipped'] != 2 or
+            os.path.exists(os.path.join(eventSrc, "extra"))):
+        raise Exception("Failed to dry run a sync.")
+    os.remove(extraPath)
+
+    # check size-aware scheduling
+    largeFileMib = pyrocopy.LARGE_FILE_MIB
+    pyrocopy.LARGE_FILE_MIB = 0.001
+    largePaths = [os.path.join(eventSrc, "large" + str(i)) for i in range(0, 2)]
+    for path in largePaths:
+        with open(path, 'wb') as f:
+            f.write(os.urandom(4096))
+    results = pyrocopy.copy(eventSrc, eventDst + "7", workers=4, schedule='size')
+    pyrocopy.LARGE_FILE_MIB = largeFileMib
+    sizeStats = results['sizeStats']
+    if (results['filesCopied'] != 4 or sizeStats['large']['files'] != 2 or sizeStats['large']['bytes'] != 8192 or
+            sizeStats['small']['files'] != 2 or results['elapsedTime'] <= 0):
+        raise Exception("Failed to schedule large and small files separately.")
+    for path in largePaths:
+        os.remove(path)
+
+    try:
+        pyrocopy.copy(eventSrc, eventDst, schedule='largest')
+        raise Exception("Failed to reject an invalid schedule.")
+    except ValueError:
+        pass
+
+    # check rate limiting, shared by all workers. Each of the two files holds 5 bytes.
+    startTime = time.perf_counter()
+    results = pyrocopy.copy(eventSrc, eventDst + "8", workers=2, cloneMode='never', maxBytesPerSec=20)
+    if (results['filesCopied'] != 2 or time.perf_counter() - startTime < 0.4):
+        raise Exception("Failed to limit the bytes copied per second.")
+
+    startTime = time.perf_counter()
+    results = pyrocopy.sync(eventSrc, eventDst + "9", workers=2, maxFilesPerSec=4)
+    if (results['filesCopied'] != 2 or time.perf_counter() - startTime < 0.4):
+        raise Exception("Failed to limit the files copied per second.")
+
+    limitCalls = []
+    def getLimit():
+        limitCalls.append(1)
+        return None
+    results = pyrocopy.copy(eventSrc, eventDst + "8", forceOverwrite=True, maxFilesPerSec=getLimit)
+    if (results['filesCopied'] != 2 or len(limitCalls) == 0):
+        raise Exception("Failed to read the rate limit from a function.")
+
+    try:
+        pyrocopy.copy(eventSrc, eventDst, maxBytesPerSec=0)
+        raise Exception("Failed to reject an invalid rate limit.")
+    except ValueError:
+        pass
+
+    # check the asyncio front-end
+    async def runAsyncOperations():
+        results = await asyncio.gather(aio.copy(eventSrc, eventDst + "1"), aio.copy(eventSrc, eventDst + "2"))
+        if (any(result['filesCopied'] != 2 for result in results)):
+            raise Exception("Failed to run concurrent asynchronous copies.")
+
+        with open(os.path.join(eventDst, "extra"), 'wb') as f:
+            f.write(b"extra")
+        results = await aio.mirror(eventSrc, eventDst, detailedResults=True)
+        if (results['filesRemoved'] != 1 or results['filesSkipped'] != 2 or len(results['filesRemovedList']) != 1):
+            raise Exception("Failed to run an asynchronous mirror.")
+
+        events = aio.iterSync(eventSrc, eventDst + "3")
+        async for event in events:
+            break
+        await events.aclose()
+
+        # A cancelled operation stops between files
+        task = asyncio.ensure_future(aio.copy(eventSrc, eventDst + "4"))
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+            raise Exception("Failed to cancel an asynchronous copy.")
+        except asyncio.CancelledError:
+            pass
+
+        # Parallel copies share the pool with each other while one of them is cancelled partway through. The limited
+        # copy takes several slices, each of which may run on a different thread of the pool.
+        manySrc = eventDst + "10"
+        pyrocopy.mkdir(manySrc)
+        for i in range(0, 40):
+            with open(os.path.join(manySrc, "file" + str(i)), 'wb') as f:
+                f.write(os.urandom(10000))
+        threadCount = threading.active_count()
+        task = asyncio.ensure_future(aio.copy(manySrc, eventDst + "11", workers=4, maxFilesPerSec=20))
+        results = await aio.copy(manySrc, eventDst + "12", workers=4)
+        while (len(os.listdir(eventDst + "11")) == 0):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+            raise Exception("Failed to cancel a parallel asynchronous copy.")
+        except asyncio.CancelledError:
+            pass
+        results2 = await aio.copy(manySrc, eventDst + "11", workers=4)
+        copied = sorted(os.listdir(eventDst + "11"))
+        if (results['filesCopied'] != 40 or results2['filesCopied'] + results2['filesSkipped'] != 40 or
+                results2['filesSkipped'] == 0 or copied != sorted(os.listdir(manySrc)) or
+                threading.active_count() > threadCount + aio.MAX_THREADS):
+            raise Exception("Failed to run parallel asynchronous copies on the shared pool.")
+        for name in copied:
+            with open(os.path.join(manySrc, name), 'rb') as f1, open(os.path.join(eventDst + "11", name), 'rb') as f2:
+                if (f1.read() != f2.read()):
+                    raise Exception("Failed to copy the contents of a cancelled parallel asynchronous copy.")
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runAsyncOperations())
+    loop.close()
+    for i in range(0, 13):
+        shutil.rmtree(eventDst + str(i), ignore_errors=True)
+
+    shutil.rmtree(eventSrc)
+    shutil.rmtree(eventDst)
+
     # check depth level copy
     src = genRandomTree(tmpdir, 0, 5, MAX_FILE_SIZE)
     lvl1 = genRandomTree(src, 0, 3, MAX_FILE_SIZE)
@@ -361,6 +936,30 @@ try:
             if (dir == "moredir"):
                 raise Exception("Failed to only exclude directory 'moredir'.")
 
+    # check excluded subtrees are skipped as a whole while partial regex matches still descend
+    pruneSrc = os.path.join(tmpdir, "pruneSrc")
+    pruneDst = os.path.join(tmpdir, "pruneDst")
+    os.makedirs(os.path.join(pruneSrc, "keep"))
+    os.makedirs(os.path.join(pruneSrc, "skip", "sub1", "sub2"))
+    genRandomContents(os.path.join(pruneSrc, "keep", "file1"), MAX_FILE_SIZE)
+    genRandomContents(os.path.join(pruneSrc, "skip", "sub1", "sub2", "file2"), MAX_FILE_SIZE)
+    results = pyrocopy.copy(pruneSrc, pruneDst, excludeDirs=['skip'], detailedResults=True)
+    if (results['filesCopied'] != 1 or results['dirsSkippedList'] != ['skip']):
+        raise Exception("Failed to prune excluded directory 'skip'")
+    results = pyrocopy.copy(pruneSrc, pruneDst, excludeDirs=['re:ski'], detailedResults=True)
+    if (results['filesCopied'] != 1 or results['dirsSkippedList'] != ['skip']):
+        raise Exception("Failed to copy subdirectories of directory partially matching 're:ski'")
+
+    # Patterns with inline flags are anchored without moving the flags, for directories and files at any depth
+    shutil.rmtree(pruneDst)
+    results = pyrocopy.copy(pruneSrc, pruneDst, excludeDirs=['re:(?i)SKIP'], excludeFiles=['re:(?i)FILE1'],
+                            detailedResults=True)
+    if (results['filesCopied'] != 0 or results['dirsSkippedList'] != ['skip'] or
+            results['filesSkippedList'] != [os.path.join('keep', 'file1')]):
+        raise Exception("Failed to copy with inline flag patterns 're:(?i)SKIP' and 're:(?i)FILE1'")
+    shutil.rmtree(pruneSrc)
+    shutil.rmtree(pruneDst)
+
     # check move
     shutil.rmtree(dst)
     dst = os.path.join(tmpdir, os.path.basename(src)+"Moved")
@@ -669,6 +1268,17 @@ try:
         if (results['filesFailed'] != 0 or results['dirsFailed'] != 0):
             raise Exception("Failed sync test with two skipped files")
 
+    # check sync with dir excludes in parallel
+    shutil.rmtree(syncPathA)
+    shutil.rmtree(syncPathB)
+    pyrocopy.copy(pathA, syncPathA)
+    pyrocopy.copy(pathB, syncPathB)
+    results = pyrocopy.sync(syncPathA, syncPathB, excludeDirs=['subB1'], workers=4, detailedResults=True)
+    if (results['filesCopied'] != 6 or results['dirsSkippedList'] != ['subB1'] or results['filesFailed'] != 0):
+        raise Exception("Failed sync test with dir excludes: 'subB1'")
+    if (os.path.exists(os.path.join(syncPathA, "subB1")) or not os.path.exists(os.path.join(syncPathB, "fileA1"))):
+        raise Exception("Failed sync test with dir excludes: 'subB1'")
+
 
     # clean up temp
     os.chdir(origdir)    